@@ -0,0 +1,203 @@
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+
+from common.db.bulk import chunk_rows
+from common.db.pool import connect_mysql
+
+# Databases the benchmark creates; the jobs refer to `collaborations` by name
+COLLABS_DB = 'collaborations'
+POSTS_DB = 'bench_posts'
+
+# Rows inserted per multi-row INSERT while generating
+INSERT_SIZE = 5000
+
+# Share of rows set up for each job to find
+NULL_REPORTING_SHARE = 0.2  # posts without reporting times (fix_reporting_dates_null)
+YEAR_0001_SHARE = 0.01  # posts with a reporting_end_time in year 0001 (fix_reporting_dates_0001)
+UNLINKED_SHARE = 0.3  # obligations without a post id but with a submitted url (fix_posts_without_obligations_by_url)
+
+# Posts per campaign
+CAMPAIGN_SIZE = 100
+
+SCHEMA = {
+  COLLABS_DB: [
+    """CREATE TABLE campaigns (
+      id BIGINT PRIMARY KEY, start_date DATETIME NOT NULL, end_date DATETIME NOT NULL
+    )""",
+    """CREATE TABLE obligations (
+      id BIGINT PRIMARY KEY, campaign_id BIGINT NOT NULL, post_id BIGINT NULL,
+      obligation_submission_url VARCHAR(255) NULL, is_deleted TINYINT NOT NULL DEFAULT 0,
+      date_submitted DATETIME NOT NULL, obligation_type_id INT NOT NULL,
+      INDEX (post_id), INDEX (campaign_id)
+    )"""
+  ],
+  POSTS_DB: [
+    """CREATE TABLE posts (
+      id BIGINT PRIMARY KEY, status VARCHAR(32) NOT NULL, channel VARCHAR(32) NOT NULL,
+      created_at DATETIME NOT NULL, reporting_start_time DATETIME NULL, reporting_end_time DATETIME NULL,
+      submitted_url VARCHAR(255) NULL,
+      modified_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+      INDEX (submitted_url), INDEX (modified_at, id)
+    )"""
+  ]
+}
+
+# Hosts the dataset may be (re)generated on without --force: generating drops the `collaborations` database
+LOCAL_HOSTS = ('127.0.0.1', 'localhost', '::1')
+
+# Tables copied aside after generation so every run starts from the same data
+TABLES = {COLLABS_DB: ('campaigns', 'obligations'), POSTS_DB: ('posts',)}
+
+CHANNELS = ('INSTAGRAM', 'YOUTUBE', 'TIKTOK', 'LTK', 'BLOG')
+
+# Create custom logger, handler, and formatter
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.DEBUG)
+
+def config(host='127.0.0.1', port=3306, user='root', password=''):
+  """
+  Config - Returns the job configuration (as read from --config by main.py) pointing both connectors at the
+  benchmark databases on a local server.
+  """
+  return {
+    'COLLABS_SERVICE_MYSQL_HOST': host,
+    'COLLABS_SERVICE_MYSQL_PORT': port,
+    'COLLABS_SERVICE_MYSQL_USER': user,
+    'COLLABS_SERVICE_MYSQL_PASSWORD': password,
+    'COLLABS_DB_NAME': COLLABS_DB,
+    'POST_SERVICE_MYSQL_HOST': host,
+    'POST_SERVICE_MYSQL_PORT': port,
+    'POST_SERVICE_MYSQL_USER': user,
+    'POST_SERVICE_MYSQL_PASSWORD': password,
+    'POST_DB_NAME': POSTS_DB
+  }
+
+def server(cfg):
+  return connect_mysql({'host': cfg['POST_SERVICE_MYSQL_HOST'], 'port': int(cfg['POST_SERVICE_MYSQL_PORT']),
+    'user': cfg['POST_SERVICE_MYSQL_USER'], 'password': cfg['POST_SERVICE_MYSQL_PASSWORD'], 'charset': 'utf8mb4'})
+
+def check_local(cfg, force=False):
+  """
+  Check Local - Refuses to touch a server that is not on this machine, since the benchmark drops, truncates and
+  refills its databases.
+  Arguments:
+    cfg (dict) -- configuration returned by `config`
+    force (Boolean) -- allow any host
+  """
+  host = cfg['POST_SERVICE_MYSQL_HOST']
+  if not force and host not in LOCAL_HOSTS:
+    raise ValueError('refusing to replace the benchmark databases on {}; pass force=True (--force) to allow it'
+      .format(host))
+
+def generate(cfg, scale, seed=0, force=False):
+  """
+  Generate - (Re)creates the benchmark databases with `scale` posts, as many obligations and a campaign per
+  CAMPAIGN_SIZE posts, then copies every table aside for `restore`.
+  Arguments:
+    cfg (dict) -- configuration returned by `config`
+    scale [Integer]: number of posts
+    seed [Integer]: random seed, so the same scale always produces the same data
+    force (Boolean) -- allow a server that is not local, see check_local
+  """
+  check_local(cfg, force)
+  rng = random.Random(seed)
+  start = time.monotonic()
+  cnx = server(cfg)
+  try:
+    with cnx.cursor() as cursor:
+      for database, statements in SCHEMA.items():
+        cursor.execute("DROP DATABASE IF EXISTS `{}`".format(database))
+        cursor.execute("CREATE DATABASE `{}` CHARACTER SET utf8mb4".format(database))
+        cursor.execute("USE `{}`".format(database))
+        for statement in statements:
+          cursor.execute(statement)
+
+      campaigns = max(1, scale // CAMPAIGN_SIZE)
+      insert(cnx, COLLABS_DB, "INSERT INTO campaigns (id, start_date, end_date) VALUES (%s, %s, %s)",
+        campaign_rows(rng, campaigns))
+      insert(cnx, POSTS_DB, """INSERT INTO posts (id, status, channel, created_at, reporting_start_time,
+        reporting_end_time, submitted_url) VALUES (%s, %s, %s, %s, %s, %s, %s)""", post_rows(rng, scale))
+      insert(cnx, COLLABS_DB, """INSERT INTO obligations (id, campaign_id, post_id, obligation_submission_url,
+        is_deleted, date_submitted, obligation_type_id) VALUES (%s, %s, %s, %s, %s, %s, %s)""",
+        obligation_rows(rng, scale, campaigns))
+
+      for database, tables in TABLES.items():
+        for table in tables:
+          cursor.execute("CREATE TABLE `{0}`.`{1}_seed` LIKE `{0}`.`{1}`".format(database, table))
+          cursor.execute("INSERT INTO `{0}`.`{1}_seed` SELECT * FROM `{0}`.`{1}`".format(database, table))
+          cnx.commit()
+  finally:
+    cnx.close()
+  LOGGER.info('generated {} posts in {:.1f}s'.format(scale, time.monotonic() - start))
+
+def restore(cfg, force=False):
+  """
+  Restore - Resets every table to the generated data, undoing the changes of a previous run.
+  """
+  check_local(cfg, force)
+  cnx = server(cfg)
+  try:
+    with cnx.cursor() as cursor:
+      for database, tables in TABLES.items():
+        for table in tables:
+          cursor.execute("TRUNCATE TABLE `{}`.`{}`".format(database, table))
+          cursor.execute("INSERT INTO `{0}`.`{1}` SELECT * FROM `{0}`.`{1}_seed`".format(database, table))
+          cnx.commit()
+  finally:
+    cnx.close()
+
+def scale_of(cfg):
+  """
+  Scale Of - Returns the number of generated posts, or None when the benchmark databases do not exist.
+  """
+  cnx = server(cfg)
+  try:
+    with cnx.cursor() as cursor:
+      cursor.execute("SELECT COUNT(*) AS posts FROM `{}`.`posts_seed`".format(POSTS_DB))
+      return cursor.fetchone()['posts']
+  except Exception:
+    return None
+  finally:
+    cnx.close()
+
+def insert(cnx, database, sql, rows):
+  with cnx.cursor() as cursor:
+    cursor.execute("USE `{}`".format(database))
+    for chunk in chunk_rows(rows, INSERT_SIZE):
+      # pymysql folds an INSERT ... VALUES executemany into multi-row statements
+      cursor.executemany(sql, chunk)
+      cnx.commit()
+
+def campaign_rows(rng, count):
+  base = datetime(2020, 9, 1)
+  for i in range(1, count + 1):
+    start = base + timedelta(days=rng.randrange(120))
+    yield i, start, start + timedelta(days=rng.randrange(14, 60))
+
+def post_rows(rng, count):
+  base = datetime(2020, 9, 1)
+  for i in range(1, count + 1):
+    created = base + timedelta(minutes=rng.randrange(200000))
+    roll = rng.random()
+    if roll < NULL_REPORTING_SHARE:
+      start, end = None, None
+    elif roll < NULL_REPORTING_SHARE + YEAR_0001_SHARE:
+      start, end = created, datetime(1, 1, 1)
+    else:
+      start, end = created, created + timedelta(weeks=6)
+    yield (i, 'DELETED' if rng.random() < 0.02 else 'PUBLISHED', rng.choice(CHANNELS), created, start, end,
+      submitted_url(i))
+
+def obligation_rows(rng, count, campaigns):
+  # obligation i belongs to post i; the unlinked ones only know the post by its submitted url
+  base = datetime(2020, 12, 1)
+  for i in range(1, count + 1):
+    unlinked = rng.random() < UNLINKED_SHARE
+    yield (i, (i - 1) // CAMPAIGN_SIZE % campaigns + 1, None if unlinked else i,
+      submitted_url(i) if unlinked or rng.random() < 0.5 else None, 0,
+      base + timedelta(minutes=rng.randrange(100000)), 9)
+
+def submitted_url(post_id):
+  return 'https://www.instagram.com/p/{:x}/'.format(post_id * 2654435761 % 2 ** 40)
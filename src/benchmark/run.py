@@ -0,0 +1,130 @@
+import argparse
+import contextlib
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import subprocess
+import time
+from datetime import datetime
+
+from benchmark import dataset
+
+# Default number of generated posts
+SCALE = 10000
+
+# Default file the results are appended to, one JSON line per job run
+RESULTS = 'bench_results.jsonl'
+
+# Create custom logger, handler, and formatter
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.DEBUG)
+
+def main():
+  """ main
+  Benchmarks the jobs of main.py end to end against synthetic posts, obligations and campaigns on a local
+  MySQL-compatible server (e.g. `docker run -e MYSQL_ALLOW_EMPTY_PASSWORD=1 -p 3306:3306 mysql:5.7`):
+    PYTHONPATH=./src python -m benchmark.run --scale 100000 fix_reporting_dates_null
+  Each job runs in a fresh process on freshly restored tables; its wall time, peak RSS, queries issued and
+  rows per second are printed and appended to a JSON lines file, so runs can be compared over time.
+  """
+  from main import JOBS
+
+  parser = argparse.ArgumentParser(description = "Command arguments for the job benchmark")
+  parser.add_argument("jobs", nargs = "*", help = "Jobs to run: {}".format(', '.join(JOBS.names())), default = JOBS.names())
+  parser.add_argument("--scale", help = "Number of posts to generate", type = int, default = SCALE)
+  parser.add_argument("--regenerate", help = "Regenerate the data even if it exists at this scale", action = "store_true")
+  parser.add_argument("--runs", help = "Runs per job", type = int, default = 1)
+  parser.add_argument("--host", help = "Local MySQL host", default = "127.0.0.1")
+  parser.add_argument("--port", help = "Local MySQL port", type = int, default = 3306)
+  parser.add_argument("--user", help = "Local MySQL user", default = "root")
+  parser.add_argument("--password", help = "Local MySQL password", default = "")
+  parser.add_argument("--output", help = "File to append the results to", default = RESULTS)
+  parser.add_argument("--force", help = "Allow a MySQL host that is not local; its benchmark databases are dropped", action = "store_true")
+  args = parser.parse_args()
+
+  unknown = [name for name in args.jobs if name not in JOBS.jobs]
+  if unknown:
+    parser.error('unknown jobs: {}'.format(', '.join(unknown)))
+  if args.host not in dataset.LOCAL_HOSTS and not args.force:
+    # the benchmark drops and recreates the `collaborations` database
+    parser.error('the benchmark only runs against a local server unless --force is given')
+
+  cfg = dataset.config(args.host, args.port, args.user, args.password)
+  if args.regenerate or dataset.scale_of(cfg) != args.scale:
+    dataset.generate(cfg, args.scale, force=args.force)
+
+  results = []
+  for name in args.jobs:
+    for _ in range(args.runs):
+      dataset.restore(cfg, force=args.force)
+      result = measure(name, cfg)
+      result.update({'scale': args.scale, 'commit': commit(), 'at': datetime.utcnow().isoformat()})
+      results.append(result)
+      with open(args.output, 'a') as f:
+        f.write(json.dumps(result) + '\n')
+  print(format_results(results))
+
+def measure(name, cfg):
+  """
+  Measure - Runs one job in a fresh process, so its peak RSS and statement counts are its own.
+  Returns:
+    result (dict) -- job, seconds, peak_rss_mb, queries, rows_read, rows_written, rows_per_sec and error
+  """
+  context = multiprocessing.get_context('spawn')
+  with context.Pool(1) as pool:
+    return pool.apply(run_measured, (name, cfg))
+
+def run_measured(name, cfg):
+  from common.utils.instrumentation import get_instrumentation
+  from main import JOBS, run_job
+
+  instrumentation = get_instrumentation()
+  error = None
+  written = 0
+  start = time.monotonic()
+  try:
+    # the jobs print their progress; keep it out of the measurement
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+      written = run_job(name, JOBS.get(name), cfg) or 0
+  except Exception as err:
+    LOGGER.error('job {} failed'.format(name), exc_info=True)
+    error = repr(err)
+  seconds = time.monotonic() - start
+  stats = list(instrumentation.stats.values())
+  rows_read = sum(s.rows for s in stats if s.statement.upper().startswith('SELECT'))
+  return {
+    'job': name,
+    'seconds': seconds,
+    # ru_maxrss is in kilobytes on Linux
+    'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'queries': sum(s.count for s in stats),
+    'rows_read': rows_read,
+    'rows_written': written,
+    'rows_per_sec': rows_read / seconds if seconds > 0 else 0,
+    'error': error
+  }
+
+def format_results(results):
+  """
+  Format Results - Renders benchmark results as a table.
+  """
+  width = max([len('job')] + [len(r['job']) for r in results])
+  lines = ['{:<{w}}  {:>10}  {:>10}  {:>12}  {:>8}  {:>10}  {:>10}  {:>10}'.format(
+    'job', 'scale', 'seconds', 'peak rss mb', 'queries', 'rows read', 'written', 'rows/sec', w=width)]
+  for r in results:
+    lines.append('{:<{w}}  {:>10}  {:>10.2f}  {:>12.1f}  {:>8}  {:>10}  {:>10}  {:>10.1f}{}'.format(
+      r['job'], r['scale'], r['seconds'], r['peak_rss_mb'], r['queries'], r['rows_read'], r['rows_written'],
+      r['rows_per_sec'], '  failed: ' + r['error'] if r['error'] else '', w=width))
+  return '\n'.join(lines)
+
+def commit():
+  try:
+    return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+      universal_newlines=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+  except OSError:
+    return None
+
+if __name__ == "__main__":
+  main()
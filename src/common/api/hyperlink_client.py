@@ -8,11 +8,11 @@ from datetime import datetime
 from pprint import pprint
 
 import requests
-from ruamel.yaml import YAML
 
 from ..utils.ssm_config import load_ssm_config
 from ..utils.typing import OptionalDict
 from ..client import APIClient
+from .links import Link
 
 # Create custom logger, handler, and formatter
 LOGGER = logging.getLogger(__name__)
@@ -30,15 +30,17 @@ AWS_DEFAULT_REGION = os.environ.get('AWS_DEFAULT_REGION', "us-east-1")
 # API Environment Variables
 HYPERLINK_SERVICE_API_HOST = os.environ.get('HYPERLINK_SERVICE_API_HOST', None)
 
-# Prepare reading YAML files into streams
-yaml = YAML()
-
 class HyperlinkClient(APIClient):
-  def __init__(self):
+  def __init__(self, cache=None, **kwargs):
+    """
+    Arguments:
+      cache [ResponseCache]: optional persistent cache of link responses, including links not found
+    """
     # cfg = load_ssm_config()
     # self.base_url = cfg.get('HYPERLINK_SERVICE_API_HOST')
     self.base_url = HYPERLINK_SERVICE_API_HOST
-    super().__init__()
+    self.cache = cache
+    super().__init__(**kwargs)
 
   def get_link(self, link):
       """
@@ -62,19 +64,30 @@ class HyperlinkClient(APIClient):
       Arguments:
         link (string) -- The rstyle link following this format: https://rstyle.me/:id
       Returns: 
-        advertiser_id (string) -- The advertiser ID for the rstyle metric.
+        link [Link]: the link's data, decoded once from the JSON response
       """
+      encoded_link = urllib.parse.quote(link)
+      if self.cache is not None:
+        hit, body = self.cache.get(encoded_link)
+        if hit and body is None:
+          raise requests.HTTPError('404 Client Error: Not Found (cached) for link: %s' % link)
+        if hit:
+          return Link.from_json(json.loads(body))
+
       try:
-        encoded_link = urllib.parse.quote(link)
         url = '%s/api/links/%s'  % (self.base_url, encoded_link)
         response = self.get(url)
         data = response.json()
         LOGGER.debug(data)
-        return data
+        if self.cache is not None:
+          self.cache.put(encoded_link, response.text)
+        return Link.from_json(data)
       
       except (requests.ConnectionError, requests.Timeout) as e:
         raise e
 
       except requests.HTTPError as e:
+        if self.cache is not None and e.response.status_code == 404:
+          self.cache.put(encoded_link, None)
         LOGGER.exception(e.response.content)
         raise e
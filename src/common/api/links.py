@@ -0,0 +1,66 @@
+class Product():
+  """
+  Product - The product an rstyle link points to, as returned in the `item` field of a Hyperlink link.
+  """
+  __slots__ = ('id', 'product_id_v2', 'name', 'price', 'sku', 'product_type')
+
+  def __init__(self, id=None, product_id_v2=None, name=None, price=None, sku=None, product_type=None):
+    self.id = id
+    self.product_id_v2 = product_id_v2
+    self.name = name
+    self.price = price
+    self.sku = sku
+    self.product_type = product_type
+
+  @classmethod
+  def from_json(cls, data):
+    data = data or {}
+    return cls(data.get('id'), data.get('product_id_v2'), data.get('name'), data.get('price'), data.get('sku'),
+      data.get('product_type'))
+
+class Publisher():
+  """
+  Publisher - The publisher an rstyle link belongs to, as returned in the `publisher` field of a Hyperlink link.
+  """
+  __slots__ = ('id',)
+
+  def __init__(self, id=None):
+    self.id = id
+
+  @classmethod
+  def from_json(cls, data):
+    data = data or {}
+    return cls(data.get('Id'))
+
+class Link():
+  """
+  Link - An rstyle link as returned by the Hyperlink API, decoded once from the JSON response into
+  slotted records holding only the fields persisted to the Cassandra `links` table.
+  Example:
+    link = Link.from_json(response.json())
+    link.url, link.product.name, link.publisher.id
+  """
+  __slots__ = ('id', 'url', 'redirect_url', 'version', 'product', 'publisher')
+
+  def __init__(self, id=None, url=None, redirect_url=None, version=None, product=None, publisher=None):
+    self.id = id
+    self.url = url
+    self.redirect_url = redirect_url
+    self.version = version
+    self.product = product or Product()
+    self.publisher = publisher or Publisher()
+
+  @classmethod
+  def from_json(cls, data):
+    """
+    From JSON - Builds a Link from a decoded Hyperlink link payload.
+    Arguments:
+      data (dict) -- decoded JSON body of GET /api/links/:link
+    Returns:
+      link [Link]
+    """
+    return cls(data.get('id'), data.get('url'), data.get('redirect_url'), data.get('version'),
+      Product.from_json(data.get('item')), Publisher.from_json(data.get('publisher')))
+
+  def __repr__(self):
+    return 'Link(id={!r}, url={!r})'.format(self.id, self.url)
@@ -8,7 +8,6 @@ from datetime import datetime
 from pprint import pprint
 
 import requests
-from ruamel.yaml import YAML
 
 from ..utils.ssm_config import load_ssm_config
 from ..utils.typing import OptionalDict
@@ -31,9 +30,9 @@ AWS_DEFAULT_REGION = os.environ.get('AWS_DEFAULT_REGION', "us-east-1")
 POST_SERVICE_API_HOST = os.environ.get('POST_SERVICE_API_HOST', None)
 
 class PostClient(APIClient):
-  def __init__(self):
+  def __init__(self, **kwargs):
     self.base_url = POST_SERVICE_API_HOST
-    super().__init__()
+    super().__init__(**kwargs)
 
   def get_links_for_post_id(self, post_id):
     try:
@@ -0,0 +1,137 @@
+import logging
+import sqlite3
+import threading
+import time
+
+# Cache defaults
+TTL = 7 * 24 * 60 * 60  # seconds a cached response is served
+NEGATIVE_TTL = 24 * 60 * 60  # seconds a cached "not found" is served
+MAX_ENTRIES = 100000
+EVICT_SLACK = 0.1  # share of max_entries freed by one eviction, so a full cache does not evict on every put
+
+# Access-time write-back; hits only buffer their access time until one of these is reached
+FLUSH_ACCESSES = 500  # buffered access times written back in one transaction
+FLUSH_INTERVAL = 5.0  # seconds a buffered access time may wait before it is written back
+
+# Create custom logger, handler, and formatter
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.DEBUG)
+
+class ResponseCache():
+  """
+  Response Cache - A persistent, thread-safe SQLite cache of API response bodies keyed by string.
+  Entries expire after `ttl` seconds, "not found" entries (negative caching) after `negative_ttl`,
+  and once more than `max_entries` are stored the least recently used ones are evicted.
+  Hits do not write: their access times are buffered and written back in one transaction every
+  FLUSH_ACCESSES hits or FLUSH_INTERVAL seconds, and on close. The entry count is kept in memory, so
+  puts do not count the table. The database runs in WAL mode with synchronous=NORMAL, which keeps
+  commits off fsync; a crash can lose the last commits but not corrupt the cache.
+  Example:
+    cache = ResponseCache('hyperlink_cache.db')
+    hit, body = cache.get(key)
+    if not hit:
+      cache.put(key, fetch(key))
+  """
+  def __init__(self, path, ttl=TTL, negative_ttl=NEGATIVE_TTL, max_entries=MAX_ENTRIES):
+    """
+    Arguments:
+      path (string) -- SQLite database file; created if missing
+      ttl [Integer]: seconds a cached response is served
+      negative_ttl [Integer]: seconds a cached "not found" is served
+      max_entries [Integer]: maximum number of cached keys
+    """
+    self.path = path
+    self.ttl = ttl
+    self.negative_ttl = negative_ttl
+    self.max_entries = max_entries
+    self.hits = 0
+    self.misses = 0
+    self._lock = threading.Lock()
+    self._accessed = {}
+    self._flushed_at = time.monotonic()
+    self._db = sqlite3.connect(path, check_same_thread=False)
+    self._db.execute("PRAGMA journal_mode=WAL")
+    self._db.execute("PRAGMA synchronous=NORMAL")
+    with self._db:
+      self._db.execute("""
+        CREATE TABLE IF NOT EXISTS responses (
+          key TEXT PRIMARY KEY, body TEXT, expires_at REAL NOT NULL, accessed_at REAL NOT NULL
+        )""")
+      self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+    self._count = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+  def get(self, key):
+    """
+    Get - Looks up a key.
+    Returns:
+      hit (Boolean) -- whether an unexpired entry was found
+      body (string) -- the cached body, or None for a cached "not found"
+    """
+    now = time.time()
+    with self._lock:
+      row = self._db.execute("SELECT body, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+      if row is None or row[1] <= now:
+        self.misses += 1
+        return False, None
+      self._accessed[key] = now
+      if len(self._accessed) >= FLUSH_ACCESSES or time.monotonic() - self._flushed_at >= FLUSH_INTERVAL:
+        self._flush()
+      self.hits += 1
+      return True, row[0]
+
+  def put(self, key, body):
+    """
+    Put - Stores a response body for a key, or a "not found" entry when `body` is None.
+    """
+    now = time.time()
+    ttl = self.negative_ttl if body is None else self.ttl
+    with self._lock, self._db:
+      self._accessed.pop(key, None)
+      updated = self._db.execute("UPDATE responses SET body = ?, expires_at = ?, accessed_at = ? WHERE key = ?",
+        (body, now + ttl, now, key)).rowcount
+      if not updated:
+        self._db.execute("INSERT INTO responses (key, body, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+          (key, body, now + ttl, now))
+        self._count += 1
+      if self._count > self.max_entries:
+        self._evict()
+
+  def stats(self):
+    """
+    Stats - Returns the hit and miss counters since the cache was opened.
+    """
+    return {'hits': self.hits, 'misses': self.misses}
+
+  def flush(self):
+    """
+    Flush - Writes the buffered access times of hits back to the database.
+    """
+    with self._lock:
+      self._flush()
+
+  def close(self):
+    with self._lock:
+      self._flush()
+      self._db.close()
+
+  def _flush(self):
+    with self._db:
+      self._write_accessed()
+
+  def _write_accessed(self):
+    self._flushed_at = time.monotonic()
+    if self._accessed:
+      self._db.executemany("UPDATE responses SET accessed_at = ? WHERE key = ?",
+        [(accessed_at, key) for key, accessed_at in self._accessed.items()])
+      self._accessed = {}
+
+  def _evict(self):
+    # buffered access times first, so recently hit entries are not taken for the least recently used
+    self._write_accessed()
+    # expired entries go first, then the least recently used
+    self._count -= self._db.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),)).rowcount
+    keep = self.max_entries - int(self.max_entries * EVICT_SLACK)
+    if self._count > keep:
+      self._count -= self._db.execute("""
+        DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed_at LIMIT ?)
+      """, (self._count - keep,)).rowcount
@@ -5,42 +5,96 @@ import requests
 
 from typing import Any, Optional, Type
 from http.client import HTTPConnection
+from requests.adapters import HTTPAdapter
+from tenacity import Retrying, before_sleep_log, retry_if_exception, stop_after_attempt, wait_random_exponential
 from ..utils.typing import OptionalDict
 
 # Create custom logger, handler, and formatter
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.DEBUG)
 
+# Transport defaults
+POOL_CONNECTIONS = 10  # number of hosts with a cached connection pool
+POOL_MAXSIZE = 10  # connections kept open per host
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 30
+RETRIES = 3  # retries after the first attempt, for idempotent verbs only
+RETRY_BACKOFF = 0.5
+RETRY_BACKOFF_MAX = 10
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
 # Hooks
 def check_for_errors(resp, *args, **kwargs):
   resp.raise_for_status()
 
+def is_retryable(error):
+  """Whether a failed request is worth retrying: connection errors, timeouts and throttled or 5xx responses."""
+  if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+    return True
+  if isinstance(error, requests.HTTPError) and error.response is not None:
+    return error.response.status_code in RETRY_STATUSES
+  return False
+
 class APIClient():
-  def __init__(self):
+  def __init__(self, pool_connections: int = POOL_CONNECTIONS, pool_maxsize: int = POOL_MAXSIZE,
+      connect_timeout: float = CONNECT_TIMEOUT, read_timeout: float = READ_TIMEOUT,
+      retries: int = RETRIES, backoff: float = RETRY_BACKOFF, backoff_max: float = RETRY_BACKOFF_MAX):
+    """
+    Arguments:
+      pool_connections -- number of hosts to keep a keep-alive connection pool for
+      pool_maxsize -- connections kept per host; callers beyond this wait for a free connection
+        instead of opening throwaway ones, so size it to the caller's concurrency
+      connect_timeout -- seconds to wait for a connection, unless a request passes its own timeout
+      read_timeout -- seconds to wait for response data, unless a request passes its own timeout
+      retries -- retries of GET, PUT and DELETE after connection errors, timeouts and 429/5xx responses
+      backoff -- multiplier for the jittered exponential wait between retries, in seconds
+      backoff_max -- maximum wait between retries, in seconds
+    """
     self.session = requests.Session()
     self.session.hooks['response'] = [check_for_errors]
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=True)
+    self.session.mount('http://', adapter)
+    self.session.mount('https://', adapter)
+    self.timeout = (connect_timeout, read_timeout)
+    self.retries = retries
+    self.backoff = backoff
+    self.backoff_max = backoff_max
 
   def post(self, endpoint: str, data: dict, params: OptionalDict = None, **kwargs):
     """Send data and return response data from POST endpoint."""
     LOGGER.info("POST %s with %s", endpoint, data)
-    return self.session.post(endpoint, data=data, params=params, **kwargs)
+    return self._send(self.session.post, endpoint, False, data=data, params=params, **kwargs)
 
   def get(self, endpoint: str, params: OptionalDict = None, **kwargs):
     """Return response data from GET endpoint."""
     LOGGER.info("GET %s", endpoint)
-    return self.session.get(endpoint, params=params, **kwargs)
+    return self._send(self.session.get, endpoint, True, params=params, **kwargs)
 
   def put(self, endpoint: str, data: dict, params: OptionalDict = None, **kwargs):
     """Send data to overwrite resource and return response data from PUT endpoint."""
     LOGGER.info("PUT %s with %s", endpoint, data)
-    return self.session.put(endpoint, data=data, params=params, **kwargs)
+    return self._send(self.session.put, endpoint, True, data=data, params=params, **kwargs)
 
   def patch(self, endpoint: str, data: dict, params: OptionalDict = None, **kwargs):
     """Send data to update resource and return response data from PATCH endpoint."""
     LOGGER.info("PATCH %s with %s", endpoint, data)
-    return self.session.patch(endpoint, data=data, params=params, **kwargs)
+    return self._send(self.session.patch, endpoint, False, data=data, params=params, **kwargs)
 
   def delete(self, endpoint: str, params: OptionalDict = None, **kwargs):
     """Remove resource with DELETE endpoint."""
     LOGGER.info("DELETE %s", endpoint)
-    return self.session.delete(endpoint, params=params, **kwargs)
+    return self._send(self.session.delete, endpoint, True, params=params, **kwargs)
+
+  def _send(self, method, endpoint: str, idempotent: bool, **kwargs):
+    """Send a request with the client's default timeouts, retrying it when the verb is idempotent."""
+    kwargs.setdefault('timeout', self.timeout)
+    if not idempotent or self.retries <= 0:
+      return method(endpoint, **kwargs)
+    retrying = Retrying(
+      stop=stop_after_attempt(self.retries + 1),
+      wait=wait_random_exponential(multiplier=self.backoff, max=self.backoff_max),
+      retry=retry_if_exception(is_retryable),
+      before_sleep=before_sleep_log(LOGGER, logging.WARNING),
+      reraise=True
+    )
+    return retrying.call(method, endpoint, **kwargs)
@@ -0,0 +1,153 @@
+import time
+
+from . import rows as r
+from .query import quote_name
+
+# Default number of rows applied per UPDATE statement
+BULK_SIZE = 1000
+
+# Ways of shipping the new values to the server
+METHODS = ('join', 'temp')
+
+# Type and collation of a column of the current database, copied into temporary table definitions
+COLUMN_TYPE = """
+  SELECT COLUMN_TYPE, COLLATION_NAME FROM information_schema.COLUMNS
+  WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+""".replace('\n','')
+
+def chunk_rows(rows, size=BULK_SIZE):
+  """
+  Chunk Rows - Splits an iterable of rows into lists of at most `size` rows.
+  """
+  chunk = []
+  for row in rows:
+    chunk.append(tuple(row))
+    if len(chunk) >= size:
+      yield chunk
+      chunk = []
+  if chunk:
+    yield chunk
+
+def throttled_chunks(rows, size=BULK_SIZE, throttle=None):
+  """
+  Throttled Chunks - Chunks rows with the throttle's adaptive sizes when one is given, otherwise `size` at a time.
+  """
+  return throttle.chunks(rows) if throttle is not None else chunk_rows(rows, size)
+
+def observe(throttle, start, chunk):
+  # reports the latency of a committed chunk, started at time.monotonic() `start`, to the throttle
+  if throttle is not None:
+    throttle.observe(time.monotonic() - start, len(chunk))
+
+def update_join_sql(table, key, columns, count):
+  """
+  Update Join SQL - Builds a single UPDATE that joins `table` to an inline derived table of `count`
+  (key, values...) rows, e.g.
+    UPDATE `posts` AS t JOIN (SELECT %s AS `id`, %s AS `a` UNION ALL SELECT %s, %s) AS v
+    ON t.`id` = v.`id` SET t.`a` = v.`a`
+  """
+  names = (key,) + tuple(columns)
+  first = 'SELECT ' + ', '.join('%s AS {}'.format(quote_name(n)) for n in names)
+  rest = ' UNION ALL SELECT ' + ', '.join(['%s'] * len(names))
+  assignments = ', '.join('t.{0} = v.{0}'.format(quote_name(c)) for c in columns)
+  return "UPDATE {} AS t JOIN ({}{}) AS v ON t.{} = v.{} SET {}".format(
+    quote_name(table), first, rest * (count - 1), quote_name(key), quote_name(key), assignments)
+
+def bulk_update(cnx, table, key, columns, rows, size=BULK_SIZE, method='join', throttle=None):
+  """
+  Bulk Update - Applies (key, values...) rows to `table` with one joined UPDATE per chunk of `size` rows
+  instead of one UPDATE ... WHERE key = %s round trip per row. Each chunk is committed on its own.
+  Arguments:
+    cnx [pymysql.Connection]: open connection to run the updates on
+    table (string) -- table to update, e.g. 'posts'
+    key (string) -- column identifying the rows to update, e.g. 'id'
+    columns (tuple) -- columns to set, in the order their values appear in each row after the key
+    rows (iterable) -- tuples of (key, value for each column)
+    size [Integer]: maximum number of rows per UPDATE
+    method (string) -- 'join' sends the values as an inline derived table; 'temp' loads them into a
+      session temporary table with a primary key on `key` and joins against it, which suits very large
+      chunks but needs CREATE TEMPORARY TABLES. The temporary table is declared with explicit column
+      definitions and created and dropped in autocommit mode, as enforce_gtid_consistency requires
+    throttle [AdaptiveBatcher]: optional controller sizing the chunks (instead of `size`) and pausing between
+      them from their latency and replica lag
+  Returns:
+    affected [Integer]: number of rows changed
+  """
+  if method not in METHODS:
+    raise ValueError('method must be one of {}'.format(METHODS))
+  columns = tuple(columns)
+  if method == 'temp':
+    return _bulk_update_temp(cnx, table, key, columns, rows, size, throttle)
+
+  affected = 0
+  for chunk in throttled_chunks(rows, size, throttle):
+    start = time.monotonic()
+    with cnx.cursor() as cursor:
+      affected += cursor.execute(update_join_sql(table, key, columns, len(chunk)), [v for row in chunk for v in row])
+    cnx.commit()
+    observe(throttle, start, chunk)
+  return affected
+
+def _bulk_update_temp(cnx, table, key, columns, rows, size, throttle=None):
+  names = (key,) + columns
+  name = table.split('.')[-1]
+  temp = quote_name('bulk_' + name)
+  column_list = ', '.join(quote_name(n) for n in names)
+  assignments = ', '.join('t.{0} = v.{0}'.format(quote_name(c)) for c in columns)
+  # copy the column types of the target table so values are compared and assigned without casts
+  definitions = column_definitions(cnx, tuple((n, name, n) for n in names))
+  definitions.append('PRIMARY KEY ({})'.format(quote_name(key)))
+
+  affected = 0
+  with cnx.cursor() as cursor:
+    _temporary_ddl(cnx, cursor, "DROP TEMPORARY TABLE IF EXISTS {}".format(temp),
+      "CREATE TEMPORARY TABLE {} ({})".format(temp, ', '.join(definitions)))
+    try:
+      for chunk in throttled_chunks(rows, size, throttle):
+        start = time.monotonic()
+        cursor.execute("DELETE FROM {}".format(temp))
+        # pymysql folds an INSERT ... VALUES executemany into multi-row statements
+        cursor.executemany("INSERT INTO {} ({}) VALUES ({})".format(temp, column_list, ', '.join(['%s'] * len(names))), chunk)
+        affected += cursor.execute("UPDATE {} AS t JOIN {} AS v ON t.{} = v.{} SET {}".format(
+          quote_name(table), temp, quote_name(key), quote_name(key), assignments))
+        cnx.commit()
+        observe(throttle, start, chunk)
+    finally:
+      # a chunk left open by an error is rolled back, since turning autocommit on would commit it
+      cnx.rollback()
+      _temporary_ddl(cnx, cursor, "DROP TEMPORARY TABLE IF EXISTS {}".format(temp))
+  return affected
+
+def _temporary_ddl(cnx, cursor, *statements):
+  # with enforce_gtid_consistency MySQL rejects creating or dropping a temporary table inside a transaction
+  autocommit = cnx.get_autocommit()
+  cnx.autocommit(True)
+  try:
+    for statement in statements:
+      cursor.execute(statement)
+  finally:
+    cnx.autocommit(autocommit)
+
+def column_definitions(cnx, columns):
+  """
+  Column Definitions - Builds DDL for columns copying the type and collation of existing columns of the
+  connection's current database.
+  Arguments:
+    cnx [pymysql.Connection]: connection to read information_schema with
+    columns (tuple) -- (name, table, column) for each column to define
+  Returns:
+    list of column definitions, e.g. ['`url` varchar(2048) COLLATE utf8mb4_unicode_ci']
+  """
+  definitions = []
+  with cnx.cursor(r.cursor_class('tuple')) as cursor:
+    for name, table, column in columns:
+      cursor.execute(COLUMN_TYPE, (table, column))
+      found = cursor.fetchone()
+      if found is None:
+        raise ValueError('no column {}.{} to copy the type of'.format(table, column))
+      column_type, collation = found
+      definition = '{} {}'.format(quote_name(name), column_type)
+      if collation:
+        definition += ' COLLATE {}'.format(collation)
+      definitions.append(definition)
+  return definitions
@@ -3,13 +3,16 @@ import logging
 import os
 import re
 import sys
+import time
 import traceback
 import uuid
 from datetime import datetime, timedelta
-from ..utils.ssm_parameter_store import SSMParameterStore
-
-import boto3
-import pymysql
+from ..utils.instrumentation import InstrumentedConnection, get_instrumentation
+from ..utils.ssm_cache import load_params, register_params
+from . import bulk
+from .pool import ConnectionPool, connect_mysql
+from . import query as q
+from . import rows
 
 # Environment vars
 COLLABS_DB_NAME = os.environ.get('COLLABS_DB_NAME', None)
@@ -26,31 +29,62 @@ DB_CONFIG = {
   'user': COLLABS_SERVICE_MYSQL_USER,
   'password': COLLABS_SERVICE_MYSQL_PASSWORD,
   'db': COLLABS_DB_NAME,
-  'charset': 'utf8mb4',
-  'cursorclass': pymysql.cursors.DictCursor
+  'charset': 'utf8mb4'
 }
 
 # Create custom logger, handler, and formatter
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.DEBUG)
 
+# SSM parameters holding the database configuration
+SSM_PARAMS = register_params([
+  '/rds/collaboration-service/db',
+  '/rds/collaboration-service/host',
+  '/rds/collaboration-service/port',
+  '/rds/collaboration-service/rw-user',
+  '/rds/collaboration-service/rw-password'
+])
+
 class CollabsConnector():
-  def __init__(self, cfg=None):
+  def __init__(self, cfg=None, min_size=1, max_size=4, row_mode='dict', instrumentation=None, throttle=None):
     # cfg = load_ssm_config()
-    self.connect_collabs_db(cfg)
+    # records every statement run on the pooled connections (see common.utils.instrumentation)
+    self.instrumentation = instrumentation or get_instrumentation()
+    # optional AdaptiveBatcher sizing and pacing the writes of executemany and bulk_update
+    self.throttle = throttle
+    # default row representation returned by execute and stream (see common.db.rows)
+    self.row_mode = row_mode
+    self.connect_collabs_db(cfg, min_size=min_size, max_size=max_size)
     super().__init__()
 
-  def execute(self, query, data=None):
+  def connection(self):
+    """
+    Checks a connection to the collaborations database out of the connector's pool for the duration of a `with` block.
+    Workers sharing the connector must each check out their own connection.
+    Returns:
+      context manager yielding a pymysql.Connection
+    """
+    return self.pool.connection()
+
+  def close(self):
+    """
+    Closes the connector's pooled connections to the collaborations database.
+    """
+    self.pool.close()
+
+  def execute(self, query, data=None, row_mode=None):
     """
     Executes a given query against the collaborations database.
     Arguments:
       query (string) -- SQL template string to execute
       data ()
+      row_mode (string) -- 'dict', 'tuple' or 'record'; defaults to the connector's row mode
     Returns:
-      result (list of tuples)
+      result (list of rows)
     """
+    mode = row_mode or self.row_mode
     try:
-      with self.cnx.cursor() as cursor:
+      with self.connection() as cnx, cnx.cursor(rows.cursor_class(mode)) as cursor:
         if data is not None:
           cursor.execute(query, data)
         else:
@@ -58,34 +92,95 @@ class CollabsConnector():
         result = cursor.fetchall()
         if result is None:
           raise Exception('not found')
-        return result
+        return rows.convert(cursor, result, mode)
     except Exception as err:
       LOGGER.error('running query {}'.format(query), exc_info=True)
       raise err
 
-  def executemany(self, query, data=None):
+  def stream(self, query, data=None, size=q.PAGE_SIZE, key=None, after=None, row_mode=None):
     """
-    Executes a given query for a list of values against the posts database.
-    https://dev.mysql.com/doc/connector-python/en/connector-python-api-mysqlcursor-executemany.html
+    Streams the rows of a given query against the collaborations database in bounded pages, instead of
+    loading the whole result set into memory like `execute`.
     Arguments:
       query (string) -- SQL template string to execute
       data ()
+      size [Integer]: maximum number of rows fetched per round trip
+      key (string|tuple) -- optional unique column (e.g. 'id') or columns for keyset pagination, which checks a
+        connection out per page; when omitted an unbuffered cursor is used and the connection is busy until the
+        stream is consumed
+      after -- optional `key` value to start after, e.g. when resuming from a checkpoint
+      row_mode (string) -- 'dict', 'tuple' or 'record'; defaults to the connector's row mode
     Returns:
-      result (list of tuples)
+      result (generator of rows)
     """
-    cursor = self.cnx.cursor()
+    mode = row_mode or self.row_mode
     try:
-      if data is not None:
-        cursor.executemany(query, data)
-        self.cnx.commit()
-      else:
-        cursor.executemany(query)
-        self.cnx.commit()
+      # with a key every page checks out its own connection, so none is held between pages
+      for row in q.stream(self.connection, query, data, size=size, key=key, after=after, row_mode=mode):
+        yield row
     except Exception as err:
-      self.cnx.rollback()
       LOGGER.error('running query {}'.format(query), exc_info=True)
       raise err
 
+  def executemany(self, query, data=None, throttle=None):
+    """
+    Executes a given query for a list of values against the posts database.
+    https://dev.mysql.com/doc/connector-python/en/connector-python-api-mysqlcursor-executemany.html
+    Without a throttle every value is written in one transaction; with one, values are written and committed in
+    chunks the throttle sizes and paces.
+    Arguments:
+      query (string) -- SQL template string to execute
+      data ()
+      throttle [AdaptiveBatcher]: optional write controller, defaults to the connector's
+    Returns:
+      result (list of tuples)
+    """
+    throttle = throttle or self.throttle
+    with self.connection() as cnx:
+      cursor = cnx.cursor()
+      try:
+        if data is not None and throttle is not None:
+          for chunk in throttle.chunks(data):
+            start = time.monotonic()
+            cursor.executemany(query, chunk)
+            cnx.commit()
+            bulk.observe(throttle, start, chunk)
+        elif data is not None:
+          cursor.executemany(query, data)
+          cnx.commit()
+        else:
+          cursor.executemany(query)
+          cnx.commit()
+      except Exception as err:
+        cnx.rollback()
+        LOGGER.error('running query {}'.format(query), exc_info=True)
+        raise err
+
+  def bulk_update(self, table, key, columns, rows, size=bulk.BULK_SIZE, method='join', throttle=None):
+    """
+    Applies (key, values...) rows to a table in the collaborations database with one joined UPDATE per chunk,
+    instead of the one UPDATE round trip per row that `executemany` issues. Each chunk is committed on its own.
+    Example: bulk_update('obligations', 'id', ('post_id',), [(obligation_id, post_id), ...])
+    Arguments:
+      table (string) -- table to update
+      key (string) -- column identifying the rows to update
+      columns (tuple) -- columns to set, in the order their values follow the key in each row
+      rows (iterable) -- tuples of (key, value for each column)
+      size [Integer]: maximum number of rows per UPDATE
+      method (string) -- 'join' (inline derived table) or 'temp' (session temporary table)
+      throttle [AdaptiveBatcher]: optional controller sizing and pacing the chunks, defaults to the connector's
+    Returns:
+      affected [Integer]: number of rows changed
+    """
+    with self.connection() as cnx:
+      try:
+        return bulk.bulk_update(cnx, table, key, columns, rows, size=size, method=method,
+          throttle=throttle or self.throttle)
+      except Exception as err:
+        cnx.rollback()
+        LOGGER.error('bulk updating {}'.format(table), exc_info=True)
+        raise err
+
   def update_campaign_reporting_dates(self, campaign_ids, data):
     """
     Given an array of campaign IDs, update the campaign reporting start date to match the campaign start date
@@ -97,7 +192,7 @@ class CollabsConnector():
       result (list of tuples)
     """
     try:
-      with self.cnx.cursor() as cursor:
+      with self.connection() as cnx, cnx.cursor() as cursor:
         sql = "UPDATE reporting_start_time, reporting_end_time where campaign_id in %s VALUES (%s, %s);;"
         cursor.execute(sql, campaign_ids)
         result = cursor.fetchall()
@@ -115,7 +210,7 @@ class CollabsConnector():
       brand_id [string] -- Returns a list of the associated advertiser IDs for the given brand ID.
     """
     try:
-      with self.cnx.cursor() as cursor:
+      with self.connection() as cnx, cnx.cursor() as cursor:
         sql = "SELECT advertiser_ids FROM brand_advertisers WHERE brand_id=%s;"
         cursor.execute(sql.format(brand_id))
         result = cursor.fetchone()
@@ -133,7 +228,7 @@ class CollabsConnector():
       brand_id (string) -- Returns the brand ID for the provided collaboration ID.
     """
     try:
-      with self.cnx.cursor() as cursor:
+      with self.connection() as cnx, cnx.cursor() as cursor:
         sql = "SELECT brand_id FROM collaborations where id=%s;"
         cursor.execute(sql, collab_id)
         result = cursor.fetchone()
@@ -151,7 +246,7 @@ class CollabsConnector():
       brand_id (string) -- Returns the brand ID for the provided advertiser ID.
     """
     try:
-      with self.cnx.cursor() as cursor:
+      with self.connection() as cnx, cnx.cursor() as cursor:
         sql = "SELECT `brand_id` FROM `collaborations`.`brand_advertisers` WHERE `advertiser_ids` LIKE '%{}%';"
         cursor.execute(sql.format(advertiser_id))
         result = cursor.fetchone()
@@ -169,7 +264,7 @@ class CollabsConnector():
       collaboration_id (string) -- Returns the collab ID for the provided obligation ID.
     """
     try:
-      with self.cnx.cursor() as cursor:
+      with self.connection() as cnx, cnx.cursor() as cursor:
         sql = "SELECT collaboration_id as id FROM obligations WHERE id = %s;"
         cursor.execute(sql, obligation_id)
         result = cursor.fetchone()
@@ -188,7 +283,7 @@ class CollabsConnector():
     Returns [Integer]: The ID uniquely identifying the Obligation
     """
     try:
-      with self.cnx.cursor() as cursor:
+      with self.connection() as cnx, cnx.cursor() as cursor:
         sql = "SELECT id FROM obligations WHERE post_id=%s;"
         cursor.execute(sql, post_id)
         result = cursor.fetchone()
@@ -208,43 +303,40 @@ class CollabsConnector():
       obligation_id [Integer]: ID uniquely identifying the Obligation
     """
     try:
-      with self.cnx.cursor() as cursor:
+      with self.connection() as cnx, cnx.cursor() as cursor:
         sql = "INSERT INTO obligation_rstyle_links (obligation_id, rstyle_links) VALUES (%s, %s);"
         cursor.execute(sql, (obligation_id, rstyle_links))
-        cursor.commit()
+        cnx.commit()
     except Exception as err:
       LOGGER.error('error in persisting rstyle links for obligation id {}'.format(obligation_id), exc_info=True)
       raise err
 
-  def connect_collabs_db(self, cfg):
+  def connect_collabs_db(self, cfg, min_size=1, max_size=4):
     """
-    Connect Collabs DB - Attempts to esablish a connection with the Collaborations Database.
+    Connect Collabs DB - Sets up a pool of connections with the Collaborations Database, opened on first use.
     Arguments:
       cfg (dict): optional DB configuration
+      min_size [Integer]: connections kept open when idle, once opened
+      max_size [Integer]: upper bound on connections open at once
     Raises:
       Exception: Failure to connect
     Returns:
-      self {[pymsql.Connection]} -- A pymsql.Connection pool
+      self {[ConnectionPool]} -- A pool of pymsql.Connection
     """
     if cfg is not None:
-      try:
-        cnx = cnx_from_config(cfg)
-        LOGGER.debug("db connection details: {}".format(cnx))
-        self.cnx = pymysql.connect(**cnx)
-        return self.cnx
-      except Exception as err:
-        LOGGER.error('failed to connect to collaborations database: {}'.format(err))
-        raise err
+      cnx = cnx_from_config(cfg)
     elif env_vars_provided():
-      try:
-        LOGGER.debug("db connection details: {}".format(DB_CONFIG))
-        self = pymysql.connect(**DB_CONFIG)
-        return self
-      except Exception as err:
-        LOGGER.error('failed to connect to collaborations database: {}'.format(err))
-        raise err
+      cnx = DB_CONFIG
     else:
       raise Exception("Missing required environment variables")
+    try:
+      LOGGER.debug("db connection details: {}".format(cnx))
+      connect = lambda: InstrumentedConnection(connect_mysql(cnx), self.instrumentation, 'collaborations')
+      self.pool = ConnectionPool(connect, min_size=min_size, max_size=max_size)
+      return self.pool
+    except Exception as err:
+      LOGGER.error('failed to connect to collaborations database: {}'.format(err))
+      raise err
 
 def cnx_from_config(cfg):
   """Connections from Configuration
@@ -258,8 +350,8 @@ def cnx_from_config(cfg):
     'user': cfg['COLLABS_SERVICE_MYSQL_USER'],
     'password': cfg['COLLABS_SERVICE_MYSQL_PASSWORD'],
     'db': cfg['COLLABS_DB_NAME'],
-    'charset': 'utf8mb4',
-    'cursorclass': pymysql.cursors.DictCursor
+    'port': int(cfg.get('COLLABS_SERVICE_MYSQL_PORT') or 3306),
+    'charset': 'utf8mb4'
   }
 
 def env_vars_provided():
@@ -271,15 +363,7 @@ def env_vars_provided():
 
 def load_ssm_config():
   """load_ssm_config
+  Loads the database parameters from SSM through the process-wide cache; the first load also prefetches
+  the parameters of every other connector.
   """
-  param_store = SSMParameterStore(ENV, region_name=AWS_DEFAULT_REGION)
-  params = param_store.fetch_many(
-      required=[
-        '/rds/collaboration-service/db', 
-        '/rds/collaboration-service/host', 
-        '/rds/collaboration-service/port', 
-        '/rds/collaboration-service/rw-user', 
-        '/rds/collaboration-service/rw-password'
-      ]
-  )
-  return params
\ No newline at end of file
+  return load_params(SSM_PARAMS)
\ No newline at end of file
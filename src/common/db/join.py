@@ -0,0 +1,187 @@
+from operator import itemgetter
+
+from . import rows as r
+from .bulk import BULK_SIZE, chunk_rows, column_definitions
+from .query import quote_name
+
+# Duplicate key policies for HashJoin
+DUPLICATES = ('all', 'first', 'error')
+
+class HashJoin():
+  """
+  Hash Join - Joins two row streams (e.g. obligations from CollabsConnector and posts from PostConnector)
+  on extracted keys in O(N + M) by building a hash index on one side and probing it with the other.
+  Iterating yields (left_row, right_row) pairs: matched rows have both set, unmatched left rows are
+  (row, None) and unmatched right rows are (None, row), which are emitted after the probe side is consumed.
+  Example:
+    join = HashJoin(obligations, posts, 'obligation_submission_url', 'submitted_url')
+    for obligation, post in join:
+      ...
+  """
+  def __init__(self, left, right, left_key, right_key, duplicates='first', build=None):
+    """
+    Arguments:
+      left (iterable) -- left row stream
+      right (iterable) -- right row stream
+      left_key (callable|string) -- extracts the join key from a left row, or the column name holding it
+      right_key (callable|string) -- extracts the join key from a right row, or the column name holding it
+      duplicates (string) -- how rows sharing a key on the same side are handled:
+        'all' joins every combination, 'first' keeps only the first row seen per key on each side
+        and drops the rest, 'error' raises ValueError
+      build (string) -- 'left' or 'right' to force the indexed side; by default the smaller side is
+        indexed when both sides have a length, and otherwise the side that has one (or the right side)
+    """
+    if duplicates not in DUPLICATES:
+      raise ValueError('duplicates must be one of {}'.format(DUPLICATES))
+    if build not in (None, 'left', 'right'):
+      raise ValueError("build must be 'left' or 'right'")
+    self.left = left
+    self.right = right
+    self.left_key = key_extractor(left_key)
+    self.right_key = key_extractor(right_key)
+    self.duplicates = duplicates
+    self.build = build or build_side(left, right)
+    self.matched = 0
+    self.left_only = 0
+    self.right_only = 0
+    self.dropped = 0
+
+  def __iter__(self):
+    if self.build == 'left':
+      pairs = self._join(self.left, self.right, self.left_key, self.right_key)
+      for build_row, probe_row in pairs:
+        yield build_row, probe_row
+    else:
+      pairs = self._join(self.right, self.left, self.right_key, self.left_key)
+      for build_row, probe_row in pairs:
+        yield probe_row, build_row
+
+  def _join(self, build, probe, build_key, probe_key):
+    index = self._index(build, build_key)
+    matched = set()
+    seen = set()
+    for row in probe:
+      key = probe_key(row)
+      if self.duplicates != 'all':
+        if key in seen:
+          self._duplicate(key)
+          continue
+        seen.add(key)
+      rows = index.get(key)
+      if rows is None:
+        self._count_unmatched(probe=True)
+        yield None, row
+        continue
+      matched.add(key)
+      for build_row in rows:
+        self.matched += 1
+        yield build_row, row
+    for key, rows in index.items():
+      if key in matched:
+        continue
+      for build_row in rows:
+        self._count_unmatched(probe=False)
+        yield build_row, None
+
+  def _index(self, rows, key_fn):
+    index = {}
+    for row in rows:
+      key = key_fn(row)
+      bucket = index.get(key)
+      if bucket is None:
+        index[key] = [row]
+      elif self.duplicates == 'all':
+        bucket.append(row)
+      else:
+        self._duplicate(key)
+    return index
+
+  def _duplicate(self, key):
+    if self.duplicates == 'error':
+      raise ValueError('duplicate join key {!r}'.format(key))
+    self.dropped += 1
+
+  def _count_unmatched(self, probe):
+    # the probe side is the right side whenever the left side was indexed
+    if probe == (self.build == 'left'):
+      self.right_only += 1
+    else:
+      self.left_only += 1
+
+  def summary(self):
+    """
+    Summary - Returns the match counts of the join so far.
+    """
+    return {
+      'matched': self.matched,
+      'left_only': self.left_only,
+      'right_only': self.right_only,
+      'dropped_duplicates': self.dropped
+    }
+
+def key_extractor(key):
+  """key_extractor
+  Returns:
+      callable -- `key` itself if callable, otherwise a getter for the `key` column.
+  """
+  return key if callable(key) else itemgetter(key)
+
+def build_side(left, right):
+  """build_side
+  Returns:
+      string -- the side to index: the smaller sized side, or the right side when sizes are unknown.
+  """
+  sized_left = hasattr(left, '__len__')
+  sized_right = hasattr(right, '__len__')
+  if sized_left and sized_right:
+    return 'left' if len(left) < len(right) else 'right'
+  if sized_left:
+    return 'left'
+  return 'right'
+
+def temp_join(cnx, temp, columns, rows, query, data=None, index=(), size=BULK_SIZE, row_mode='dict'):
+  """
+  Temp Join - Joins rows held by the client to tables on the server without shipping them inside the
+  statement: the rows are bulk loaded into a session temporary table that `query` joins against, so
+  MySQL can run an index join and return only the joined rows.
+  The temporary table is declared with explicit column definitions rather than CREATE ... SELECT, and
+  created, loaded and dropped in autocommit mode: with enforce_gtid_consistency, MySQL rejects
+  CREATE TABLE ... SELECT (before 8.0.21) and temporary tables created or dropped inside a transaction.
+  Example:
+    temp_join(cnx, 'obligation_urls', (('obligation_id', 'posts', 'id'), ('url', 'posts', 'submitted_url')),
+      [(obligation_id, url), ...], 'SELECT ... FROM `obligation_urls` AS u JOIN posts AS p ON p.submitted_url = u.url',
+      index=('url',))
+  Arguments:
+    cnx [pymysql.Connection]: connection checked out for the whole join (temporary tables are per session)
+    temp (string) -- name of the temporary table
+    columns (tuple) -- (name, table, column) for each column of the temporary table, which copies the type
+      and collation of `table`.`column` so the join compares values of the same type and collation
+    rows (iterable) -- tuples to load, one value per column
+    query (string) -- SQL joining against `temp`
+    data () -- parameters for `query`
+    index (tuple) -- columns of the temporary table to index
+    size [Integer]: maximum number of rows per INSERT
+    row_mode (string) -- 'dict', 'tuple' or 'record' (see common.db.rows)
+  Returns:
+    list of rows returned by `query`
+  """
+  name = quote_name(temp)
+  definitions = column_definitions(cnx, columns)
+  definitions += ['INDEX ({})'.format(quote_name(column)) for column in index]
+  insert = "INSERT INTO {} VALUES ({})".format(name, ', '.join(['%s'] * len(columns)))
+  autocommit = cnx.get_autocommit()
+  cnx.autocommit(True)
+  try:
+    with cnx.cursor(r.cursor_class(row_mode)) as cursor:
+      cursor.execute("DROP TEMPORARY TABLE IF EXISTS {}".format(name))
+      cursor.execute("CREATE TEMPORARY TABLE {} ({})".format(name, ', '.join(definitions)))
+      try:
+        for chunk in chunk_rows(rows, size):
+          # pymysql folds an INSERT ... VALUES executemany into multi-row statements
+          cursor.executemany(insert, chunk)
+        cursor.execute(query, data)
+        return r.convert(cursor, cursor.fetchall(), row_mode)
+      finally:
+        cursor.execute("DROP TEMPORARY TABLE IF EXISTS {}".format(name))
+  finally:
+    cnx.autocommit(autocommit)
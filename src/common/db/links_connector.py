@@ -4,13 +4,11 @@ import os
 import re
 import sys
 import traceback
+import threading
+import time
 import uuid
 from datetime import datetime, timedelta
-from ..utils.ssm_parameter_store import SSMParameterStore
-from ..utils.typing import Map
-
-from cassandra.cluster import Cluster
-from cassandra.auth import PlainTextAuthProvider
+from ..utils.instrumentation import get_instrumentation
 
 # Environment vars
 HYPERLINK_CASSANDRA_DB = os.environ.get('HYPERLINK_CASSANDRA_DB', None)
@@ -34,39 +32,110 @@ DB_CONFIG = {
   'port': HYPERLINK_CASSANDRA_PORT
 }
 
+# Prepared once per session and bound for every link
+INSERT_LINK = "INSERT INTO links (id, link_url, product_id, product_id_v2, product_name, product_price, product_sku, \
+    product_type, publisher_id, redirect_url, version) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);"
+
+# Default number of inserts in flight for add_links
+CONCURRENCY = 64
+
 # Create custom logger, handler, and formatter
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.DEBUG)
 
 class LinksConnector():
-  def __init__(self):
-    self.connect_hyperlink_db()
+  def __init__(self, cfg=None, instrumentation=None):
+    # the Cassandra session is only opened when the connector is first used
+    self.cfg = cfg
+    # records every statement run on the session (see common.utils.instrumentation)
+    self.instrumentation = instrumentation or get_instrumentation()
+    self._session = None
+    self._insert_link = None
+    self._lock = threading.Lock()
     super().__init__()
 
-  def add_link(self, data):
+  @property
+  def session(self):
+    self._connect()
+    return self._session
+
+  @property
+  def insert_link(self):
+    self._connect()
+    return self._insert_link
+
+  def _connect(self):
+    if self._session is None:
+      with self._lock:
+        if self._session is None:
+          self.connect_hyperlink_db(cfg=self.cfg)
+
+  def add_link(self, link):
     """
     Save RStyle Link - persists the rstyle link data to the Cassandra db table `links`
     Arguments:
-      data [JSON]: serialized JSON data for RStyle Link
+      link [Link]: RStyle Link returned by HyperlinkClient.get_link
     """
     try:
-      link = Map(data)
-      product = Map(link.item)
-      publisher = Map(link.publisher)
-
-      sql = "INSERT INTO links (id, link_url, product_id, product_id_v2, product_name, product_price, product_sku, \
-          product_type, publisher_id, redirect_url, version) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);"
-      
-      self.session.execute(sql, (link.id, link.url,product.id,product.product_id_v2,product.name,product.price,product.sku,
-          product.product_type,publisher.Id,link.redirect_url,link.version))
+      with self.instrumentation.timed('links', INSERT_LINK) as timing:
+        self.session.execute(self.insert_link, link_values(link))
+        timing.rows = 1
     
     except Exception as err:
       LOGGER.error('error in persisting rstyle link for url {}'.format(link.url), exc_info=True)
       raise err
 
+  def add_links(self, links, concurrency=CONCURRENCY):
+    """
+    Save RStyle Links - persists a stream of rstyle links to the Cassandra db table `links` with the driver's
+    async execution, keeping up to `concurrency` inserts in flight instead of waiting on each round trip.
+    Links are consumed as they are written, so `links` may be a generator still producing them; it is paused
+    while `concurrency` inserts are in flight. Every insert is recorded on its own, and a failed insert is
+    logged and reported without stopping the others.
+    Arguments:
+      links (iterable) -- RStyle Links returned by HyperlinkClient.get_link
+      concurrency [Integer]: maximum number of inserts in flight
+    Returns:
+      saved [Integer]: number of links persisted
+      failures (list of tuples) -- (link url, exception) for every link that could not be persisted
+    """
+    session, insert = self.session, self.insert_link
+    slots = threading.BoundedSemaphore(concurrency)
+    lock = threading.Lock()
+    result = {'saved': 0, 'failures': []}
+
+    def saved(_, url, start):
+      self.instrumentation.record('links', INSERT_LINK, time.perf_counter() - start, 1)
+      with lock:
+        result['saved'] += 1
+      slots.release()
+
+    def failed(error, url, start):
+      self.instrumentation.record('links', INSERT_LINK, time.perf_counter() - start, error=error)
+      LOGGER.error('error in persisting rstyle link for url {}: {}'.format(url, error))
+      with lock:
+        result['failures'].append((url, error))
+      slots.release()
+
+    for link in links:
+      slots.acquire()
+      start = time.perf_counter()
+      try:
+        future = session.execute_async(insert, link_values(link))
+      except Exception as error:
+        failed(error, link.url, start)
+        continue
+      future.add_callbacks(saved, failed, callback_args=(link.url, start), errback_args=(link.url, start))
+
+    # wait for the inserts still in flight
+    for _ in range(concurrency):
+      slots.acquire()
+    return result['saved'], result['failures']
+
   def connect_hyperlink_db(self, **kwargs):
     """
     Connect Hyperlink DB - Attempts to esablish a connection with the Hyperlink Cassandra Database.
+    Called on first use of the connector; the Cassandra driver is imported here.
     Arguments:
       cfg (dict): optional DB configuration
     Raises:
@@ -74,15 +143,20 @@ class LinksConnector():
     Returns:
       self {[cassandra.cluster]} -- A Cannasndra Cluster connection pool
     """
+    from cassandra.cluster import Cluster
+    from cassandra.auth import PlainTextAuthProvider
+
     cfg = kwargs.get('cfg', None)
     if env_vars_provided():
       try:
         LOGGER.debug("db connection details: {}".format(DB_CONFIG))
         auth_provider = PlainTextAuthProvider(username=DB_CONFIG['user'], password=DB_CONFIG['password'])
         cluster = Cluster(DB_CONFIG['host'],auth_provider=auth_provider,port=DB_CONFIG['port'])
-        self.session = cluster.connect(DB_CONFIG['db'],wait_for_all_pools=True)
-        self.session.execute("USE %s" % DB_CONFIG['db'])
-        return self.session
+        session = cluster.connect(DB_CONFIG['db'],wait_for_all_pools=True)
+        session.execute("USE %s" % DB_CONFIG['db'])
+        self._insert_link = session.prepare(INSERT_LINK)
+        self._session = session
+        return session
       except Exception as err:
         LOGGER.error('failed to connect to Hyperlink Cassandra database: {}'.format(err))
         raise err
@@ -90,9 +164,11 @@ class LinksConnector():
       try:
         LOGGER.debug("db connection details: {}".format(cfg))
         cluster = Cluster([cfg.host],port=cfg.port)
-        self.session = cluster.connect(cfg.db,wait_for_all_pools=True)
-        self.session.execute("USE %s" % cfg.db)
-        return self.session
+        session = cluster.connect(cfg.db,wait_for_all_pools=True)
+        session.execute("USE %s" % cfg.db)
+        self._insert_link = session.prepare(INSERT_LINK)
+        self._session = session
+        return session
       except Exception as err:
         LOGGER.error('failed to connect to Hyperlink Cassandra database: {}'.format(err))
         raise err
@@ -105,3 +181,14 @@ def env_vars_provided():
       Boolean -- Whether the expected environment variables have been provided.
   """
   return HYPERLINK_CASSANDRA_HOST and HYPERLINK_CASSANDRA_USER and HYPERLINK_CASSANDRA_PASSWORD
+
+def link_values(link):
+  """link_values
+  Arguments:
+      link [Link]: RStyle Link returned by HyperlinkClient.get_link
+  Returns:
+      tuple -- the values bound to INSERT_LINK for the link.
+  """
+  product = link.product
+  return (link.id, link.url, product.id, product.product_id_v2, product.name, product.price, product.sku,
+    product.product_type, link.publisher.id, link.redirect_url, link.version)
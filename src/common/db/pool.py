@@ -0,0 +1,176 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+# MySQL server status flag set while the session has an open transaction (pymysql's SERVER_STATUS_IN_TRANS)
+SERVER_STATUS_IN_TRANS = 1
+
+# Create custom logger, handler, and formatter
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.DEBUG)
+
+class ConnectionPoolError(Exception):
+  pass
+
+class ConnectionPool():
+  """
+  Connection Pool - A small thread-safe pool of DB-API connections (e.g. pymysql) shared by concurrent workers.
+  Connections are only opened when first checked out, pinged on checkout and replaced when dead, and
+  connections above `min_size` that sit idle for longer than `idle_timeout` seconds are closed.
+  Connections are not in autocommit mode, so a transaction left open by reads is rolled back on checkin;
+  otherwise under REPEATABLE READ every later read on the connection would see the snapshot of its first.
+  Writes must commit before the connection is returned.
+  Example:
+    pool = ConnectionPool(lambda: connect_mysql(cnx), max_size=4)
+    with pool.connection() as cnx:
+      with cnx.cursor() as cursor:
+        cursor.execute(sql)
+  """
+  def __init__(self, connect, min_size=1, max_size=4, idle_timeout=300, timeout=None):
+    """
+    Arguments:
+      connect (callable) -- opens and returns a new connection
+      min_size [Integer]: connections kept open even when idle, once opened
+      max_size [Integer]: upper bound on open connections
+      idle_timeout [Integer]: seconds an idle connection above min_size is kept before being closed
+      timeout [Integer]: seconds to wait for a free connection before raising ConnectionPoolError; None waits forever
+    """
+    if min_size < 0 or max_size < 1 or min_size > max_size:
+      raise ValueError('pool sizes must satisfy 0 <= min_size <= max_size and max_size >= 1')
+    self._connect = connect
+    self.min_size = min_size
+    self.max_size = max_size
+    self.idle_timeout = idle_timeout
+    self.timeout = timeout
+    self._idle = []
+    self._size = 0
+    self._closed = False
+    self._lock = threading.Condition()
+
+  @contextmanager
+  def connection(self):
+    """
+    Connection - Checks a connection out of the pool for the duration of the `with` block.
+    If the block raises, uncommitted work is rolled back before the connection is returned.
+    """
+    cnx = self.checkout()
+    try:
+      yield cnx
+    except BaseException:
+      self._rollback(cnx)
+      raise
+    finally:
+      self.checkin(cnx)
+
+  def checkout(self):
+    """
+    Checkout - Returns a healthy connection, opening a new one if none is idle and the pool is not full.
+    """
+    deadline = None if self.timeout is None else time.monotonic() + self.timeout
+    with self._lock:
+      while True:
+        if self._closed:
+          raise ConnectionPoolError('connection pool is closed')
+        self._evict_idle()
+        if self._idle:
+          cnx, _ = self._idle.pop()
+          break
+        if self._size < self.max_size:
+          cnx = None
+          self._size += 1
+          break
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+          raise ConnectionPoolError('timed out waiting for a connection')
+        self._lock.wait(remaining)
+
+    if cnx is None:
+      return self._open_reserved()
+    if self._healthy(cnx):
+      return cnx
+    # keep the slot and replace the dead connection in it
+    LOGGER.warning('replacing dead pooled connection')
+    self._close(cnx)
+    return self._open_reserved()
+
+  def checkin(self, cnx):
+    """
+    Checkin - Ends any open transaction and returns a connection to the pool.
+    """
+    if self._in_transaction(cnx):
+      self._rollback(cnx)
+    with self._lock:
+      if self._closed:
+        self._size -= 1
+        self._close(cnx)
+      else:
+        self._idle.append((cnx, time.monotonic()))
+      self._lock.notify()
+
+  def close(self):
+    """
+    Close - Closes every idle connection; connections still checked out are closed when returned.
+    """
+    with self._lock:
+      self._closed = True
+      while self._idle:
+        cnx, _ = self._idle.pop()
+        self._size -= 1
+        self._close(cnx)
+      self._lock.notify_all()
+
+  def _open_reserved(self):
+    # the slot was reserved under the lock; give it back if the connection cannot be opened
+    try:
+      return self._connect()
+    except Exception:
+      with self._lock:
+        self._size -= 1
+        self._lock.notify()
+      raise
+
+  def _evict_idle(self):
+    if self.idle_timeout is None:
+      return
+    now = time.monotonic()
+    # idle connections are appended in checkin order, so the stalest are at the front
+    while len(self._idle) > self.min_size and now - self._idle[0][1] > self.idle_timeout:
+      cnx, _ = self._idle.pop(0)
+      self._size -= 1
+      self._close(cnx)
+
+  def _healthy(self, cnx):
+    try:
+      cnx.ping(reconnect=False)
+      return True
+    except Exception:
+      return False
+
+  def _in_transaction(self, cnx):
+    # connections that do not report their status are assumed to be in a transaction
+    status = getattr(cnx, 'server_status', None)
+    return status is None or bool(status & SERVER_STATUS_IN_TRANS)
+
+  def _rollback(self, cnx):
+    try:
+      cnx.rollback()
+    except Exception:
+      LOGGER.warning('failed to roll back pooled connection', exc_info=True)
+
+  def _close(self, cnx):
+    try:
+      cnx.close()
+    except Exception:
+      pass
+
+def connect_mysql(config):
+  """connect_mysql
+  Opens a pymysql connection returning dict rows by default; pymysql is imported on the first connection.
+  Arguments:
+      config (dict): keyword arguments for pymysql.connect
+  Returns:
+      pymysql.Connection
+  """
+  import pymysql
+  return pymysql.connect(cursorclass=pymysql.cursors.DictCursor, **config)
@@ -3,13 +3,16 @@ import logging
 import os
 import re
 import sys
+import time
 import traceback
 import uuid
 from datetime import datetime, timedelta
-from ..utils.ssm_parameter_store import SSMParameterStore
-
-import boto3
-import pymysql
+from ..utils.instrumentation import InstrumentedConnection, get_instrumentation
+from ..utils.ssm_cache import load_params, register_params
+from . import bulk
+from .pool import ConnectionPool, connect_mysql
+from . import query as q
+from . import rows
 
 # Environment vars
 POST_DB_NAME = os.environ.get('POST_DB_NAME', None)
@@ -25,31 +28,62 @@ DB_CONFIG = {
   'user': POST_SERVICE_MYSQL_USER,
   'password': POST_SERVICE_MYSQL_PASSWORD,
   'db': POST_DB_NAME,
-  'charset': 'utf8mb4',
-  'cursorclass': pymysql.cursors.DictCursor
+  'charset': 'utf8mb4'
 }
 
 # Create custom logger, handler, and formatter
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.DEBUG)
 
+# SSM parameters holding the database configuration
+SSM_PARAMS = register_params([
+  '/rds/rs-post-service/db',
+  '/rds/rs-post-service/host',
+  '/rds/rs-post-service/port',
+  '/rds/rs-post-service/rw-user',
+  '/rds/rs-post-service/rw-password'
+])
+
 class PostConnector():
-  def __init__(self, cfg=None):
+  def __init__(self, cfg=None, min_size=1, max_size=4, row_mode='dict', instrumentation=None, throttle=None):
     # cfg = load_ssm_config()
-    self.connect_post_db(cfg)
+    # records every statement run on the pooled connections (see common.utils.instrumentation)
+    self.instrumentation = instrumentation or get_instrumentation()
+    # optional AdaptiveBatcher sizing and pacing the writes of executemany and bulk_update
+    self.throttle = throttle
+    # default row representation returned by execute and stream (see common.db.rows)
+    self.row_mode = row_mode
+    self.connect_post_db(cfg, min_size=min_size, max_size=max_size)
     super().__init__()
 
-  def execute(self, query, data=None):
+  def connection(self):
+    """
+    Checks a connection to the posts database out of the connector's pool for the duration of a `with` block.
+    Workers sharing the connector must each check out their own connection.
+    Returns:
+      context manager yielding a pymysql.Connection
+    """
+    return self.pool.connection()
+
+  def close(self):
+    """
+    Closes the connector's pooled connections to the posts database.
+    """
+    self.pool.close()
+
+  def execute(self, query, data=None, row_mode=None):
     """
     Executes a given query against the posts database.
     Arguments:
       query (string) -- SQL template string to execute
       data ()
+      row_mode (string) -- 'dict', 'tuple' or 'record'; defaults to the connector's row mode
     Returns:
-      result (list of tuples)
+      result (list of rows)
     """
+    mode = row_mode or self.row_mode
     try:
-      with self.cnx.cursor() as cursor:
+      with self.connection() as cnx, cnx.cursor(rows.cursor_class(mode)) as cursor:
         if data is not None:
           cursor.execute(query, data)
         else:
@@ -57,34 +91,95 @@ class PostConnector():
         result = cursor.fetchall()
         if result is None:
           raise Exception('not found')
-        return result
+        return rows.convert(cursor, result, mode)
     except Exception as err:
       LOGGER.error('running query {}'.format(query), exc_info=True)
       raise err
 
-  def executemany(self, query, data=None):
+  def stream(self, query, data=None, size=q.PAGE_SIZE, key=None, after=None, row_mode=None):
     """
-    Executes a given query for a list of values against the posts database.
-    https://dev.mysql.com/doc/connector-python/en/connector-python-api-mysqlcursor-executemany.html
+    Streams the rows of a given query against the posts database in bounded pages, instead of
+    loading the whole result set into memory like `execute`.
     Arguments:
       query (string) -- SQL template string to execute
       data ()
+      size [Integer]: maximum number of rows fetched per round trip
+      key (string|tuple) -- optional unique column (e.g. 'id') or columns for keyset pagination, which checks a
+        connection out per page; when omitted an unbuffered cursor is used and the connection is busy until the
+        stream is consumed
+      after -- optional `key` value to start after, e.g. when resuming from a checkpoint
+      row_mode (string) -- 'dict', 'tuple' or 'record'; defaults to the connector's row mode
     Returns:
-      result (list of tuples)
+      result (generator of rows)
     """
-    cursor = self.cnx.cursor()
+    mode = row_mode or self.row_mode
     try:
-      if data is not None:
-        cursor.executemany(query, data)
-        self.cnx.commit()
-      else:
-        cursor.executemany(query)
-        self.cnx.commit()
+      # with a key every page checks out its own connection, so none is held between pages
+      for row in q.stream(self.connection, query, data, size=size, key=key, after=after, row_mode=mode):
+        yield row
     except Exception as err:
-      self.cnx.rollback()
       LOGGER.error('running query {}'.format(query), exc_info=True)
       raise err
 
+  def executemany(self, query, data=None, throttle=None):
+    """
+    Executes a given query for a list of values against the posts database.
+    https://dev.mysql.com/doc/connector-python/en/connector-python-api-mysqlcursor-executemany.html
+    Without a throttle every value is written in one transaction; with one, values are written and committed in
+    chunks the throttle sizes and paces.
+    Arguments:
+      query (string) -- SQL template string to execute
+      data ()
+      throttle [AdaptiveBatcher]: optional write controller, defaults to the connector's
+    Returns:
+      result (list of tuples)
+    """
+    throttle = throttle or self.throttle
+    with self.connection() as cnx:
+      cursor = cnx.cursor()
+      try:
+        if data is not None and throttle is not None:
+          for chunk in throttle.chunks(data):
+            start = time.monotonic()
+            cursor.executemany(query, chunk)
+            cnx.commit()
+            bulk.observe(throttle, start, chunk)
+        elif data is not None:
+          cursor.executemany(query, data)
+          cnx.commit()
+        else:
+          cursor.executemany(query)
+          cnx.commit()
+      except Exception as err:
+        cnx.rollback()
+        LOGGER.error('running query {}'.format(query), exc_info=True)
+        raise err
+
+  def bulk_update(self, table, key, columns, rows, size=bulk.BULK_SIZE, method='join', throttle=None):
+    """
+    Applies (key, values...) rows to a table in the posts database with one joined UPDATE per chunk,
+    instead of the one UPDATE round trip per row that `executemany` issues. Each chunk is committed on its own.
+    Example: bulk_update('posts', 'id', ('reporting_end_time',), [(post_id, end_time), ...])
+    Arguments:
+      table (string) -- table to update
+      key (string) -- column identifying the rows to update
+      columns (tuple) -- columns to set, in the order their values follow the key in each row
+      rows (iterable) -- tuples of (key, value for each column)
+      size [Integer]: maximum number of rows per UPDATE
+      method (string) -- 'join' (inline derived table) or 'temp' (session temporary table)
+      throttle [AdaptiveBatcher]: optional controller sizing and pacing the chunks, defaults to the connector's
+    Returns:
+      affected [Integer]: number of rows changed
+    """
+    with self.connection() as cnx:
+      try:
+        return bulk.bulk_update(cnx, table, key, columns, rows, size=size, method=method,
+          throttle=throttle or self.throttle)
+      except Exception as err:
+        cnx.rollback()
+        LOGGER.error('bulk updating {}'.format(table), exc_info=True)
+        raise err
+
   def update_batch_posts(self, post_ids, data):
     """
     Given an array of post IDs, update the posts with the provided batch payload.
@@ -95,7 +190,7 @@ class PostConnector():
       result (list of tuples)
     """
     try:
-      with self.cnx.cursor() as cursor:
+      with self.connection() as cnx, cnx.cursor() as cursor:
         sql = "UPDATE reporting_start_time, reporting_end_time where post_id in %s;"
         cursor.execute(sql, post_ids)
         result = cursor.fetchall()
@@ -115,7 +210,7 @@ class PostConnector():
       result (list of tuples)
     """
     try:
-      with self.cnx.cursor() as cursor:
+      with self.connection() as cnx, cnx.cursor() as cursor:
         sql = "SELECT url FROM rstyle_links where post_id=%s;"
         cursor.execute(sql, post_id)
         result = cursor.fetchall()
@@ -126,35 +221,43 @@ class PostConnector():
       LOGGER.error('error getting rstyle_links for post id {}'.format(post_id), exc_info=True)
       raise err
 
-  def connect_post_db(self, cfg):
+  def get_rstyle_links_for_post_ids(self, post_ids):
     """
-    Connect Post DB - Attempts to esablish a connection with the Posts Database.
+    Get Rstyle Links by Post IDs - Queries the `rstyle_links` table in the Post DB for many posts at once,
+    with one IN (...) statement per chunk of ids instead of one query per post
+    Arguments:
+      post_ids (iterable) -- Unique identifiers of the posts
+    Returns:
+      result (generator of rows with post_id and url)
+    """
+    return q.select_in(self.execute, "SELECT post_id, url FROM rstyle_links WHERE post_id IN ({})", post_ids)
+
+  def connect_post_db(self, cfg, min_size=1, max_size=4):
+    """
+    Connect Post DB - Sets up a pool of connections with the Posts Database, opened on first use.
     Arguments:
       cfg (dict): optional DB configuration
+      min_size [Integer]: connections kept open when idle, once opened
+      max_size [Integer]: upper bound on connections open at once
     Raises:
       Exception: Failure to connect
     Returns:
-      self {[pymsql.Connection]} -- A pymsql.Connection pool
+      self {[ConnectionPool]} -- A pool of pymsql.Connection
     """
     if cfg is not None:
-      try:
-        cnx = cnx_from_config(cfg)
-        LOGGER.debug("db connection details: {}".format(cnx))
-        self.cnx = pymysql.connect(**cnx)
-        return self.cnx
-      except Exception as err:
-        LOGGER.error('failed to connect to posts database: {}'.format(err))
-        raise err
+      cnx = cnx_from_config(cfg)
     elif env_vars_provided():
-      try:
-        LOGGER.debug("db connection details: {}".format(DB_CONFIG))
-        self = pymysql.connect(**DB_CONFIG)
-        return self
-      except Exception as err:
-        LOGGER.error('failed to connect to posts database: {}'.format(err))
-        raise err
+      cnx = DB_CONFIG
     else:
       raise Exception("Missing required environment variables")
+    try:
+      LOGGER.debug("db connection details: {}".format(cnx))
+      connect = lambda: InstrumentedConnection(connect_mysql(cnx), self.instrumentation, 'posts')
+      self.pool = ConnectionPool(connect, min_size=min_size, max_size=max_size)
+      return self.pool
+    except Exception as err:
+      LOGGER.error('failed to connect to posts database: {}'.format(err))
+      raise err
 
 def cnx_from_config(cfg):
   """Connections from Configuration
@@ -168,8 +271,8 @@ def cnx_from_config(cfg):
     'user': cfg['POST_SERVICE_MYSQL_USER'],
     'password': cfg['POST_SERVICE_MYSQL_PASSWORD'],
     'db': cfg['POST_DB_NAME'],
-    'charset': 'utf8mb4',
-    'cursorclass': pymysql.cursors.DictCursor
+    'port': int(cfg.get('POST_SERVICE_MYSQL_PORT') or 3306),
+    'charset': 'utf8mb4'
   }
 
 def env_vars_provided():
@@ -181,15 +284,7 @@ def env_vars_provided():
 
 def load_ssm_config():
   """load_ssm_config
+  Loads the database parameters from SSM through the process-wide cache; the first load also prefetches
+  the parameters of every other connector.
   """
-  param_store = SSMParameterStore(ENV, region_name=AWS_DEFAULT_REGION)
-  params = param_store.fetch_many(
-      required=[
-        '/rds/rs-post-service/db', 
-        '/rds/rs-post-service/host', 
-        '/rds/rs-post-service/port', 
-        '/rds/rs-post-service/rw-user', 
-        '/rds/rs-post-service/rw-password'
-      ]
-  )
-  return params
\ No newline at end of file
+  return load_params(SSM_PARAMS)
\ No newline at end of file
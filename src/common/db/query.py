@@ -0,0 +1,232 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+
+from . import rows as r
+
+# Default number of rows fetched per round trip when streaming
+PAGE_SIZE = 1000
+
+# Default bounds on a single IN (...) chunk: key count and encoded key bytes (well under max_allowed_packet)
+CHUNK_SIZE = 1000
+CHUNK_BYTES = 256 * 1024
+
+def quote_name(name):
+  """
+  Quote Name - Backtick-quotes a table or column name, including each part of a dotted name
+  (e.g. 'collaborations.obligations').
+  """
+  return '.'.join('`{}`'.format(part.replace('`', '``')) for part in name.split('.'))
+
+def projection(columns):
+  """
+  Projection - Renders a column list for a SELECT, quoting each (optionally table-qualified) name,
+  e.g. ('id', 'campaigns.end_date') -> '`id`, `campaigns`.`end_date`'.
+  """
+  return ', '.join(quote_name(column) for column in columns)
+
+def select_sql(columns, source, where=None):
+  """
+  Select SQL - Builds a SELECT that projects only the given columns instead of SELECT *, so wide
+  columns a caller never reads are neither sent over the wire nor decoded.
+  Arguments:
+    columns (tuple) -- column names to return, optionally table-qualified
+    source (string) -- FROM clause, e.g. 'posts' or 'obligations JOIN campaigns ON ...'
+    where (string) -- optional WHERE condition
+  Returns:
+    query (string)
+  """
+  sql = 'SELECT {} FROM {}'.format(projection(columns), source)
+  if where:
+    sql += ' WHERE {}'.format(where)
+  return sql
+
+def stream_pages(cnx, query, data=None, size=PAGE_SIZE, row_mode='dict'):
+  """
+  Stream Pages - Runs a query on an unbuffered cursor and yields the result set in pages of at most
+  `size` rows, so only one page is held in client memory at a time.
+  The connection cannot run other statements until the generator is exhausted or closed.
+  Arguments:
+    cnx [pymysql.Connection]: open connection to run the query on
+    query (string) -- SQL template string to execute
+    data (tuple|dict) -- optional query parameters
+    size [Integer]: maximum number of rows per page
+    row_mode (string) -- 'dict', 'tuple' or 'record' (see common.db.rows)
+  Returns:
+    generator of lists of rows
+  """
+  with cnx.cursor(r.cursor_class(row_mode, unbuffered=True)) as cursor:
+    cursor.execute(query, data)
+    while True:
+      page = cursor.fetchmany(size)
+      if not page:
+        return
+      yield r.convert(cursor, page, row_mode)
+
+def paginate(cnx, query, data=None, key='id', size=PAGE_SIZE, after=None, row_mode='dict'):
+  """
+  Paginate - Runs a query as a series of keyset pages ordered by `key`, yielding each page of at most
+  `size` rows. Every page is a short, buffered statement that seeks past the last key seen, so the server
+  never has to hold a long-running cursor open. Given a checkout function (e.g. a connector's `connection`),
+  each page runs on a connection checked out for that page only, so no connection or read transaction is
+  held while the caller processes a page; given an open connection, the caller keeps it for the whole scan.
+  A composite key, e.g. ('modified_at', 'id'), seeks with a row comparison: (a, b) > (%s, %s).
+  Arguments:
+    cnx [pymysql.Connection or callable]: open connection to run the query on, or a function returning a
+      context manager that checks one out
+    query (string) -- SQL SELECT without ORDER BY or LIMIT; must return the `key` column(s)
+    data (tuple) -- optional positional query parameters
+    key (string|tuple) -- unique, indexed column, or tuple of columns, to page on
+    size [Integer]: maximum number of rows per page
+    after -- optional key (a tuple for a composite key) to start after, e.g. the last key processed before
+      a restart
+    row_mode (string) -- 'dict', 'tuple' or 'record' (see common.db.rows)
+  Returns:
+    generator of lists of rows
+  """
+  params = tuple(data or ())
+  names = tuple(key) if isinstance(key, (tuple, list)) else (key,)
+  columns = ', '.join('page.' + quote_name(name) for name in names)
+  if len(names) > 1:
+    columns_row, values_row = '({})'.format(columns), '({})'.format(in_list(len(names)))
+  else:
+    columns_row, values_row = columns, '%s'
+  first = "SELECT * FROM ({}) AS page ORDER BY {} LIMIT %s".format(query, columns)
+  seek = "SELECT * FROM ({}) AS page WHERE {} > {} ORDER BY {} LIMIT %s".format(query, columns_row, values_row, columns)
+  def fetch(cnx, last):
+    with cnx.cursor(r.cursor_class(row_mode)) as cursor:
+      if last is None:
+        cursor.execute(first, params + (size,))
+      else:
+        cursor.execute(seek, params + (tuple(last) if len(names) > 1 else (last,)) + (size,))
+      return r.convert(cursor, cursor.fetchall(), row_mode), r.key_getter(cursor, row_mode, key)
+
+  last = after
+  while True:
+    if callable(cnx):
+      with cnx() as checked_out:
+        page, get_key = fetch(checked_out, last)
+    else:
+      page, get_key = fetch(cnx, last)
+    if not page:
+      return
+    yield page
+    if len(page) < size:
+      return
+    last = get_key(page[-1])
+
+def stream(cnx, query, data=None, size=PAGE_SIZE, key=None, after=None, row_mode='dict'):
+  """
+  Stream - Yields the rows of a query one at a time, fetching them in bounded pages.
+  Uses keyset pagination when `key` is given and an unbuffered cursor otherwise. A checkout function is used
+  once per page with a key (see paginate), and holds one connection for the whole stream without.
+  Arguments:
+    cnx [pymysql.Connection or callable]: open connection to run the query on, or a function returning a
+      context manager that checks one out
+    query (string) -- SQL template string to execute
+    data (tuple|dict) -- optional query parameters
+    size [Integer]: maximum number of rows per page
+    key (string|tuple) -- optional unique column, or tuple of columns, to page on
+    after -- optional `key` value to start after; requires `key`
+    row_mode (string) -- 'dict', 'tuple' or 'record' (see common.db.rows)
+  Returns:
+    generator of rows
+  """
+  if key is not None:
+    pages = paginate(cnx, query, data, key=key, size=size, after=after, row_mode=row_mode)
+  elif after is not None:
+    raise ValueError('after requires a key to page on')
+  elif callable(cnx):
+    with cnx() as checked_out:
+      for row in stream(checked_out, query, data, size=size, row_mode=row_mode):
+        yield row
+    return
+  else:
+    pages = stream_pages(cnx, query, data, size=size, row_mode=row_mode)
+  for page in pages:
+    for row in page:
+      yield row
+
+def batches(items, size):
+  """
+  Batches - Groups an iterable into lists of at most `size` items.
+  """
+  batch = []
+  for item in items:
+    batch.append(item)
+    if len(batch) >= size:
+      yield batch
+      batch = []
+  if batch:
+    yield batch
+
+def chunk_keys(keys, size=CHUNK_SIZE, max_bytes=CHUNK_BYTES):
+  """
+  Chunk Keys - Splits an iterable of keys into lists holding at most `size` keys and roughly
+  `max_bytes` of escaped key data, so long text keys (e.g. URLs) produce smaller chunks than integer ids.
+  Arguments:
+    keys (iterable) -- keys to split
+    size [Integer]: maximum number of keys per chunk
+    max_bytes [Integer]: approximate maximum encoded size of the keys in a chunk
+  Returns:
+    generator of lists of keys
+  """
+  chunk, chunk_bytes = [], 0
+  for key in keys:
+    # quotes and the ", " separator around every literal
+    key_bytes = len(str(key).encode('utf-8')) + 4
+    if chunk and (len(chunk) >= size or chunk_bytes + key_bytes > max_bytes):
+      yield chunk
+      chunk, chunk_bytes = [], 0
+    chunk.append(key)
+    chunk_bytes += key_bytes
+  if chunk:
+    yield chunk
+
+def in_list(count):
+  """
+  In List - Returns the placeholder list for an IN (...) clause of `count` parameters, e.g. '%s, %s, %s'.
+  """
+  return ', '.join(['%s'] * count)
+
+def select_in(execute, query, keys, data=None, size=CHUNK_SIZE, max_bytes=CHUNK_BYTES, workers=1):
+  """
+  Select In - Runs a query with an IN (...) clause over a large list of keys as a series of parameterized,
+  size-bounded statements and streams back the merged rows. Every chunk with the same number of keys
+  produces the same statement text, which keeps statements small and lets the server reuse its plans.
+  Arguments:
+    execute (callable) -- function taking (query, data) and returning rows, e.g. CollabsConnector.execute;
+      must be safe to call from several threads when workers > 1
+    query (string) -- SQL template with a `{}` placeholder where the IN list goes, e.g.
+      "SELECT * FROM posts WHERE id IN ({})"; literal % signs must be escaped as %%
+    keys (iterable) -- keys to look up
+    data (tuple) -- optional positional parameters that precede the IN list in the query
+    size [Integer]: maximum number of keys per statement
+    max_bytes [Integer]: approximate maximum encoded size of the keys per statement
+    workers [Integer]: number of chunks to run concurrently; 1 runs them back to back
+  Returns:
+    generator of rows, in chunk order when workers is 1 and in completion order otherwise
+  """
+  params = tuple(data or ())
+  chunks = chunk_keys(keys, size=size, max_bytes=max_bytes)
+
+  def run(chunk):
+    return execute(query.format(in_list(len(chunk))), params + tuple(chunk))
+
+  if workers <= 1:
+    for chunk in chunks:
+      for row in run(chunk):
+        yield row
+    return
+
+  with ThreadPoolExecutor(max_workers=workers) as executor:
+    pending = set()
+    for chunk in chunks:
+      pending.add(executor.submit(run, chunk))
+      if len(pending) < workers:
+        continue
+      done, pending = wait(pending, return_when=FIRST_COMPLETED)
+      for future in done:
+        for row in future.result():
+          yield row
+    for future in as_completed(pending):
+      for row in future.result():
+        yield row
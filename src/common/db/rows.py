@@ -0,0 +1,58 @@
+from collections import namedtuple
+from functools import lru_cache
+from operator import attrgetter, itemgetter
+
+# Row representations a query can return:
+# dict - a dict per row (pymysql's DictCursor); repeats every column name in every row
+# tuple - a plain tuple per row, in column order
+# record - a namedtuple per row with attribute access (row.id); tuple-sized, no per-row __dict__
+ROW_MODES = ('dict', 'tuple', 'record')
+
+def cursor_class(mode, unbuffered=False):
+  """
+  Cursor Class - Returns the pymysql cursor class that fetches rows for a row mode.
+  Arguments:
+    mode (string) -- one of ROW_MODES
+    unbuffered (Boolean) -- whether rows are streamed from the server instead of fetched all at once
+  """
+  if mode not in ROW_MODES:
+    raise ValueError('row mode must be one of {}'.format(ROW_MODES))
+  import pymysql.cursors
+  if mode == 'dict':
+    return pymysql.cursors.SSDictCursor if unbuffered else pymysql.cursors.DictCursor
+  return pymysql.cursors.SSCursor if unbuffered else pymysql.cursors.Cursor
+
+@lru_cache(maxsize=256)
+def record_type(columns):
+  """
+  Record Type - Returns a namedtuple class for a tuple of column names, shared by every query
+  returning the same columns. Names that are not valid identifiers are renamed to _0, _1, ...
+  """
+  return namedtuple('Record', columns, rename=True)
+
+def column_names(cursor):
+  return tuple(column[0] for column in cursor.description or ())
+
+def convert(cursor, rows, mode):
+  """
+  Convert - Turns rows fetched by `cursor_class(mode)` into the representation for `mode`.
+  Returns:
+    list of rows
+  """
+  if mode == 'record':
+    make = record_type(column_names(cursor))._make
+    return [make(row) for row in rows]
+  return list(rows)
+
+def key_getter(cursor, mode, key):
+  """
+  Key Getter - Returns a function reading the `key` column from rows of the given mode, or a tuple of
+  values when `key` is a tuple of columns.
+  """
+  names = tuple(key) if isinstance(key, (tuple, list)) else (key,)
+  if mode == 'dict':
+    return itemgetter(*names)
+  if mode == 'record':
+    return attrgetter(*names)
+  columns = column_names(cursor)
+  return itemgetter(*[columns.index(name) for name in names])
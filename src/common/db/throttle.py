@@ -0,0 +1,202 @@
+import logging
+import threading
+import time
+from itertools import islice
+
+from .query import quote_name
+from .rows import column_names
+
+# Controller defaults
+TARGET_LATENCY = 0.5  # seconds a write chunk should take, including its commit
+MAX_LAG = 1.0  # seconds of replica lag tolerated before writes pause
+PROBE_INTERVAL = 1.0  # minimum seconds between two lag probes
+MAX_PAUSE = 30.0  # longest single pause while waiting for lag to recover
+MAX_WAIT = 900.0  # longest total wait for lag to recover before writes give up
+
+# Current time in the zone of a heartbeat column, by the name of that zone
+HEARTBEAT_CLOCKS = {'utc': 'UTC_TIMESTAMP(6)', 'local': 'NOW(6)'}
+
+# Seconds a heartbeat may appear to be in the future (clock skew) before its zone is assumed to be wrong
+HEARTBEAT_SKEW = 60.0
+
+# Create custom logger, handler, and formatter
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.DEBUG)
+
+class ReplicaLagError(Exception):
+  """
+  Replica Lag Error - Raised when the replicas do not catch up within the throttle's `max_wait`.
+  """
+
+class AdaptiveBatcher():
+  """
+  Adaptive Batcher - Sizes write chunks from the latency of the previous ones and pauses writes while a lag
+  probe reports too much replica lag. Chunks shrink by half when a chunk takes longer than `target_latency` or
+  the replicas fall behind, and grow by a quarter while chunks take less than half of it, so writes run as fast
+  as the primary and replicas keep up with.
+  Example:
+    throttle = AdaptiveBatcher(lag_probe=ReplicaStatusProbe(replica_cnx))
+    for chunk in throttle.chunks(rows):
+      start = time.monotonic()
+      write(chunk)
+      throttle.observe(time.monotonic() - start, len(chunk))
+  """
+  def __init__(self, size=1000, min_size=50, max_size=20000, target_latency=TARGET_LATENCY, lag_probe=None,
+      max_lag=MAX_LAG, probe_interval=PROBE_INTERVAL, max_pause=MAX_PAUSE, max_wait=MAX_WAIT):
+    """
+    Arguments:
+      size [Integer]: rows in the first chunk
+      min_size [Integer]: smallest chunk
+      max_size [Integer]: largest chunk
+      target_latency [Float]: seconds a chunk should take
+      lag_probe (callable) -- returns the current replica lag in seconds, or None when unknown
+      max_lag [Float]: seconds of lag tolerated before writes pause
+      probe_interval [Float]: minimum seconds between two lag probes
+      max_pause [Float]: longest single pause while waiting for lag to recover
+      max_wait [Float]: longest total wait for lag to recover; ReplicaLagError is raised after it
+    """
+    if not 0 < min_size <= size <= max_size:
+      raise ValueError('chunk sizes must satisfy 0 < min_size <= size <= max_size')
+    self.size = size
+    self.min_size = min_size
+    self.max_size = max_size
+    self.target_latency = target_latency
+    self.lag_probe = lag_probe
+    self.max_lag = max_lag
+    self.probe_interval = probe_interval
+    self.max_pause = max_pause
+    self.max_wait = max_wait
+    self.chunks_written = 0
+    self.rows_written = 0
+    self.paused = 0.0
+    self._probed_at = None
+    self._lock = threading.Lock()
+
+  def chunks(self, rows):
+    """
+    Chunks - Splits an iterable of rows into lists sized by the controller at the time each chunk is taken.
+    """
+    rows = iter(rows)
+    while True:
+      chunk = [tuple(row) for row in islice(rows, self.size)]
+      if not chunk:
+        return
+      yield chunk
+
+  def observe(self, seconds, rows):
+    """
+    Observe - Adjusts the chunk size after a chunk of `rows` rows took `seconds` to write and commit, then
+    waits while the replicas lag behind.
+    """
+    with self._lock:
+      self.chunks_written += 1
+      self.rows_written += rows
+      if seconds > self.target_latency:
+        self.size = max(self.min_size, self.size // 2)
+      elif seconds < self.target_latency / 2 and rows >= self.size:
+        self.size = min(self.max_size, self.size + max(1, self.size // 4))
+    self.wait_for_lag()
+
+  def wait_for_lag(self):
+    """
+    Wait For Lag - Sleeps while the lag probe reports more than `max_lag` seconds of lag, probing at most every
+    `probe_interval` seconds. A stalled replica or a heartbeat that stopped updating would keep it waiting forever,
+    so after `max_wait` seconds it raises ReplicaLagError instead.
+    """
+    if self.lag_probe is None:
+      return
+    now = time.monotonic()
+    if self._probed_at is not None and now - self._probed_at < self.probe_interval:
+      return
+    self._probed_at = now
+    lag = self.lag_probe()
+    waited = 0.0
+    while lag is not None and lag > self.max_lag:
+      if waited >= self.max_wait:
+        LOGGER.error('replica lag {:.1f}s after waiting {:.0f}s; giving up'.format(lag, waited))
+        raise ReplicaLagError('replica still {:.1f}s behind after waiting {:.0f}s'.format(lag, waited))
+      with self._lock:
+        self.size = max(self.min_size, self.size // 2)
+      pause = min(self.max_pause, max(self.probe_interval, lag - self.max_lag), self.max_wait - waited)
+      LOGGER.info('replica lag {:.1f}s; pausing writes for {:.1f}s at chunk size {}'.format(lag, pause, self.size))
+      time.sleep(pause)
+      self.paused += pause
+      waited += pause
+      self._probed_at = time.monotonic()
+      lag = self.lag_probe()
+
+  def summary(self):
+    """
+    Summary - Returns the chunks and rows written, the current chunk size and the seconds spent paused.
+    """
+    return {'chunks': self.chunks_written, 'rows': self.rows_written, 'size': self.size, 'paused': self.paused}
+
+class ReplicaStatusProbe():
+  """
+  Replica Status Probe - Reads Seconds_Behind_Master from SHOW SLAVE STATUS on a replica.
+  Example:
+    probe = ReplicaStatusProbe(CollabsConnector(replica_cfg, max_size=1))
+  """
+  def __init__(self, connector):
+    """
+    Arguments:
+      connector -- connector (or pool) for the replica, with a `connection()` context manager
+    """
+    self.connector = connector
+
+  def __call__(self):
+    with self.connector.connection() as cnx, cnx.cursor() as cursor:
+      cursor.execute("SHOW SLAVE STATUS")
+      status = cursor.fetchone()
+      if not status:
+        return None
+      if not isinstance(status, dict):
+        status = dict(zip(column_names(cursor), status))
+    lag = status['Seconds_Behind_Master']
+    # NULL while replication is stopped; treat it as too far behind
+    return float('inf') if lag is None else float(lag)
+
+class HeartbeatProbe():
+  """
+  Heartbeat Probe - Measures lag as the age of the newest row of a heartbeat table (e.g. pt-heartbeat's
+  `heartbeat.ts`) that a process on the primary keeps updating, as seen from a replica. Each probe ends its
+  read transaction, so the next one reads a fresh snapshot instead of the same heartbeat again.
+  The heartbeat is compared with the replica's clock in the zone the column is written in: 'utc' for DATETIME
+  values written in UTC (pt-heartbeat --utc), 'local' for values in the session time zone (pt-heartbeat without
+  --utc, or a TIMESTAMP column). A heartbeat more than HEARTBEAT_SKEW seconds in the future means the zone is
+  wrong and raises ValueError rather than hiding the offset.
+  Example:
+    probe = HeartbeatProbe(CollabsConnector(replica_cfg, max_size=1), table='percona.heartbeat')
+  """
+  def __init__(self, connector, table='heartbeat', column='ts', timezone='utc'):
+    """
+    Arguments:
+      connector -- connector (or pool) for the replica, with a `connection()` context manager
+      table (string) -- heartbeat table
+      column (string) -- DATETIME, TIMESTAMP or string column holding the time of the last heartbeat
+      timezone (string) -- zone the column is written in, one of HEARTBEAT_CLOCKS
+    """
+    if timezone not in HEARTBEAT_CLOCKS:
+      raise ValueError('heartbeat timezone must be one of {}'.format(sorted(HEARTBEAT_CLOCKS)))
+    self.connector = connector
+    self.timezone = timezone
+    self.query = "SELECT TIMESTAMPDIFF(MICROSECOND, MAX({}), {}) / 1000000 AS lag FROM {}".format(
+      quote_name(column), HEARTBEAT_CLOCKS[timezone], quote_name(table))
+
+  def __call__(self):
+    with self.connector.connection() as cnx:
+      try:
+        with cnx.cursor() as cursor:
+          cursor.execute(self.query)
+          row = cursor.fetchone()
+      finally:
+        # under REPEATABLE READ an open transaction would keep returning the first heartbeat read
+        cnx.rollback()
+    lag = row['lag'] if isinstance(row, dict) else row[0]
+    if lag is None:
+      return None
+    lag = float(lag)
+    if lag < -HEARTBEAT_SKEW:
+      raise ValueError('heartbeat is {:.0f}s in the future; is it written in {} time?'.format(-lag,
+        'local' if self.timezone == 'utc' else 'UTC'))
+    return max(0.0, lag)
@@ -0,0 +1,95 @@
+import json
+import logging
+import os
+import tempfile
+import time
+
+# Directory holding one checkpoint file per job
+CHECKPOINT_DIR = os.environ.get('CHECKPOINT_DIR', '.checkpoints')
+
+# Create custom logger, handler, and formatter
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.DEBUG)
+
+class Checkpoint():
+  """
+  Checkpoint - Durable progress marker for a long-running job, stored as a small JSON file holding
+  the last key whose chunk was committed, the column(s) that key belongs to and the job's running counts.
+  Example:
+    checkpoint = Checkpoint('fix_reporting_dates_null')
+    state = checkpoint.load(key='id')
+    ...
+    checkpoint.save(last_id, key='id', updated=rows)
+    ...
+    checkpoint.clear()
+  """
+  def __init__(self, job, directory=CHECKPOINT_DIR):
+    self.job = job
+    self.path = os.path.join(directory, '{}.json'.format(job))
+
+  def load(self, key=None):
+    """
+    Load - Reads the saved state.
+    Arguments:
+      key [string or tuple]: column(s) the resuming run pages by; a checkpoint saved paging by other columns
+        is refused, since its last key cannot be bound to this run's query
+    Returns:
+      state (dict) -- {'last_key': ..., 'key': ..., 'counts': {...}, 'details': {...}, 'saved_at': ...},
+        or None when there is no checkpoint
+    """
+    try:
+      with open(self.path) as f:
+        state = json.load(f)
+    except FileNotFoundError:
+      return None
+    # checkpoints saved before the key was recorded always paged by id
+    state.setdefault('key', 'id')
+    state.setdefault('details', {})
+    if key is not None and _key_columns(state['key']) != _key_columns(key):
+      raise ValueError('the checkpoint of {} was saved paging by {}, not {}; resume it with the same options'
+        .format(self.job, state['key'], key))
+    LOGGER.info('resuming {} after key {}'.format(self.job, state['last_key']))
+    return state
+
+  def save(self, last_key, key='id', details=None, **counts):
+    """
+    Save - Atomically replaces the checkpoint, so a crash mid-write leaves the previous one intact.
+    Arguments:
+      last_key -- last key of the committed chunk; must be JSON serializable
+      key [string or tuple]: column(s) last_key belongs to
+      details [dict]: other JSON serializable state to restore on resume, e.g. a reconciliation report
+      counts -- running totals to restore on resume
+    """
+    write_json(self.path, {'last_key': last_key, 'key': key, 'counts': counts, 'details': details or {},
+      'saved_at': time.time()})
+
+  def clear(self):
+    """
+    Clear - Removes the checkpoint once the job has finished.
+    """
+    try:
+      os.remove(self.path)
+    except FileNotFoundError:
+      pass
+
+def write_json(path, data):
+  """
+  Write JSON - Atomically replaces a small JSON file: the data is written and synced to a temporary file
+  in the same directory first, so a crash mid-write leaves the previous file intact.
+  """
+  directory = os.path.dirname(path) or '.'
+  os.makedirs(directory, exist_ok=True)
+  fd, tmp = tempfile.mkstemp(dir=directory, prefix='.{}.'.format(os.path.basename(path)))
+  try:
+    with os.fdopen(fd, 'w') as f:
+      json.dump(data, f)
+      f.flush()
+      os.fsync(f.fileno())
+    os.replace(tmp, path)
+  except Exception:
+    os.remove(tmp)
+    raise
+
+def _key_columns(key):
+  # a composite key comes back from JSON as a list
+  return tuple(key) if isinstance(key, (list, tuple)) else key
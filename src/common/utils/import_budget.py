@@ -0,0 +1,71 @@
+import argparse
+import subprocess
+import sys
+
+# Modules whose import is deferred until a job touches the backend they serve
+DEFERRED = ('boto3', 'botocore', 'cassandra', 'ruamel', 'pymysql', 'cryptography')
+
+# Default budget, in milliseconds, for importing an entry point
+BUDGET_MS = 150
+
+# First Python version with `-X importtime`
+IMPORTTIME_VERSION = (3, 7)
+
+def main():
+  """ main
+  Checks the startup cost of entry points, e.g. `python -m common.utils.import_budget main jobs.cp_hyperlink_links`
+  from src/. Each module is imported in a fresh interpreter with `-X importtime`; the check fails when an import
+  takes longer than its budget or pulls in one of the DEFERRED backend modules. `-X importtime` needs Python 3.7
+  or later, so the check refuses to run on older interpreters instead of measuring nothing.
+  """
+  parser = argparse.ArgumentParser(description = "Import time budget for entry points")
+  parser.add_argument("modules", nargs = "+", help = "Modules to import, optionally with a budget: main or main=100")
+  parser.add_argument("--budget", help = "Default budget in milliseconds", type = float, default = BUDGET_MS)
+  args = parser.parse_args()
+  if sys.version_info < IMPORTTIME_VERSION:
+    parser.error('-X importtime needs Python {}.{} or later'.format(*IMPORTTIME_VERSION))
+
+  failed = False
+  for spec in args.modules:
+    module, _, budget = spec.partition('=')
+    budget = float(budget) if budget else args.budget
+    ms, loaded = import_time(module)
+    deferred = sorted(set(name.split('.')[0] for name in loaded) & set(DEFERRED))
+    ok = ms <= budget and not deferred
+    failed = failed or not ok
+    print('{:<30} {:>8.1f} ms  budget {:>6.0f} ms  {}{}'.format(module, ms, budget, 'ok' if ok else 'FAILED',
+      '  (imports {})'.format(', '.join(deferred)) if deferred else ''))
+  sys.exit(1 if failed else 0)
+
+def import_time(module):
+  """
+  Import Time - Imports a module in a fresh interpreter with `-X importtime`.
+  Returns:
+    ms [Float]: cumulative import time of the module
+    loaded (list) -- names of every module imported along with it
+  Raises:
+    Exception when the interpreter reports no import time for the module, e.g. before Python 3.7
+  """
+  result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)],
+    stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+  if result.returncode != 0:
+    raise Exception('failed to import {}: {}'.format(module, result.stderr.strip().splitlines()[-1]))
+  ms = None
+  loaded = []
+  for line in result.stderr.splitlines():
+    # import time: self [us] | cumulative | imported package
+    if not line.startswith('import time:') or '|' not in line:
+      continue
+    _, cumulative, name = line.split('|')
+    if not cumulative.strip().isdigit():
+      continue
+    loaded.append(name.strip())
+    if name.strip() == module:
+      ms = int(cumulative) / 1000
+  if ms is None:
+    raise Exception('no import time reported for {}; -X importtime needs Python {}.{} or later'.format(module,
+      *IMPORTTIME_VERSION))
+  return ms, loaded
+
+if __name__ == "__main__":
+  main()
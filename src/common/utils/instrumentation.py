@@ -0,0 +1,345 @@
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds, in milliseconds, of the latency histogram buckets; the last bucket is unbounded
+BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+# Longest statement text kept in records and summaries
+STATEMENT_LENGTH = 200
+
+# Whether the size of fetched rows is estimated by default; walking every fetched value is costly on large scans.
+# Read from the environment so spawned partition processes inherit it
+MEASURE_BYTES = os.environ.get('MEASURE_BYTES', '') == '1'
+
+# Create custom logger, handler, and formatter
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.DEBUG)
+
+# One structured record per statement, e.g. for a handler built by `json_handler`
+STATEMENT_LOGGER = logging.getLogger(__name__ + '.statements')
+STATEMENT_LOGGER.setLevel(logging.DEBUG)
+
+class StatementStats():
+  """
+  Statement Stats - Running totals and a latency histogram for one normalized statement.
+  """
+  __slots__ = ('backend', 'statement', 'count', 'errors', 'seconds', 'max_seconds', 'rows', 'bytes', 'histogram')
+
+  def __init__(self, backend, statement):
+    self.backend = backend
+    self.statement = statement
+    self.count = 0
+    self.errors = 0
+    self.seconds = 0.0
+    self.max_seconds = 0.0
+    self.rows = 0
+    self.bytes = 0
+    self.histogram = [0] * (len(BUCKETS_MS) + 1)
+
+  def add(self, seconds, rows, size, error):
+    self.count += 1
+    self.errors += error is not None
+    self.seconds += seconds
+    self.max_seconds = max(self.max_seconds, seconds)
+    self.rows += rows
+    self.bytes += size
+    self.histogram[bucket(seconds)] += 1
+
+class Timing():
+  """
+  Timing - A statement being timed by `Instrumentation.timed`; set `rows` and `bytes` before the block ends.
+  """
+  __slots__ = ('rows', 'bytes')
+
+  def __init__(self):
+    self.rows = 0
+    self.bytes = 0
+
+class Instrumentation():
+  """
+  Instrumentation - Collects the latency, rows and bytes of every statement the connectors run, keeps
+  per-statement totals and latency histograms, and passes each statement record to its listeners. No record
+  is built unless a listener is registered; `log_statement` logs records as structured fields on
+  STATEMENT_LOGGER, e.g. as JSON lines through `json_handler`.
+  Example:
+    instrumentation = get_instrumentation()
+    instrumentation.add_listener(log_statement)
+    ...
+    print(instrumentation.format_summary())
+  """
+  def __init__(self, log=False, measure_bytes=MEASURE_BYTES):
+    """
+    Arguments:
+      log (Boolean) -- whether every statement is logged on STATEMENT_LOGGER
+      measure_bytes (Boolean) -- whether the size of fetched rows is estimated; bytes stay 0 otherwise
+    """
+    self.measure_bytes = measure_bytes
+    self.listeners = [log_statement] if log else []
+    self.stats = {}
+    self._lock = threading.Lock()
+
+  def add_listener(self, listener):
+    """
+    Add Listener - Registers a callable receiving the record dict of every statement.
+    """
+    self.listeners.append(listener)
+
+  def record(self, backend, statement, seconds, rows=0, size=0, error=None):
+    """
+    Record - Adds one executed statement.
+    Arguments:
+      backend (string) -- where the statement ran, e.g. 'posts', 'collaborations' or 'links'
+      statement (string) -- statement text; normalized so repeated shapes share one entry
+      seconds [Float]: latency, including fetching the results
+      rows [Integer]: rows returned or affected
+      size [Integer]: estimated bytes returned
+      error [Exception]: the error the statement failed with, if any
+    """
+    statement = normalize(statement)
+    with self._lock:
+      stats = self.stats.get((backend, statement))
+      if stats is None:
+        stats = self.stats[(backend, statement)] = StatementStats(backend, statement)
+      stats.add(seconds, rows, size, error)
+    if self.listeners:
+      record = {'backend': backend, 'statement': statement, 'seconds': seconds, 'rows': rows, 'bytes': size,
+        'error': None if error is None else repr(error)}
+      for listener in self.listeners:
+        listener(record)
+
+  def merge(self, stats):
+    """
+    Merge - Adds statement totals collected elsewhere, e.g. by the worker processes of a partitioned job.
+    Arguments:
+      stats (iterable) -- StatementStats
+    """
+    with self._lock:
+      for other in stats:
+        key = (other.backend, other.statement)
+        mine = self.stats.get(key)
+        if mine is None:
+          mine = self.stats[key] = StatementStats(other.backend, other.statement)
+        mine.count += other.count
+        mine.errors += other.errors
+        mine.seconds += other.seconds
+        mine.max_seconds = max(mine.max_seconds, other.max_seconds)
+        mine.rows += other.rows
+        mine.bytes += other.bytes
+        mine.histogram = [a + b for a, b in zip(mine.histogram, other.histogram)]
+
+  @contextmanager
+  def timed(self, backend, statement):
+    """
+    Timed - Records the statement run in the `with` block, along with the error it raised, if any.
+    Returns:
+      context manager yielding a Timing
+    """
+    timing = Timing()
+    start = time.perf_counter()
+    try:
+      yield timing
+    except Exception as error:
+      self.record(backend, statement, time.perf_counter() - start, timing.rows, timing.bytes, error)
+      raise
+    self.record(backend, statement, time.perf_counter() - start, timing.rows, timing.bytes)
+
+  def histogram(self):
+    """
+    Histogram - Returns the number of statements per latency bucket across all statements.
+    Returns:
+      list of (bucket label, count)
+    """
+    with self._lock:
+      counts = [sum(column) for column in zip(*(s.histogram for s in self.stats.values()))]
+    counts = counts or [0] * (len(BUCKETS_MS) + 1)
+    return list(zip(bucket_labels(), counts))
+
+  def slowest(self, limit=10):
+    """
+    Slowest - Returns the statements that took the most time in total.
+    Returns:
+      list of StatementStats
+    """
+    with self._lock:
+      stats = list(self.stats.values())
+    return sorted(stats, key=lambda s: s.seconds, reverse=True)[:limit]
+
+  def format_summary(self, limit=10):
+    """
+    Format Summary - Renders the slowest statements and the latency histogram as a table.
+    """
+    lines = ['{:<14}  {:>8}  {:>6}  {:>10}  {:>9}  {:>9}  {:>10}  {:>12}  {}'.format(
+      'backend', 'count', 'errors', 'seconds', 'mean ms', 'max ms', 'rows', 'bytes', 'statement')]
+    for s in self.slowest(limit):
+      lines.append('{:<14}  {:>8}  {:>6}  {:>10.2f}  {:>9.1f}  {:>9.1f}  {:>10}  {:>12}  {}'.format(
+        s.backend, s.count, s.errors, s.seconds, 1000 * s.seconds / s.count, 1000 * s.max_seconds, s.rows, s.bytes,
+        s.statement))
+    lines.append('latency: ' + '  '.join('{} {}'.format(label, count) for label, count in self.histogram()))
+    return '\n'.join(lines)
+
+  def log_summary(self, limit=10):
+    """
+    Log Summary - Logs one structured record per slowest statement on STATEMENT_LOGGER, so the summary
+    reaches the same handler (e.g. the --metrics file) as the statement records.
+    """
+    for s in self.slowest(limit):
+      STATEMENT_LOGGER.info('statement summary', extra={'backend': s.backend, 'statement': s.statement, 'count': s.count,
+        'errors': s.errors, 'seconds': s.seconds, 'max_seconds': s.max_seconds, 'rows': s.rows, 'bytes': s.bytes,
+        'histogram': dict(zip(bucket_labels(), s.histogram))})
+
+class InstrumentedCursor():
+  """
+  Instrumented Cursor - Wraps a DB-API cursor and records each statement once its results have been fetched
+  (or the next statement starts), so the latency includes fetching and the rows returned are counted.
+  """
+  def __init__(self, cursor, instrumentation, backend):
+    self._cursor = cursor
+    self._instrumentation = instrumentation
+    self._backend = backend
+    self._statement = None
+
+  def execute(self, query, args=None):
+    return self._run(self._cursor.execute, query, args)
+
+  def executemany(self, query, args):
+    return self._run(self._cursor.executemany, query, args)
+
+  def fetchone(self):
+    return self._fetch(self._cursor.fetchone)
+
+  def fetchmany(self, size=None):
+    return self._fetch(lambda: self._cursor.fetchmany(size) if size is not None else self._cursor.fetchmany())
+
+  def fetchall(self):
+    return self._fetch(self._cursor.fetchall)
+
+  def close(self):
+    self._finish()
+    self._cursor.close()
+
+  def __iter__(self):
+    return iter(self.fetchone, None)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+  def __getattr__(self, name):
+    return getattr(self._cursor, name)
+
+  def _run(self, method, query, args):
+    self._finish()
+    start = time.perf_counter()
+    try:
+      affected = method(query, args)
+    except Exception as error:
+      self._instrumentation.record(self._backend, query, time.perf_counter() - start, error=error)
+      raise
+    # [statement, seconds, affected rows, fetched rows, bytes]
+    self._statement = [query, time.perf_counter() - start, affected or 0, 0, 0]
+    return affected
+
+  def _fetch(self, fetch):
+    start = time.perf_counter()
+    result = fetch()
+    if self._statement is not None:
+      self._statement[1] += time.perf_counter() - start
+      rows = [result] if isinstance(result, (tuple, dict)) else (result or ())
+      self._statement[3] += len(rows)
+      if self._instrumentation.measure_bytes:
+        self._statement[4] += row_bytes(rows)
+    return result
+
+  def _finish(self):
+    if self._statement is None:
+      return
+    query, seconds, affected, fetched, size = self._statement
+    self._statement = None
+    self._instrumentation.record(self._backend, query, seconds, fetched or affected, size)
+
+class InstrumentedConnection():
+  """
+  Instrumented Connection - Wraps a DB-API connection (e.g. pymysql) so every cursor it opens is instrumented.
+  Example:
+    ConnectionPool(lambda: InstrumentedConnection(connect_mysql(cnx), get_instrumentation(), 'posts'))
+  """
+  def __init__(self, cnx, instrumentation, backend):
+    self._cnx = cnx
+    self._instrumentation = instrumentation
+    self._backend = backend
+
+  def cursor(self, *args, **kwargs):
+    return InstrumentedCursor(self._cnx.cursor(*args, **kwargs), self._instrumentation, self._backend)
+
+  def __getattr__(self, name):
+    return getattr(self._cnx, name)
+
+_default = None
+_default_lock = threading.Lock()
+
+def get_instrumentation():
+  """
+  Get Instrumentation - Returns the process-wide Instrumentation shared by connectors created without one.
+  """
+  global _default
+  with _default_lock:
+    if _default is None:
+      _default = Instrumentation()
+    return _default
+
+def json_handler(stream):
+  """
+  JSON Handler - Returns a logging handler writing statement records to `stream` as JSON lines through
+  CustomJsonFormatter, e.g. STATEMENT_LOGGER.addHandler(json_handler(open('statements.jsonl', 'a'))).
+  """
+  # python-json-logger is only needed when records are written as JSON
+  from .custom_formatter import CustomJsonFormatter
+
+  handler = logging.StreamHandler(stream)
+  handler.setFormatter(CustomJsonFormatter('%(asctime)s %(levelname)s %(message)s'))
+  return handler
+
+def log_statement(record):
+  # skips building a LogRecord when no handler would receive it
+  if STATEMENT_LOGGER.hasHandlers():
+    STATEMENT_LOGGER.debug('statement', extra=record)
+
+def normalize(statement):
+  """
+  Normalize - Collapses whitespace, repeated placeholders and repeated UNION ALL rows, so statements of the
+  same shape (e.g. IN lists of different lengths) share one entry, and truncates the text.
+  """
+  if isinstance(statement, bytes):
+    statement = statement.decode('utf-8', 'replace')
+  statement = ' '.join(str(statement).split())
+  statement = re.sub(r'%s(?:\s*,\s*%s)+', '%s, ...', statement)
+  statement = re.sub(r'(?: UNION ALL SELECT %s, \.\.\.| UNION ALL SELECT %s)+', ' UNION ALL SELECT ...', statement)
+  if len(statement) > STATEMENT_LENGTH:
+    statement = statement[:STATEMENT_LENGTH - 3] + '...'
+  return statement
+
+def bucket(seconds):
+  ms = seconds * 1000
+  for i, bound in enumerate(BUCKETS_MS):
+    if ms <= bound:
+      return i
+  return len(BUCKETS_MS)
+
+def bucket_labels():
+  return ['<={}ms'.format(ms) for ms in BUCKETS_MS] + ['>{}ms'.format(BUCKETS_MS[-1])]
+
+def row_bytes(rows):
+  """
+  Row Bytes - Estimates the size of fetched rows: the length of string and binary values, 8 bytes otherwise.
+  """
+  size = 0
+  for row in rows:
+    for value in (row.values() if isinstance(row, dict) else row):
+      size += len(value) if isinstance(value, (str, bytes, bytearray)) else 8
+  return size
@@ -0,0 +1,120 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Create custom logger, handler, and formatter
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.DEBUG)
+
+class JobResult():
+  """
+  Job Result - Outcome of one job run: wall time, rows written and the error it failed with, if any.
+  """
+  def __init__(self, name, seconds, rows=0, error=None):
+    self.name = name
+    self.seconds = seconds
+    self.rows = rows
+    self.error = error
+
+class JobRegistry():
+  """
+  Job Registry - Maps CLI names to job functions along with the tables each job writes.
+  Jobs that write disjoint tables are independent and may run concurrently.
+  Example:
+    JOBS = JobRegistry()
+
+    @JOBS.register(writes=('posts',), partition=('posts', 'posts'))
+    def fix_reporting_dates_null(collabs_cnx, posts_cnx, key_range=None):
+      ...
+  """
+  def __init__(self):
+    self.jobs = {}
+    self.writes = {}
+    self.partitions = {}
+    self.bounds = {}
+
+  def register(self, name=None, writes=(), partition=None, bounds=None):
+    """
+    Register - Decorator adding a job under `name` (the function name by default).
+    Arguments:
+      name (string) -- CLI name of the job
+      writes (tuple) -- tables the job writes, used to keep conflicting jobs apart
+      partition (tuple) -- (database, table) whose integer `id` the job pages over, for jobs that accept a
+        key_range option and can be split into key ranges run in parallel
+      bounds (tuple) -- fixed (first, last) keys split into ranges instead of the table's smallest and largest
+        id, for jobs whose key_range is over something else, e.g. hash buckets
+    """
+    def decorator(fn):
+      key = name or fn.__name__
+      self.jobs[key] = fn
+      self.writes[key] = frozenset(writes)
+      if partition is not None:
+        self.partitions[key] = tuple(partition)
+      if bounds is not None:
+        self.bounds[key] = tuple(bounds)
+      return fn
+    return decorator
+
+  def get(self, name):
+    return self.jobs[name]
+
+  def names(self):
+    return sorted(self.jobs)
+
+  def schedule(self, names):
+    """
+    Schedule - Groups jobs, in order, into waves whose members write disjoint tables.
+    Returns:
+      list of lists of job names
+    """
+    waves = []
+    for name in names:
+      for wave in waves:
+        if all(self.writes[name].isdisjoint(self.writes[other]) for other in wave):
+          wave.append(name)
+          break
+      else:
+        waves.append([name])
+    return waves
+
+def run_jobs(registry, names, run, parallel=True):
+  """
+  Run Jobs - Runs the named jobs, concurrently within each wave of independent jobs when `parallel`
+  is set and one after another otherwise. A failing job is recorded and does not stop the others.
+  Arguments:
+    registry [JobRegistry]: registry holding the jobs
+    names (list) -- names of the jobs to run
+    run (callable) -- called with (name, job function); sets up whatever the job needs (e.g. its own
+      connections), runs it and returns the number of rows it wrote
+    parallel (Boolean) -- whether independent jobs run concurrently
+  Returns:
+    list of JobResult, in the order of `names`
+  """
+  def timed(name):
+    start = time.monotonic()
+    try:
+      rows = run(name, registry.get(name))
+      return JobResult(name, time.monotonic() - start, rows or 0)
+    except Exception as error:
+      LOGGER.error('job {} failed'.format(name), exc_info=True)
+      return JobResult(name, time.monotonic() - start, error=error)
+
+  results = {}
+  waves = registry.schedule(names) if parallel else [[name] for name in names]
+  for wave in waves:
+    with ThreadPoolExecutor(max_workers=len(wave)) as executor:
+      for result in executor.map(timed, wave):
+        results[result.name] = result
+  return [results[name] for name in names]
+
+def format_summary(results):
+  """
+  Format Summary - Renders job results as a table of status, wall time, rows and rows per second.
+  """
+  width = max([len('job')] + [len(r.name) for r in results])
+  lines = ['{:<{w}}  {:<6}  {:>10}  {:>10}  {:>10}'.format('job', 'status', 'seconds', 'rows', 'rows/sec', w=width)]
+  for r in results:
+    rate = r.rows / r.seconds if r.seconds > 0 else 0
+    status = 'ok' if r.error is None else 'failed'
+    lines.append('{:<{w}}  {:<6}  {:>10.2f}  {:>10}  {:>10.1f}'.format(r.name, status, r.seconds, r.rows, rate, w=width))
+  return '\n'.join(lines)
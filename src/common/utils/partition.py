@@ -0,0 +1,81 @@
+import logging
+import multiprocessing
+import time
+
+# Create custom logger, handler, and formatter
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.DEBUG)
+
+class PartitionResult():
+  """
+  Partition Result - Outcome of one key range of a partitioned job: wall time, rows written, the error it
+  failed with, if any, and the statement totals its process collected.
+  """
+  def __init__(self, key_range, seconds, rows=0, error=None, stats=()):
+    self.key_range = key_range
+    self.seconds = seconds
+    self.rows = rows
+    self.error = error
+    self.stats = list(stats)
+
+def key_ranges(low, high, parts):
+  """
+  Key Ranges - Splits the integer keys from `low` to `high` (inclusive) into at most `parts` contiguous,
+  half-open [start, end) ranges of nearly equal width.
+  Example: key_ranges(1, 10, 3) -> [(1, 4), (4, 7), (7, 11)]
+  Arguments:
+    low [Integer]: smallest key, or None when there are no rows
+    high [Integer]: largest key
+    parts [Integer]: number of ranges
+  Returns:
+    list of (start, end) tuples
+  """
+  if parts < 1:
+    raise ValueError('parts must be at least 1')
+  if low is None or high is None:
+    return []
+  count = high - low + 1
+  parts = min(parts, count)
+  bounds = [low + count * i // parts for i in range(parts + 1)]
+  return list(zip(bounds, bounds[1:]))
+
+def range_name(name, key_range):
+  """
+  Range Name - Names a job's key range, e.g. 'fix_reporting_dates_null.1-5000', so checkpoints, plans and
+  reports of partitions do not collide; the job name alone when there is no range.
+  """
+  if key_range is None:
+    return name
+  return '{}.{}-{}'.format(name, key_range[0], key_range[1])
+
+def run_partitions(run, ranges, processes=None):
+  """
+  Run Partitions - Runs `run(key_range)` for every key range in a pool of fresh (spawned) processes, so the
+  ranges use separate cores and separate database connections. A failing range is recorded and does not
+  stop the others.
+  Arguments:
+    run (callable) -- module-level function taking a key range and returning the number of rows written;
+      it is pickled into the worker processes
+    ranges (list) -- key ranges, e.g. from `key_ranges`
+    processes [Integer]: number of worker processes, one per range by default
+  Returns:
+    list of PartitionResult, in the order of `ranges`
+  """
+  if not ranges:
+    return []
+  context = multiprocessing.get_context('spawn')
+  with context.Pool(processes or len(ranges)) as pool:
+    return pool.starmap(_run_partition, [(run, tuple(key_range)) for key_range in ranges])
+
+def _run_partition(run, key_range):
+  from .instrumentation import get_instrumentation
+
+  start = time.monotonic()
+  try:
+    rows = run(key_range)
+    error = None
+  except Exception as err:
+    LOGGER.error('partition {} failed'.format(key_range), exc_info=True)
+    rows, error = 0, repr(err)
+  return PartitionResult(key_range, time.monotonic() - start, rows or 0, error,
+    get_instrumentation().stats.values())
@@ -0,0 +1,171 @@
+import gzip
+import json
+import logging
+import os
+import time
+import zlib
+from functools import partial
+
+# Default number of planned rows applied per bulk write
+APPLY_SIZE = 1000
+
+# Bytes read at a time when looking for the end of the last complete gzip member of a plan
+READ_SIZE = 1 << 16
+
+# zlib window bits accepting a gzip header and trailer
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+# Create custom logger, handler, and formatter
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.DEBUG)
+
+class PlanWriter():
+  """
+  Plan Writer - Streams computed changes into a compact change plan: a gzipped file of JSON lines where
+  a target line {"database": ..., "table": ..., "key": ..., "columns": [...]} is followed by one
+  [key, value, ...] array per row to update. The plan can be applied later with `apply_plan`.
+  Every `update` is written and synced as a complete gzip member starting with its target line, so a crash
+  can only leave a partial last member, which reopening the plan with append=True cuts off. A job saves
+  `offset` with its checkpoint and calls `truncate(offset)` when it resumes, dropping the rows planned
+  after its last checkpoint.
+  Example:
+    with PlanWriter('plans/fix_reporting_dates_null.plan.gz') as plan:
+      plan.update('posts', 'posts', 'id', ('reporting_end_time',), [(post_id, end_time), ...])
+  """
+  def __init__(self, path, append=False):
+    """
+    Arguments:
+      path (string) -- plan file to write
+      append (Boolean) -- add to an existing plan (e.g. when a job resumes) instead of replacing it
+    """
+    self.path = path
+    self.rows = 0
+    self.offset = 0
+    self._file = open(path, 'ab' if append else 'wb')
+    if append:
+      self.truncate(complete_length(path))
+
+  def update(self, database, table, key, columns, rows):
+    """
+    Update - Records (key, values...) rows to be applied to `table` with `bulk_update` as one gzip member,
+    synced to disk so everything recorded before a checkpoint survives a crash.
+    Arguments:
+      database (string) -- name of the database the table lives in, e.g. 'posts' or 'collaborations'
+      table (string) -- table to update
+      key (string) -- column identifying the rows to update
+      columns (tuple) -- columns to set, in the order their values follow the key in each row
+      rows (iterable) -- tuples of (key, value for each column)
+    Returns:
+      count [Integer]: number of rows recorded
+    """
+    lines = [_dumps(list(row)) for row in rows]
+    if not lines:
+      return 0
+    target = {'database': database, 'table': table, 'key': key, 'columns': list(columns)}
+    member = gzip.compress('\n'.join([_dumps(target)] + lines + ['']).encode('utf-8'))
+    self._file.write(member)
+    self._file.flush()
+    os.fsync(self._file.fileno())
+    self.offset += len(member)
+    self.rows += len(lines)
+    return len(lines)
+
+  def truncate(self, offset):
+    """
+    Truncate - Drops everything written after `offset`, e.g. the rows planned after the checkpoint a job
+    resumes from; they are planned again by the resumed job.
+    Arguments:
+      offset (Integer) -- length of the plan to keep, a value of `offset` saved earlier
+    """
+    self._file.truncate(offset)
+    self.offset = offset
+
+  def close(self):
+    self._file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+def complete_length(path, read_size=READ_SIZE):
+  """
+  Complete Length - Finds where the last complete gzip member of a plan ends, so a member cut short by
+  a crash can be dropped.
+  Arguments:
+    path (string) -- plan file written by PlanWriter
+    read_size [Integer]: bytes read at a time
+  Returns:
+    length (Integer)
+  """
+  length = 0
+  position = 0
+  member = zlib.decompressobj(GZIP_WBITS)
+  with open(path, 'rb') as f:
+    for block in iter(partial(f.read, read_size), b''):
+      while block:
+        try:
+          member.decompress(block)
+        except zlib.error:
+          return length
+        if not member.eof:
+          position += len(block)
+          break
+        position += len(block) - len(member.unused_data)
+        length = position
+        block = member.unused_data
+        member = zlib.decompressobj(GZIP_WBITS)
+  return length
+
+def _dumps(value):
+  return json.dumps(value, separators=(',', ':'), default=str)
+
+def read_plan(path, size=APPLY_SIZE):
+  """
+  Read Plan - Streams a change plan back in batches of at most `size` rows for a single target.
+  Arguments:
+    path (string) -- plan file written by PlanWriter
+    size [Integer]: maximum number of rows per batch
+  Returns:
+    generator of (target dict, list of row tuples)
+  """
+  target = None
+  batch = []
+  with gzip.open(path, 'rt', encoding='utf-8') as f:
+    for line in f:
+      value = json.loads(line)
+      if isinstance(value, dict):
+        # every member repeats its target; only a change of target ends a batch
+        if value != target and batch:
+          yield target, batch
+          batch = []
+        target = value
+        continue
+      batch.append(tuple(value))
+      if len(batch) >= size:
+        yield target, batch
+        batch = []
+  if batch:
+    yield target, batch
+
+def apply_plan(path, connectors, size=APPLY_SIZE, pause=0):
+  """
+  Apply Plan - Streams a change plan into bulk updates, optionally pausing between batches to
+  throttle the write load.
+  Arguments:
+    path (string) -- plan file written by PlanWriter
+    connectors (dict) -- connector with a `bulk_update` method for each database named in the plan
+    size [Integer]: maximum number of rows per bulk update
+    pause [Float]: seconds to sleep after each batch
+  Returns:
+    affected [Integer]: number of rows changed
+  """
+  affected = 0
+  for target, rows in read_plan(path, size=size):
+    cnx = connectors[target['database']]
+    affected += cnx.bulk_update(target['table'], target['key'], target['columns'], rows, size=size)
+    LOGGER.debug('applied {} rows to {} from {}'.format(len(rows), target['table'], path))
+    if pause:
+      time.sleep(pause)
+  return affected
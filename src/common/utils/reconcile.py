@@ -0,0 +1,180 @@
+import json
+import logging
+import os
+
+# Directory holding one reconciliation report per job
+REPORT_DIR = os.environ.get('REPORT_DIR', '.reports')
+
+# Number of unmatched keys kept from each side as examples in a report
+SAMPLE_SIZE = 20
+
+# Ways two key streams can be compared:
+# hash - holds the distinct keys of both inputs in sets; inputs may be in any order
+# merge - walks two inputs sorted ascending side by side; holds no keys at all
+MODES = ('hash', 'merge')
+
+# Create custom logger, handler, and formatter
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.DEBUG)
+
+class Reconciliation():
+  """
+  Reconciliation - Compares key streams from two sources (e.g. post ids from posts and from obligations)
+  and keeps the number of distinct keys found on both sides, only on the left and only on the right, plus
+  a bounded sample of the unmatched keys. `compare` can be called once per chunk so the memory used is
+  bounded by the chunk size, not by the size of the tables.
+  Example:
+    reconciliation = Reconciliation('fix_reporting_dates_null', left='posts', right='obligations')
+    for chunk in chunks:
+      reconciliation.compare(post_ids, obligation_post_ids)
+    reconciliation.write()
+  """
+  def __init__(self, name, left='left', right='right', mode='hash', samples=SAMPLE_SIZE):
+    """
+    Arguments:
+      name (string) -- name of the report, e.g. the job name
+      left (string) -- label of the left key source
+      right (string) -- label of the right key source
+      mode (string) -- one of MODES
+      samples [Integer]: maximum number of unmatched keys kept from each side
+    """
+    if mode not in MODES:
+      raise ValueError('reconciliation mode must be one of {}'.format(MODES))
+    self.name = name
+    self.left = left
+    self.right = right
+    self.mode = mode
+    self.samples = samples
+    self.matched = 0
+    self.left_only = 0
+    self.right_only = 0
+    self.left_samples = []
+    self.right_samples = []
+
+  def compare(self, left, right):
+    """
+    Compare - Adds the comparison of two key iterables to the counts. In 'merge' mode both must be
+    sorted ascending.
+    Returns:
+      self [Reconciliation]
+    """
+    pairs = merge_compare(left, right) if self.mode == 'merge' else hash_compare(left, right)
+    for key, side in pairs:
+      if side == 'both':
+        self.matched += 1
+      elif side == 'left':
+        self.left_only += 1
+        if len(self.left_samples) < self.samples:
+          self.left_samples.append(key)
+      else:
+        self.right_only += 1
+        if len(self.right_samples) < self.samples:
+          self.right_samples.append(key)
+    return self
+
+  def report(self):
+    """
+    Report - Returns the counts and samples as a JSON serializable dict.
+    """
+    return {
+      'name': self.name,
+      'mode': self.mode,
+      'left': self.left,
+      'right': self.right,
+      'matched': self.matched,
+      'left_only': self.left_only,
+      'right_only': self.right_only,
+      'samples': {'left_only': self.left_samples, 'right_only': self.right_samples}
+    }
+
+  def restore(self, report):
+    """
+    Restore - Continues from the counts and samples of an earlier report, e.g. one saved in a checkpoint.
+    Arguments:
+      report (dict) -- as returned by `report`; None restores nothing
+    Returns:
+      self [Reconciliation]
+    """
+    if report:
+      self.matched = report['matched']
+      self.left_only = report['left_only']
+      self.right_only = report['right_only']
+      self.left_samples = list(report['samples']['left_only'])
+      self.right_samples = list(report['samples']['right_only'])
+    return self
+
+  def summary(self):
+    return '{} {}: {} matched, {} only in {}, {} only in {}'.format(self.name, self.mode, self.matched,
+      self.left_only, self.left, self.right_only, self.right)
+
+  def write(self, path=None):
+    """
+    Write - Writes the report as JSON to `path`, by default REPORT_DIR/<name>.reconcile.json.
+    Returns:
+      path (string) -- the report file written
+    """
+    path = path or os.path.join(REPORT_DIR, '{}.reconcile.json'.format(self.name))
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+      json.dump(self.report(), f, indent=2, default=str)
+    LOGGER.info('{} (report: {})'.format(self.summary(), path))
+    return path
+
+def hash_compare(left, right):
+  """
+  Hash Compare - Matches two key iterables in any order through sets of their distinct keys.
+  Returns:
+    generator of (key, 'both' | 'left' | 'right') for every distinct key
+  """
+  unmatched = set(right)
+  seen = set()
+  for key in left:
+    if key in seen:
+      continue
+    seen.add(key)
+    if key in unmatched:
+      unmatched.discard(key)
+      yield key, 'both'
+    else:
+      yield key, 'left'
+  for key in unmatched:
+    yield key, 'right'
+
+def merge_compare(left, right):
+  """
+  Merge Compare - Matches two key iterables sorted ascending by walking them side by side, without
+  holding either in memory.
+  Returns:
+    generator of (key, 'both' | 'left' | 'right') for every distinct key
+  """
+  left = _distinct(left)
+  right = _distinct(right)
+  end = object()
+  l = next(left, end)
+  r = next(right, end)
+  while l is not end and r is not end:
+    if l == r:
+      yield l, 'both'
+      l = next(left, end)
+      r = next(right, end)
+    elif l < r:
+      yield l, 'left'
+      l = next(left, end)
+    else:
+      yield r, 'right'
+      r = next(right, end)
+  while l is not end:
+    yield l, 'left'
+    l = next(left, end)
+  while r is not end:
+    yield r, 'right'
+    r = next(right, end)
+
+def _distinct(keys):
+  # drops consecutive duplicates from a sorted iterable
+  end = object()
+  last = end
+  for key in keys:
+    if key != last:
+      yield key
+      last = key
@@ -0,0 +1,219 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from .ssm_parameter_store import SSMParameterStore, SSMParameterStoreError
+
+# Environment vars
+ENV = os.environ.get('ENV', 'dev')
+AWS_DEFAULT_REGION = os.environ.get('AWS_DEFAULT_REGION', "us-east-1")
+
+# Optional encrypted file cache of SSM parameters shared by short-lived processes
+SSM_CACHE_PATH = os.environ.get('SSM_CACHE_PATH', None)
+SSM_CACHE_KEY = os.environ.get('SSM_CACHE_KEY', None)  # Fernet key, see FileCache
+SSM_CACHE_TTL = int(os.environ.get('SSM_CACHE_TTL', 15 * 60))  # seconds a cached parameter is served
+
+# Create custom logger, handler, and formatter
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.DEBUG)
+
+class FileCache():
+  """
+  File Cache - Parameter values stored on disk encrypted with a Fernet key, so secrets such as database
+  passwords are never written in clear text. Each value expires `ttl` seconds after it was fetched.
+  Requires the optional `cryptography` package; a key can be generated with
+    python -c "from cryptography.fernet import Fernet; print(Fernet.generate_key().decode())"
+  """
+  def __init__(self, path, key, ttl=SSM_CACHE_TTL):
+    """
+    Arguments:
+      path (string) -- cache file; created if missing
+      key (string) -- Fernet key the file is encrypted with
+      ttl [Integer]: seconds a cached parameter is served
+    """
+    try:
+      from cryptography.fernet import Fernet
+    except ImportError:
+      raise Exception('the SSM file cache requires the cryptography package')
+    if not key:
+      raise Exception('the SSM file cache requires an encryption key (SSM_CACHE_KEY)')
+    self.path = path
+    self.ttl = ttl
+    self._fernet = Fernet(key.encode() if isinstance(key, str) else key)
+
+  def load(self):
+    """
+    Load - Reads the unexpired parameters.
+    Returns:
+      params (dict) -- {name: (value, fetched_at)}; empty when the file is missing, expired or unreadable
+    """
+    from cryptography.fernet import InvalidToken
+    try:
+      with open(self.path, 'rb') as f:
+        entries = json.loads(self._fernet.decrypt(f.read()).decode('utf-8'))
+    except FileNotFoundError:
+      return {}
+    except (InvalidToken, ValueError):
+      LOGGER.warning('ignoring unreadable SSM cache {}'.format(self.path))
+      return {}
+    now = time.time()
+    return {name: tuple(entry) for name, entry in entries.items() if entry[1] + self.ttl > now}
+
+  def save(self, params):
+    """
+    Save - Atomically replaces the file with the given {name: (value, fetched_at)} parameters.
+    """
+    directory = os.path.dirname(self.path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    token = self._fernet.encrypt(json.dumps(params).encode('utf-8'))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.ssm.')
+    try:
+      with os.fdopen(fd, 'wb') as f:
+        f.write(token)
+      os.chmod(tmp, 0o600)
+      os.replace(tmp, self.path)
+    except Exception:
+      os.remove(tmp)
+      raise
+
+class CachedParameterStore():
+  """
+  Cached Parameter Store - Wraps SSMParameterStore with an in-process memo and an optional encrypted file
+  cache, so parameters are requested from SSM at most once per process and, with a file cache, at most once
+  per TTL across processes. Misses are fetched in batches of 10 names per call.
+  Example:
+    store = CachedParameterStore('dev', region_name='us-east-1')
+    store.prefetch(['/rds/collaboration-service/host', '/rds/rs-post-service/host'])
+    host = store.fetch('/rds/collaboration-service/host')
+  """
+  def __init__(self, env, cache=None, **kwargs):
+    """
+    Arguments:
+      env (string) -- environment prefix of the parameters
+      cache [FileCache]: optional file cache shared between processes
+      kwargs -- passed to the boto3 SSM client, e.g. region_name
+    """
+    self._env = env
+    self._cache = cache
+    self._kwargs = kwargs
+    self._store = None
+    self._params = cache.load() if cache is not None else {}
+    self._paths = {}
+    self._lock = threading.Lock()
+    self.requests = 0
+
+  def fetch(self, key, required=True):
+    """
+    Fetch - Returns a single parameter, or None when it is missing and not required.
+    """
+    return self.fetch_many(required=[key] if required else None, optional=None if required else [key]).get(key)
+
+  def fetch_many(self, required=None, optional=None):
+    """
+    Fetch Many - Returns the named parameters, fetching from SSM only the ones not cached yet.
+    Arguments:
+      required (list) -- required parameters
+      optional (list) -- optional parameters
+    Raises:
+      SSMParameterStoreError -- when a required parameter is missing
+    Returns:
+      params (dict) -- the parameters found
+    """
+    required = list(required or [])
+    optional = list(optional or [])
+    keys = required + optional
+    if not keys:
+      raise ValueError('No parameters specified')
+    with self._lock:
+      self.prefetch(keys, _locked=True)
+      params = {key: self._params[key][0] for key in keys if key in self._params}
+    missing = [key for key in required if key not in params]
+    if missing:
+      raise SSMParameterStoreError('Required parameters not found in {}: {}'.format(self._env, missing))
+    return params
+
+  def fetch_path(self, path, recursive=True):
+    """
+    Fetch Path - Returns every parameter below a path, fetched with get_parameters_by_path once per process.
+    The names found below the path are memoized in memory only; the file cache keeps their values, which
+    later fetch and fetch_many calls are served from, but a new process lists the path again.
+    """
+    with self._lock:
+      names = self._paths.get((path, recursive))
+      if names is not None and all(name in self._params for name in names):
+        return {name: self._params[name][0] for name in names}
+      params = self._ssm().fetch_path(path, recursive=recursive)
+      self.requests += 1
+      self._paths[(path, recursive)] = list(params)
+      self._remember(params)
+    return params
+
+  def prefetch(self, keys, _locked=False):
+    """
+    Prefetch - Fetches the uncached parameters among `keys` in as few batched calls as possible, e.g. every
+    parameter of every connector at startup.
+    """
+    if not _locked:
+      with self._lock:
+        return self.prefetch(keys, _locked=True)
+    misses = sorted(set(key for key in keys if key not in self._params))
+    if not misses:
+      return
+    LOGGER.info('requesting {} SSM params from store'.format(len(misses)))
+    params = self._ssm().fetch_many(optional=misses)
+    self.requests += (len(misses) + 9) // 10
+    self._remember(params)
+
+  def _remember(self, params):
+    now = time.time()
+    for name, value in params.items():
+      self._params[name] = (value, now)
+    if self._cache is not None and params:
+      self._cache.save(self._params)
+
+  def _ssm(self):
+    # creating the boto3 client is slow, so it is only done on the first miss
+    if self._store is None:
+      self._store = SSMParameterStore(self._env, **self._kwargs)
+    return self._store
+
+_default_store = None
+_default_lock = threading.Lock()
+
+# Parameters of every connector module imported so far, prefetched together on the first load
+_registered = []
+
+def parameter_store():
+  """
+  Parameter Store - Returns the process-wide CachedParameterStore for ENV, with the file cache enabled
+  when SSM_CACHE_PATH is set.
+  """
+  global _default_store
+  with _default_lock:
+    if _default_store is None:
+      cache = FileCache(SSM_CACHE_PATH, SSM_CACHE_KEY) if SSM_CACHE_PATH else None
+      _default_store = CachedParameterStore(ENV, cache=cache, region_name=AWS_DEFAULT_REGION)
+    return _default_store
+
+def register_params(keys):
+  """
+  Register Params - Declares parameters a module loads from SSM so the first `load_params` call in the
+  process fetches them together with its own.
+  Returns:
+    keys (list)
+  """
+  keys = list(keys)
+  _registered.extend(key for key in keys if key not in _registered)
+  return keys
+
+def load_params(keys):
+  """
+  Load Params - Returns the required parameters `keys`, prefetching every registered parameter in the same
+  batched pass when they are not cached yet.
+  """
+  store = parameter_store()
+  store.prefetch(_registered + list(keys))
+  return store.fetch_many(required=list(keys))
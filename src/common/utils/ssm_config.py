@@ -7,10 +7,9 @@ from pathlib import *
 from typing import Any, Optional, Type
 from http.client import HTTPConnection
 
-from ..utils.ssm_parameter_store import SSMParameterStore
+from ..utils.ssm_cache import load_params
 from ..utils.typing import OptionalDict
 
-from ruamel.yaml import YAML
 import requests
 
 # Environment vars
@@ -28,14 +27,15 @@ HYPERLINK_SERVICE_API_HOST = os.environ.get('HYPERLINK_SERVICE_API_HOST', None)
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.DEBUG)
 
-# Prepare reading YAML files into streams
-yaml = YAML()
-
 def load_ssm_config(path):
   """load_ssm_config
   Reads SSM configuration from provided YAML file.
   This file should be available in lambda_function/ during the build.
   """
+  # ruamel.yaml is only imported when a configuration is loaded
+  from ruamel.yaml import YAML
+  yaml = YAML()
+
   params = {}
   try:
     if path:
@@ -57,10 +57,7 @@ def load_ssm_config(path):
   # If the environment is not local, load the params from SSM
   if os.environ.get('AWS_SAM_LOCAL', False) is False:
     LOGGER.info('requesting SSM params from store')
-    param_store = SSMParameterStore(ENV, region_name=AWS_DEFAULT_REGION)
-    response = param_store.fetch_many(
-        required=list(params.values())
-    )
+    response = load_params(list(params.values()))
     values = list(response.values())
     return {
       "COLLABS_SERVICE_API_HOST": values[0],
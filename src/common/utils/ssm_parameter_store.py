@@ -1,5 +1,3 @@
-import boto3
-
 
 class SSMParameterStoreError(Exception):
     pass
@@ -11,6 +9,9 @@ class SSMParameterStore:
     """
 
     def __init__(self, env, **kwargs):
+        # boto3 takes a while to import, so it is only loaded once a store is needed
+        import boto3
+
         self._env = env
         self._ssm = boto3.client('ssm', **kwargs)
 
@@ -88,4 +89,29 @@ class SSMParameterStore:
                 f'Required parameters not found in {self._env}: {missing_required}'
             )
 
-        return params 
\ No newline at end of file
+        return params
+
+    def fetch_path(self, path, recursive=True):
+        """Fetches every parameter below a path, up to 10 per call.
+        Arguments:
+            path {str} -- The path of the parameters, e.g. '/rds/collaboration-service'.
+            recursive {bool} -- Whether or not to include parameters in nested paths.
+        Returns:
+            dict: The parameters found in SSM.
+        Examples:
+            >>> param_store = SSMParameterStore('dev')
+            >>> params = param_store.fetch_path('/rds/collaboration-service')
+        """
+
+        params = {}
+        paginator = self._ssm.get_paginator('get_parameters_by_path')
+        pages = paginator.paginate(
+            Path=f'/{self._env}{path}', Recursive=recursive, WithDecryption=True
+        )
+
+        for page in pages:
+            for param in page['Parameters']:
+                name = param['Name'][len(self._env)+1:]
+                params[name] = param['Value']
+
+        return params
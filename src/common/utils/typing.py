@@ -10,19 +10,11 @@ OptionalJsonType = Optional[JsonType]
 
 class Map(dict):
     """
+    Dict with attribute access to its keys. Values are stored once, in the dict itself.
     Example:
     m = Map({'first_name': 'Eduardo'}, last_name='Pool', age=24, sports=['Soccer'])
     """
-    def __init__(self, *args, **kwargs):
-        super(Map, self).__init__(*args, **kwargs)
-        for arg in args:
-            if isinstance(arg, dict):
-                for k, v in arg.items():
-                    self[k] = v
-
-        if kwargs:
-            for k, v in kwargs.items():
-                self[k] = v
+    __slots__ = ()
 
     def __getattr__(self, attr):
         return self.get(attr)
@@ -30,13 +22,5 @@ class Map(dict):
     def __setattr__(self, key, value):
         self.__setitem__(key, value)
 
-    def __setitem__(self, key, value):
-        super(Map, self).__setitem__(key, value)
-        self.__dict__.update({key: value})
-
     def __delattr__(self, item):
-        self.__delitem__(item)
-
-    def __delitem__(self, key):
-        super(Map, self).__delitem__(key)
-        del self.__dict__[key]
\ No newline at end of file
+        self.__delitem__(item)
\ No newline at end of file
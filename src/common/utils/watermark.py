@@ -0,0 +1,76 @@
+import json
+import logging
+import os
+import time
+
+from .checkpoint import write_json
+
+# Directory holding one watermark file per job
+WATERMARK_DIR = os.environ.get('WATERMARK_DIR', '.watermarks')
+
+# Create custom logger, handler, and formatter
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.DEBUG)
+
+class Watermark():
+  """
+  Watermark - High-water mark of a recurring job: the (timestamp column, id) position of the last row its
+  last successful run processed, stored as a small JSON file. The next run only scans rows past it, paging
+  on the composite key so rows sharing a timestamp are neither skipped nor repeated. A run may also re-scan
+  rows before the watermark (see WATERMARK_LOOKBACK in main), so saving never moves it back.
+  Example:
+    watermark = Watermark('fix_posts_without_obligations_by_url', 'date_submitted')
+    rows = cnx.stream(query, key=watermark.key, after=watermark.load())
+    ...
+    watermark.save(watermark.position(last_row))
+  """
+  def __init__(self, job, column, tiebreaker='id', directory=WATERMARK_DIR):
+    """
+    Arguments:
+      job (string) -- name of the job
+      column (string) -- DATETIME or TIMESTAMP column advanced by the changes the job looks for, e.g. modified_at
+      tiebreaker (string) -- unique column ordering rows with the same timestamp
+      directory (string) -- where the watermark file is kept
+    """
+    self.job = job
+    self.column = column
+    self.key = (column, tiebreaker)
+    self.path = os.path.join(directory, '{}.json'.format(job))
+
+  def load(self):
+    """
+    Load - Reads the position saved by the last successful run.
+    Returns:
+      position (tuple) -- (timestamp, id), or None when the job has not completed a run yet
+    """
+    position = self._read()
+    if position is not None:
+      LOGGER.info('scanning {} after {} {}'.format(self.job, self.key, position))
+    return position
+
+  def save(self, position):
+    """
+    Save - Atomically replaces the watermark; call once the run has committed every row up to `position`.
+    A position before the saved one, e.g. of a re-scanned row, is ignored.
+    Arguments:
+      position (tuple) -- (timestamp, id) of the last processed row, e.g. from `position`
+    """
+    current = self._read()
+    if current is not None and tuple(position) <= current:
+      return
+    write_json(self.path, {'position': list(position), 'saved_at': time.time()})
+
+  def position(self, row):
+    """
+    Position - Returns the JSON-serializable (timestamp, id) of a dict or record row; timestamps become
+    'YYYY-MM-DD HH:MM:SS[.ffffff]' strings, which MySQL compares as DATETIME values.
+    """
+    values = [row[name] if isinstance(row, dict) else getattr(row, name) for name in self.key]
+    return tuple(v.isoformat(' ') if hasattr(v, 'isoformat') else v for v in values)
+
+  def _read(self):
+    try:
+      with open(self.path) as f:
+        return tuple(json.load(f)['position'])
+    except FileNotFoundError:
+      return None
@@ -7,24 +7,45 @@ import sys
 import traceback
 import uuid
 import requests
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
 
 from common.api.hyperlink_client import HyperlinkClient
-from common.db.links_connector import LinksConnector
+from common.api.response_cache import ResponseCache
+from common.db.links_connector import CONCURRENCY, LinksConnector
 from common.db.posts_connector import PostConnector
+from common.db.query import batches
+from common.utils.instrumentation import get_instrumentation
 
 # Create custom logger, handler, and formatter
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.DEBUG)
 
+# Number of Hyperlink API requests kept in flight
+FETCH_WORKERS = 8
+
+# Number of post ids whose links are looked up per query in bulk mode
+POST_BATCH = 500
+
+# What each line of a bulk input file holds
+INPUT_TYPES = ('links', 'posts')
+
 def main():
   """ main
   Given an rstyle link as a client argument, request the link data from Hyperlink API (in prod)
   and save this data to QA Cassandra `links` table.
+  With --file, links (or with --input-type posts, post ids) are read one per line from a file, or from stdin
+  for `--file -`, and copied through one set of clients, e.g.
+    cut -f1 post_ids.tsv | python src/jobs/cp_hyperlink_links.py --file - --input-type posts
   """
   parser = argparse.ArgumentParser(description = "Command arguments for cp_hyperlink_links")
   parser.add_argument("-c", "--config", help = "Path for config JSON file", required = False, default = "")
   parser.add_argument("-l", "--link", help = "Unencrypted rstyle link url", required = False, default = "")
   parser.add_argument("-p", "--post", help = "Post identifier", required = False, default = "")
+  parser.add_argument("-f", "--file", help = "File with one link or post id per line; - reads stdin", required = False, default = "")
+  parser.add_argument("--input-type", help = "What each line of --file holds", choices = INPUT_TYPES, default = "links")
+  parser.add_argument("-w", "--workers", help = "Number of concurrent Hyperlink requests", required = False, type = int, default = FETCH_WORKERS)
+  parser.add_argument("--cache", help = "Path for a local Hyperlink response cache", required = False, default = "")
   args = parser.parse_args()
 
   if args.config:
@@ -36,30 +57,152 @@ def main():
   
   # main logic
   try:
-    hyperlink = HyperlinkClient()
-    posts_cnx = PostConnector()
+    cache = ResponseCache(args.cache) if args.cache else None
+    hyperlink = HyperlinkClient(cache=cache, pool_maxsize=args.workers)
     links_cnx = LinksConnector()
 
     if args.post:
+      posts_cnx = PostConnector()
       links = posts_cnx.get_rstyle_links_for_post_id(args.post)
       if len(links) == 0:
         print('no links found for post id {} \n'.format(args.post))
       else:
         print('found {} links for post id {} \n'.format(links, args.post))
-      for val in links:
-        link = hyperlink.get_link(val['url'])
-        print('response {} from hyperlink \n', link)
-        links_cnx.add_link(link)
-        print('successfully added link {} to QA environment \n'.format(val))
+      copied, failures = copy_links([val['url'] for val in links], hyperlink, links_cnx, workers=args.workers)
+      print('copied {} of {} links for post id {} \n'.format(copied, len(links), args.post))
+      for url, error in failures:
+        print('failed to copy link {}: {} \n'.format(url, error))
     
     elif args.link:
       link = hyperlink.get_link(args.link)
       links_cnx.add_link(link)
 
+    elif args.file:
+      posts_cnx = PostConnector() if args.input_type == 'posts' else None
+      stream = sys.stdin if args.file == '-' else open(args.file)
+      try:
+        counts, failures = copy_bulk(read_items(stream), args.input_type, hyperlink, links_cnx, posts_cnx,
+          workers=args.workers)
+      finally:
+        if stream is not sys.stdin:
+          stream.close()
+      for url, error in failures:
+        print('failed to copy link {}: {} \n'.format(url, error))
+      if args.input_type == 'posts':
+        print('read {} post ids, {} without links \n'.format(counts['posts'], counts['posts_without_links']))
+      print('copied {} links, skipped {}, failed {} \n'.format(counts['copied'], counts['skipped'], counts['failed']))
+
+    if cache is not None:
+      print('hyperlink cache {} \n'.format(cache.stats()))
+      cache.close()
+    print(get_instrumentation().format_summary())
+
   except Exception as error:
-    print('error in main loop {}'.format(error), exc_info=True)
+    LOGGER.error('error in main loop {}'.format(error), exc_info=True)
 
   print("finished")
 
+def copy_links(urls, hyperlink, links_cnx, workers=FETCH_WORKERS, concurrency=CONCURRENCY):
+  """
+  Copy Links - Requests each rstyle link from the Hyperlink API on a pool of `workers` threads and
+  streams the responses into the Cassandra `links` table as they complete, with up to `concurrency`
+  async inserts in flight (see LinksConnector.add_links). New requests are only started as responses
+  are handed to the writes, so at most 2 * `workers` links are fetched but not yet being saved.
+  A failed link is logged and reported without aborting the rest of the batch.
+  Arguments:
+    urls (iterable) -- rstyle link urls to copy
+    hyperlink [HyperlinkClient]: client for the Hyperlink API
+    links_cnx [LinksConnector]: connector for the Cassandra links table
+    workers [Integer]: number of concurrent Hyperlink requests
+    concurrency [Integer]: number of concurrent Cassandra inserts
+  Returns:
+    copied [Integer]: number of links saved
+    failures (list of tuples) -- (url, exception) for every link that could not be copied
+  """
+  failures = []
+
+  def fetched():
+    urls_left = iter(urls)
+    pending = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+      def submit(count):
+        for url in islice(urls_left, count):
+          pending[executor.submit(hyperlink.get_link, url)] = url
+
+      submit(2 * workers)
+      while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+          url = pending.pop(future)
+          try:
+            link = future.result()
+          except Exception as error:
+            LOGGER.error('failed to fetch link {}'.format(url), exc_info=True)
+            failures.append((url, error))
+            continue
+          yield link
+        submit(len(done))
+
+  copied, write_failures = links_cnx.add_links(fetched(), concurrency=concurrency)
+  return copied, failures + write_failures
+
+def copy_bulk(items, input_type, hyperlink, links_cnx, posts_cnx=None, workers=FETCH_WORKERS):
+  """
+  Copy Bulk - Copies the links named by a stream of input items, through the same clients and with at most
+  2 * `workers` links in flight (see copy_links). Links repeated in the input, or shared by several posts,
+  are copied once and counted as skipped.
+  Arguments:
+    items (iterable) -- rstyle link urls, or post ids when input_type is 'posts'
+    input_type (string) -- one of INPUT_TYPES
+    hyperlink [HyperlinkClient]: client for the Hyperlink API
+    links_cnx [LinksConnector]: connector for the Cassandra links table
+    posts_cnx [PostConnector]: connector for the posts database, needed for post ids
+    workers [Integer]: number of concurrent Hyperlink requests
+  Returns:
+    counts (dict) -- posts, posts_without_links, copied, skipped and failed
+    failures (list of tuples) -- (url, exception) for every link that could not be copied
+  """
+  if input_type not in INPUT_TYPES:
+    raise ValueError('input type must be one of {}'.format(INPUT_TYPES))
+  counts = {'posts': 0, 'posts_without_links': 0, 'copied': 0, 'skipped': 0, 'failed': 0}
+  urls = post_link_urls(items, posts_cnx, counts) if input_type == 'posts' else items
+
+  def distinct(urls):
+    seen = set()
+    for url in urls:
+      if url in seen:
+        counts['skipped'] += 1
+        continue
+      seen.add(url)
+      yield url
+
+  counts['copied'], failures = copy_links(distinct(urls), hyperlink, links_cnx, workers=workers)
+  counts['failed'] = len(failures)
+  return counts, failures
+
+def post_link_urls(post_ids, posts_cnx, counts):
+  """
+  Post Link Urls - Yields the rstyle link urls of a stream of post ids, looked up POST_BATCH posts per query.
+  """
+  for batch in batches(post_ids, POST_BATCH):
+    found = set()
+    for row in posts_cnx.get_rstyle_links_for_post_ids(batch):
+      found.add(str(row['post_id']))
+      yield row['url']
+    missing = [post_id for post_id in batch if post_id not in found]
+    for post_id in missing:
+      print('no links found for post id {} \n'.format(post_id))
+    counts['posts'] += len(batch)
+    counts['posts_without_links'] += len(missing)
+
+def read_items(stream):
+  """
+  Read Items - Yields the stripped, non-blank lines of a file, skipping # comments.
+  """
+  for line in stream:
+    item = line.strip()
+    if item and not item.startswith('#'):
+      yield item
+
 if __name__ == "__main__":
   main()
\ No newline at end of file
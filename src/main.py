@@ -6,26 +6,110 @@ import re
 import sys
 import traceback
 import uuid
-import requests
+import time
 from datetime import timedelta
-
-from common.db.collabs_connector import *
-from common.db.posts_connector import *
+from functools import partial
+
+from common.db.collabs_connector import CollabsConnector
+from common.db.posts_connector import PostConnector
+from common.db.join import HashJoin, temp_join
+from common.db.query import batches, quote_name, select_in, select_sql
+from common.db.throttle import MAX_LAG, AdaptiveBatcher, HeartbeatProbe, ReplicaStatusProbe
+from common.utils.checkpoint import Checkpoint
+from common.utils.instrumentation import STATEMENT_LOGGER, get_instrumentation, json_handler, log_statement
+from common.utils.job_runner import JobRegistry, JobResult, format_summary, run_jobs
+from common.utils.partition import key_ranges, range_name, run_partitions
+from common.utils.plan import PlanWriter, apply_plan
+from common.utils.reconcile import Reconciliation
+from common.utils.watermark import Watermark
 
 # Create custom logger, handler, and formatter
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.DEBUG)
 
+# Number of IN (...) lookup chunks run concurrently on the connectors' pools
+LOOKUP_WORKERS = 4
+
+# Number of rows a job processes and commits between checkpoints
+JOB_CHUNK_SIZE = 5000
+
+# How fix_posts_without_obligations_by_url matches obligation urls to posts:
+# lookup - sends each chunk's urls to the posts database in IN lists and joins the posts in memory
+# temp - loads each chunk's (obligation id, url) pairs into a temporary table in the posts database and
+#   joins there, so only the posts of matched urls come back, each with the first obligation of its url
+URL_MATCH_MODES = ('lookup', 'temp')
+URL_MATCH = os.environ.get('URL_MATCH', 'lookup')
+
+# Finds the posts of the obligation urls loaded by temp_join, each with the first obligation submitted with its url;
+# the latest post per url is picked in the job, as in lookup mode
+MATCH_URLS = """
+  SELECT u.obligation_id, p.id, p.submitted_url, p.modified_at
+  FROM (SELECT url, MIN(obligation_id) AS obligation_id FROM `obligation_urls` GROUP BY url) AS u
+  JOIN posts AS p ON p.submitted_url = u.url
+""".replace('\n','')
+
+# fix_posts_without_obligations_by_url is partitioned by a hash of the url instead of by id, so all obligations
+# of a url, and the one post they can be linked to, are handled by the same partition. The url is lowercased
+# since urls differing only in case match the same post under a case-insensitive collation
+URL_BUCKETS = 1024
+URL_BUCKET = 'CRC32(LOWER(`obligation_submission_url`)) % {}'.format(URL_BUCKETS)
+
+# Seconds before now at which an incremental scan stops, leaving rows of transactions still in flight to the next run
+WATERMARK_LAG = 60
+
+# Seconds before the watermark an incremental scan starts from. Rows that still match a job's condition there, e.g.
+# obligations whose post did not exist yet, are retried by every run until they leave the window
+WATERMARK_LOOKBACK = int(os.environ.get('WATERMARK_LOOKBACK', 7 * 24 * 3600))
+
+# Row representation the jobs read: namedtuple records instead of a dict per row
+JOB_ROW_MODE = 'record'
+
+# Config key prefix and connector of each database; <prefix>_REPLICA_HOST names a replica to watch for lag, and
+# <prefix>_REPLICA_HEARTBEAT_TABLE a heartbeat table (e.g. pt-heartbeat's) to measure it with instead of SHOW SLAVE STATUS
+DATABASES = {
+  'collaborations': ('COLLABS_SERVICE_MYSQL', CollabsConnector),
+  'posts': ('POST_SERVICE_MYSQL', PostConnector)
+}
+
+# Jobs selectable by name on the command line
+JOBS = JobRegistry()
+DEFAULT_JOBS = ['fix_posts_without_obligations_by_url']
+
 def main():
   """ main
-  Queries the collaboration-service for improperly formatted reporting_end_time values
-  and corrects those values by using the campaign end_time value.
+  Runs the data-fix jobs named on the command line, e.g. `python src/main.py fix_reporting_dates_null`.
+  Jobs that write different tables run concurrently, each with its own database connections,
+  and a per-job timing and row-count summary is printed at the end.
+  With --plan DIR the jobs only record their changes in DIR/<job>.plan.gz; `--apply <plan files>`
+  later streams those plans into bulk writes without re-running the jobs' queries.
+  With --throttle writes are chunked and paced by an AdaptiveBatcher per database, which also pauses while
+  the replica named by COLLABS_SERVICE_MYSQL_REPLICA_HOST / POST_SERVICE_MYSQL_REPLICA_HOST in the config lags.
+  With --partitions N each job is split into N id ranges run by separate processes, each with its own
+  connections, so a job uses up to N * 2 * LOOKUP_WORKERS connections.
+  With --incremental each job only scans the rows changed since the watermark its last successful run saved.
   """
   parser = argparse.ArgumentParser(description = "Command arguments for reporting_date_sync")
+  parser.add_argument("jobs", nargs = "*", help = "Jobs to run: {}".format(', '.join(JOBS.names())), default = DEFAULT_JOBS)
   parser.add_argument("-c", "--config", help = "Path for config JSON file", required = False, default = "")
+  parser.add_argument("--serial", help = "Run jobs one after another", action = "store_true")
+  parser.add_argument("--resume", help = "Continue jobs from their last checkpoint", action = "store_true")
+  parser.add_argument("--plan", help = "Directory to write each job's change plan to instead of applying the changes", required = False, default = "")
+  parser.add_argument("--apply", help = "Change plan files to apply instead of running jobs", nargs = "+", default = [])
+  parser.add_argument("--pause", help = "Seconds to pause between applied plan batches", type = float, default = 0)
+  parser.add_argument("--metrics", help = "Path for a JSON lines log of every statement run", required = False, default = "")
+  parser.add_argument("--throttle", help = "Size and pace writes adaptively from their latency and replica lag", action = "store_true")
+  parser.add_argument("--max-lag", help = "Seconds of replica lag tolerated before throttled writes pause", type = float, default = MAX_LAG)
+  parser.add_argument("--partitions", help = "Split each job's id range into this many ranges run by parallel processes", type = int, default = 1)
+  parser.add_argument("--incremental", help = "Only scan rows changed since the job's last successful run", action = "store_true")
   args = parser.parse_args()
   cfg = None
 
+  unknown = [name for name in args.jobs if name not in JOBS.jobs]
+  if unknown:
+    parser.error('unknown jobs: {}'.format(', '.join(unknown)))
+  if args.incremental and args.partitions > 1:
+    parser.error('--incremental cannot be combined with --partitions')
+
   if args.config:
     try:
       with open(args.config) as f:
@@ -33,160 +117,537 @@ def main():
     except Exception as error: 
       LOGGER.error('error processing config: {}'.format(error))
   
+  if args.metrics:
+    STATEMENT_LOGGER.addHandler(json_handler(open(args.metrics, 'a')))
+    get_instrumentation().add_listener(log_statement)
+
   # main logic
   try:
-    # setup db connections
-    collabs_cnx = CollabsConnector(cfg)
-    posts_cnx = PostConnector(cfg)
-
-    # run jobs
-    # fix_reporting_dates_0001(collabs_cnx, posts_cnx)
-    # fix_reporting_dates_null(collabs_cnx, posts_cnx)
-    fix_posts_without_obligations_by_url(collabs_cnx, posts_cnx)
+    if args.apply:
+      results = apply_plans(args.apply, cfg, pause=args.pause, throttle=args.throttle, max_lag=args.max_lag)
+    else:
+      names = list(dict.fromkeys(args.jobs))
+      def run(name, job):
+        if args.partitions > 1 and name in JOBS.partitions:
+          return run_partitioned(name, cfg, args.partitions, plan_dir=args.plan, throttle=args.throttle,
+            max_lag=args.max_lag, resume=args.resume)
+        return run_job(name, job, cfg, plan_dir=args.plan, throttle=args.throttle, max_lag=args.max_lag,
+          resume=args.resume, incremental=args.incremental)
+      results = run_jobs(JOBS, names, run, parallel=not args.serial)
+    print(format_summary(results))
+    print(get_instrumentation().format_summary())
+    get_instrumentation().log_summary()
 
   except Exception as error:
     print('error in main loop {}'.format(error))
 
   print("finished")
 
-def fix_reporting_dates_null(collabs_cnx, posts_cnx):
+def run_job(name, job, cfg, plan_dir=None, throttle=False, max_lag=MAX_LAG, **options):
+  """
+  Runs a job on its own pair of database connections.
+  Arguments:
+    name (string) -- registered name of the job
+    plan_dir (string) -- optional directory to write the job's change plan to instead of applying it
+    throttle (Boolean) -- whether the job's writes are paced by a write throttle per database
+    max_lag [Float]: seconds of replica lag tolerated before throttled writes pause
+    options -- keyword options passed through to the job, e.g. resume or key_range
+  Returns:
+    rows [Integer]: number of rows the job wrote (or planned)
+  """
+  plan = None
+  if plan_dir:
+    os.makedirs(plan_dir, exist_ok=True)
+    plan = PlanWriter(os.path.join(plan_dir, '{}.plan.gz'.format(range_name(name, options.get('key_range')))),
+      append=options.get('resume', False))
+  replicas = []
+  throttles = {}
+  if throttle:
+    for database in DATABASES:
+      throttles[database] = write_throttle(cfg, database, max_lag, replicas)
+  collabs_cnx = CollabsConnector(cfg, max_size=LOOKUP_WORKERS, row_mode=JOB_ROW_MODE,
+    throttle=throttles.get('collaborations'))
+  try:
+    posts_cnx = PostConnector(cfg, max_size=LOOKUP_WORKERS, row_mode=JOB_ROW_MODE, throttle=throttles.get('posts'))
+    try:
+      return job(collabs_cnx, posts_cnx, plan=plan, **options)
+    finally:
+      posts_cnx.close()
+  finally:
+    collabs_cnx.close()
+    for replica in replicas:
+      replica.close()
+    if plan is not None:
+      plan.close()
+    for database, t in throttles.items():
+      print('{} {} writes: {}'.format(name, database, t.summary()))
+
+def run_partitioned(name, cfg, partitions, plan_dir=None, throttle=False, max_lag=MAX_LAG, **options):
+  """
+  Runs a job over `partitions` ranges of the ids of the table it pages over, or of its fixed bounds (see
+  JobRegistry.register), each in its own process with its own pair of database connections, and merges their rows and statement totals.
+  The ranges are saved next to the checkpoints until every partition succeeds, so with resume=True each
+  partition continues over the same range from its own checkpoint.
+  Returns:
+    rows [Integer]: number of rows the partitions wrote (or planned)
+  """
+  database, table = JOBS.partitions[name]
+  # the ranges are stored as the manifest's key
+  manifest = Checkpoint('{}.partitions'.format(name))
+  state = manifest.load() if options.get('resume') else None
+  if state is not None:
+    ranges = [tuple(key_range) for key_range in state['last_key']]
+  else:
+    bounds = JOBS.bounds.get(name) or key_bounds(cfg, database, table)
+    ranges = key_ranges(*bounds, partitions)
+    manifest.save(ranges)
+
+  results = run_partitions(partial(run_range, name, cfg, plan_dir, throttle, max_lag, options), ranges)
+  for result in results:
+    get_instrumentation().merge(result.stats)
+    print('{}: {} rows in {:.2f}s{}'.format(range_name(name, result.key_range), result.rows, result.seconds,
+      ' failed: ' + result.error if result.error else ''))
+  failed = [r for r in results if r.error is not None]
+  if failed:
+    raise Exception('{} of {} partitions of {} failed'.format(len(failed), len(results), name))
+  manifest.clear()
+  return sum(r.rows for r in results)
+
+def run_range(name, cfg, plan_dir, throttle, max_lag, options, key_range):
+  # runs in a partition's worker process
+  return run_job(name, JOBS.get(name), cfg, plan_dir=plan_dir, throttle=throttle, max_lag=max_lag,
+    key_range=key_range, **options)
+
+def key_bounds(cfg, database, table):
+  """
+  Returns the smallest and largest id of a table, or (None, None) when it is empty.
+  """
+  connector = DATABASES[database][1](cfg, max_size=1)
+  try:
+    return tuple(connector.execute('SELECT MIN(id), MAX(id) FROM {}'.format(quote_name(table)), row_mode='tuple')[0])
+  finally:
+    connector.close()
+
+def scan(cnx, columns, source, where, data=None, state=None, watermark=None):
+  """
+  Streams the rows a job processes in keyset pages: by id, or with a watermark by (timestamp, id) from
+  WATERMARK_LOOKBACK seconds before the watermark up to WATERMARK_LAG seconds ago. Rows before the watermark are
+  only scanned again while they still match `where`, i.e. still need work.
+  Arguments:
+    cnx -- connector to stream from
+    columns (tuple) -- columns the job reads; the watermark's key columns are added
+    source (string) -- FROM clause
+    where (string) -- WHERE condition
+    data (tuple) -- optional positional parameters of the condition
+    state (dict) -- the job's checkpoint, to continue after its last key
+    watermark [Watermark]: scans incrementally when given
+  Returns:
+    generator of rows
+  """
+  after = state['last_key'] if state else None
+  if watermark is None:
+    return cnx.stream(select_sql(columns, source, where), data, key='id', after=after)
+  until = cnx.execute('SELECT NOW() - INTERVAL %s SECOND', (WATERMARK_LAG,), row_mode='tuple')[0][0]
+  columns = tuple(columns) + tuple(c for c in watermark.key if c not in columns)
+  column = quote_name(watermark.column)
+  where = '({}) AND {} <= %s'.format(where, column)
+  data = tuple(data or ()) + (until,)
+  start = watermark.load()
+  if start is not None:
+    where += ' AND {} >= %s - INTERVAL %s SECOND'.format(column)
+    data += (start[0], WATERMARK_LOOKBACK)
+  return cnx.stream(select_sql(columns, source, where), data, key=watermark.key,
+    after=tuple(after) if after is not None else None)
+
+def scan_key(watermark=None):
+  """
+  Returns the column(s) `scan` pages by, stored with each checkpoint so a resume in the other mode is refused.
+  """
+  return 'id' if watermark is None else watermark.key
+
+def last_key(row, watermark=None):
+  """
+  Returns the checkpoint key of the last row of a chunk: its id, or its [timestamp, id] with a watermark.
+  """
+  return row.id if watermark is None else list(watermark.position(row))
+
+def in_key_range(where, data=None, key_range=None, column='id', expression=None):
+  """
+  Narrows a WHERE condition and its parameters to a partition's half-open key range [start, end).
+  Arguments:
+    column (string) -- column holding the key
+    expression [string]: SQL computing the key, used instead of `column`, e.g. URL_BUCKET
+  Returns:
+    where (string), data (tuple)
+  """
+  if key_range is None:
+    return where, data
+  key = expression or quote_name(column)
+  where = '({}) AND {} >= %s AND {} < %s'.format(where, key, key)
+  return where, tuple(data or ()) + tuple(key_range)
+
+def apply_plans(paths, cfg, pause=0, throttle=False, max_lag=MAX_LAG):
+  """
+  Applies change plans written by --plan, one after another.
+  Arguments:
+    pause [Float]: seconds to pause between plan batches
+    throttle (Boolean) -- whether writes are paced by a write throttle per database
+    max_lag [Float]: seconds of replica lag tolerated before throttled writes pause
+  Returns:
+    list of JobResult, one per plan file
+  """
+  results = []
+  replicas = []
+  connectors = {}
+  for database, (_, connector) in DATABASES.items():
+    connectors[database] = connector(cfg, throttle=write_throttle(cfg, database, max_lag, replicas) if throttle else None)
+  try:
+    for path in paths:
+      start = time.monotonic()
+      try:
+        rows = apply_plan(path, connectors, pause=pause)
+        results.append(JobResult(path, time.monotonic() - start, rows))
+      except Exception as error:
+        LOGGER.error('failed to apply plan {}'.format(path), exc_info=True)
+        results.append(JobResult(path, time.monotonic() - start, error=error))
+  finally:
+    for cnx in list(connectors.values()) + replicas:
+      cnx.close()
+  return results
+
+def write_throttle(cfg, database, max_lag=MAX_LAG, replicas=None):
+  """
+  Builds the AdaptiveBatcher pacing writes to a database. When the config names a replica of the database
+  (<prefix>_REPLICA_HOST, see DATABASES) writes also pause while its replication lag exceeds `max_lag`. The lag
+  is read from SHOW SLAVE STATUS, or from the heartbeat table named by <prefix>_REPLICA_HEARTBEAT_TABLE (column
+  <prefix>_REPLICA_HEARTBEAT_COLUMN, default `ts`, written in the <prefix>_REPLICA_HEARTBEAT_TIMEZONE zone, 'utc' or
+  'local') when the config names one.
+  Arguments:
+    cfg (dict) -- job configuration, or None when it is read from SSM
+    database (string) -- 'collaborations' or 'posts'
+    max_lag [Float]: seconds of replica lag tolerated
+    replicas (list) -- the replica connector is appended here, for the caller to close
+  Returns:
+    throttle (AdaptiveBatcher)
+  """
+  prefix, connector = DATABASES[database]
+  replica_host = (cfg or {}).get(prefix + '_REPLICA_HOST')
+  if not replica_host:
+    return AdaptiveBatcher(max_lag=max_lag)
+  replica = connector(dict(cfg, **{prefix + '_HOST': replica_host}), max_size=1)
+  if replicas is not None:
+    replicas.append(replica)
+  heartbeat_table = cfg.get(prefix + '_REPLICA_HEARTBEAT_TABLE')
+  if heartbeat_table:
+    probe = HeartbeatProbe(replica, table=heartbeat_table, column=cfg.get(prefix + '_REPLICA_HEARTBEAT_COLUMN', 'ts'),
+      timezone=cfg.get(prefix + '_REPLICA_HEARTBEAT_TIMEZONE', 'utc'))
+  else:
+    probe = ReplicaStatusProbe(replica)
+  return AdaptiveBatcher(lag_probe=probe, max_lag=max_lag)
+
+def resume_plan(plan, state):
+  """
+  Drops the rows a job planned after the checkpoint it resumes from (all of them without a checkpoint);
+  the resumed job plans them again.
+  """
+  if plan is None:
+    return
+  offset = state['details'].get('plan') if state else 0
+  if offset is not None:
+    plan.truncate(offset)
+
+def checkpoint_details(plan=None, **details):
+  """
+  Returns the details a job saves with its checkpoint, with the length of its change plan for resume_plan.
+  """
+  if plan is not None:
+    details['plan'] = plan.offset
+  return details
+
+def write_updates(cnx, database, table, key, columns, rows, plan=None):
+  """
+  Applies (key, values...) rows to a table with the connector's bulk_update, or records them in the
+  change plan instead when one is given.
+  Returns:
+    rows [Integer]: number of rows changed (or planned)
+  """
+  if plan is not None:
+    return plan.update(database, table, key, columns, rows)
+  return cnx.bulk_update(table, key, columns, rows)
+
+@JOBS.register(writes=('posts',), partition=('posts', 'posts'))
+def fix_reporting_dates_null(collabs_cnx, posts_cnx, resume=False, plan=None, key_range=None, incremental=False):
   """
    Fix posts where reporting_start_time and reporting_end_time are NULL
    within the currently relevant reporting period (> 9/1/2020).
+   Posts are fixed in chunks by id and a checkpoint is saved after each committed chunk;
+   with resume=True the job continues after the last checkpointed post.
+   key_range limits the job to posts with ids in [start, end), see run_partitioned.
+   With incremental=True only posts modified since the last successful incremental run are scanned,
+   plus those in the WATERMARK_LOOKBACK window before it that still need fixing.
   """
+  checkpoint = Checkpoint(range_name('fix_reporting_dates_null', key_range))
+  watermark = Watermark('fix_reporting_dates_null', 'modified_at') if incremental else None
+  state = checkpoint.load(key=scan_key(watermark)) if resume else None
+  resume_plan(plan, state)
+  last = state['last_key'] if state else None
+  counts = state['counts'] if state else {'posts': 0, 'obligations': 0, 'updated': 0}
+  reconciliation = Reconciliation(checkpoint.job, left='posts', right='obligations')
+  if state:
+    reconciliation.restore(state['details'].get('reconciliation'))
+
+  # columns the job reads
+  post_columns = ('id',)
+  obligation_columns = ('campaigns.start_date', 'campaigns.end_date', 'obligations.post_id')
 
   # get all post IDs where reporting_end_date and reporting_start_date are null:
-  posts = posts_cnx.execute("""
-    SELECT * FROM posts 
-    WHERE status != 'DELETED' 
+  where, data = in_key_range("""
+    status != 'DELETED' 
     AND reporting_end_time IS NULL 
     AND (channel != 'LTK' AND channel != 'BLOG' AND channel != 'NO_CHANNEL') 
     AND created_at >= '2020-09-01 00:00:00'
-  """.replace('\n','').replace('\t',''))
-  if len(posts) == 0:
-    print('no posts found where reporting_end_time is NULL')
-    return
-
-  print('posts count: ' + str(len(posts)))
+  """.replace('\n','').replace('\t',''), key_range=key_range)
+  posts = scan(posts_cnx, post_columns, 'posts', where, data, state, watermark)
 
   # get the campaigns for these posts by joining w/ obligations
-  result = map(lambda p: p['id'], posts) 
-  post_ids = ','.join('"{0}"'.format(w) for w in list(result))
-  query = """
-    SELECT campaigns.*, obligations.post_id as post_id 
-    FROM obligations JOIN campaigns ON campaigns.id = obligations.campaign_id 
-    WHERE obligations.post_id IN ({})
-  """.format(post_ids).replace('\n','').replace('\t','')
-
-  obligations = collabs_cnx.execute(query)
-  print('obligations count: ' + str(len(obligations)))
-  
-  # check to see which posts are not tied to obligations
-  obl_post_ids = map(lambda o: o['post_id'], obligations)
-  obl_post_ids = ','.join('"{0}"'.format(w) for w in list(obl_post_ids))
-  print(diff(obl_post_ids.split(','), post_ids.split(',')))
+  query = select_sql(obligation_columns, 'obligations JOIN campaigns ON campaigns.id = obligations.campaign_id',
+    'obligations.post_id IN ({})')
 
-  # update the posts' reporting_end_time
-  values = {}
   d = timedelta(weeks=6)
-  for o in obligations:
-    # store the start_date and end_date as a tuple mapped by post_id
-    values[o['post_id']] = (
-      (o['start_date'] + d).strftime("%Y-%m-%d %H:%M:%S"), 
-      (o['end_date'] + d).strftime("%Y-%m-%d %H:%M:%S")
-    )
+  for chunk in batches(posts, JOB_CHUNK_SIZE):
+    post_ids = [p.id for p in chunk]
+    obligations = list(select_in(collabs_cnx.execute, query, post_ids, workers=LOOKUP_WORKERS))
+
+    # check to see which posts are not tied to obligations
+    reconciliation.compare(post_ids, [o.post_id for o in obligations])
+
+    # update the posts' reporting_end_time
+    values = {}
+    for o in obligations:
+      # store the start_date and end_date as a tuple mapped by post_id
+      values[o.post_id] = (
+        (o.start_date + d).strftime("%Y-%m-%d %H:%M:%S"), 
+        (o.end_date + d).strftime("%Y-%m-%d %H:%M:%S")
+      )
+
+    vals = [(k, v[0], v[1]) for k, v in values.items()] 
+    counts['updated'] += write_updates(posts_cnx, 'posts', 'posts', 'id', ('reporting_start_time', 'reporting_end_time'), vals, plan)
+    counts['posts'] += len(post_ids)
+    counts['obligations'] += len(obligations)
+    last = last_key(chunk[-1], watermark)
+    checkpoint.save(last, key=scan_key(watermark),
+      details=checkpoint_details(plan, reconciliation=reconciliation.report()), **counts)
+
+  if counts['posts'] == 0:
+    print('no posts found where reporting_end_time is NULL')
+  print('posts count: ' + str(counts['posts']))
+  print('obligations count: ' + str(counts['obligations']))
 
-  vals = [(v[0], v[1], k) for k, v in values.items()] 
-  posts_cnx.executemany("UPDATE posts SET reporting_start_time = %s, reporting_end_time = %s WHERE id = %s", vals)
+  print('reconciliation report: ' + reconciliation.write())
 
+  if watermark is not None and last is not None:
+    watermark.save(last)
+  checkpoint.clear()
   print('successfully updated posts where reporting times are NULL')
+  return counts['updated']
 
-def fix_posts_without_obligations_by_url(collabs_cnx, posts_cnx):
+@JOBS.register(writes=('obligations',), partition=('collaborations', 'obligations'), bounds=(0, URL_BUCKETS - 1))
+def fix_posts_without_obligations_by_url(collabs_cnx, posts_cnx, resume=False, plan=None, match=URL_MATCH,
+    key_range=None, incremental=False):
   """
   Fix obligations with null post IDs by JOINING the obligations table on obligation_submission_url
+  Obligations are fixed in chunks by id and a checkpoint is saved after each committed chunk;
+  with resume=True the job continues after the last checkpointed obligation.
+  match selects where the urls are joined to posts, see URL_MATCH_MODES; both modes compare urls ignoring case
+  (url_key), so they link the same posts. When several posts share a url, the most recently modified one (then the
+  highest id) is linked to the first obligation submitted with it.
+  key_range limits the job to obligations whose url falls in URL_BUCKET buckets [start, end), see run_partitioned;
+  partitions never share a url, so two of them cannot link the same post.
+  With incremental=True only obligations submitted since the last successful incremental run are scanned,
+  plus those in the WATERMARK_LOOKBACK window before it that still need fixing.
+  Posts already linked in the database (by an earlier run, or before a resumed run's checkpoint) are skipped,
+  since a run only knows the posts it linked itself.
   """
+  if match not in URL_MATCH_MODES:
+    raise ValueError('url match mode must be one of {}'.format(URL_MATCH_MODES))
+  checkpoint = Checkpoint(range_name('fix_posts_without_obligations_by_url', key_range))
+  watermark = Watermark('fix_posts_without_obligations_by_url', 'date_submitted') if incremental else None
+  state = checkpoint.load(key=scan_key(watermark)) if resume else None
+  resume_plan(plan, state)
+  last = state['last_key'] if state else None
+  counts = state['counts'] if state else {'obligations': 0, 'posts': 0, 'updated': 0}
+
+  # columns the job reads
+  obligation_columns = ('id', 'obligation_submission_url')
+  post_columns = ('id', 'submitted_url', 'modified_at')
+
   # get obligations where post ID is null
-  obligations = collabs_cnx.execute("""
-    SELECT * FROM `collaborations`.`obligations`
-    WHERE (`is_deleted` = '0') AND (`post_id` IS NULL) 
+  where, data = in_key_range("""
+    (`is_deleted` = '0') AND (`post_id` IS NULL) 
     AND (`date_submitted` > '2020-11-29 22:21:22') 
     AND (`obligation_submission_url` IS NOT NULL) 
-    AND (`obligation_type_id` = '9') ORDER BY `id`
-  """.replace('\n','').replace('\t',''))
-  if len(obligations) == 0:
+    AND (`obligation_type_id` = '9')
+  """.replace('\n','').replace('\t',''), key_range=key_range, expression=URL_BUCKET)
+  obligations = scan(collabs_cnx, obligation_columns, '`collaborations`.`obligations`', where, data, state, watermark)
+
+  # get the posts by JOINING the posts table on obligation_submission_url
+  query = select_sql(post_columns, 'posts', 'posts.submitted_url IN ({})')
+
+  # posts already linked to an obligation in an earlier chunk
+  linked = set()
+  for chunk in batches(obligations, JOB_CHUNK_SIZE):
+    # match the most recently modified post of each url to the first obligation submitted with it;
+    # the posts arrive in no particular order
+    if match == 'temp':
+      posts = match_urls_in_posts_db(posts_cnx, chunk)
+      latest = latest_rows(posts, lambda p: url_key(p.submitted_url), post_order)
+      pairs = [(p.obligation_id, p.id) for p in latest.values()]
+    else:
+      urls = [o.obligation_submission_url for o in chunk]
+      posts = list(select_in(posts_cnx.execute, query, urls, workers=LOOKUP_WORKERS))
+      latest = latest_rows(posts, lambda p: url_key(p.submitted_url), post_order)
+      join = HashJoin(chunk, latest.values(), lambda o: url_key(o.obligation_submission_url),
+        lambda p: url_key(p.submitted_url), duplicates='first')
+      pairs = [(o.id, p.id) for o, p in join if o is not None and p is not None]
+    posts_found = len(posts)
+
+    linked.update(linked_posts(collabs_cnx, [post_id for _, post_id in pairs]))
+    vals = []
+    for obligation_id, post_id in pairs:
+      if post_id in linked:
+        continue
+      linked.add(post_id)
+      vals.append((obligation_id, post_id))
+    print(vals)
+
+    counts['updated'] += write_updates(collabs_cnx, 'collaborations', 'obligations', 'id', ('post_id',), vals, plan)
+    counts['obligations'] += len(chunk)
+    counts['posts'] += posts_found
+    last = last_key(chunk[-1], watermark)
+    checkpoint.save(last, key=scan_key(watermark), details=checkpoint_details(plan), **counts)
+
+  if counts['obligations'] == 0:
     print('no obligations found where post_id is NULL')
-    return
+  print('obligations count: ' + str(counts['obligations']))
+  print('posts count: ' + str(counts['posts']))
 
-  print('obligations count: ' + str(len(obligations)))
+  if watermark is not None and last is not None:
+    watermark.save(last)
+  checkpoint.clear()
+  print('successfully updated obligations where post_id is NULL')
+  return counts['updated']
 
-  result = map(lambda o: o['obligation_submission_url'], obligations)
-  urls = ','.join('"{0}"'.format(w) for w in list(result))
+def url_key(url):
+  # urls are compared as the posts table's case-insensitive collation compares them, in both url match modes
+  return url.lower()
 
-  # get the posts by JOINING the posts table on obligation_submission_url
-  post_ids = ','.join('"{0}"'.format(w) for w in list(urls))
-  query = """
-    SELECT * FROM posts
-    WHERE posts.submitted_url IN ({})
-    ORDER BY posts.modified_at
-  """.format(urls).replace('\n','').replace('\t','')
-
-  posts = posts_cnx.execute(query)
-  print('posts count: ' + str(len(posts)))
-
-  values = {}  
-  for p in posts:
-    values[p['id']] = next((x['id'] for x in obligations if x['obligation_submission_url'] == p['submitted_url']))
-    # values[p['id']] = next((x['obligation_submission_url'] for x in obligations if x['obligation_submission_url'] == p['submitted_url']))
-  vals = [(k, v) for k, v in values.items()] 
-  print(vals)
-
-  collabs_cnx.executemany("UPDATE obligations SET post_id = %s WHERE id = %s", vals)
-  print('successfully updated obligations where post_id is NULL')
+def latest_rows(rows, key, order):
+  """
+  Keeps, for every key, the row that sorts last by `order`.
+  Returns:
+    dict of key -> row
+  """
+  latest = {}
+  for row in rows:
+    k = key(row)
+    if k not in latest or order(row) > order(latest[k]):
+      latest[k] = row
+  return latest
+
+def post_order(post):
+  # (modified_at, id) with NULL modification times first, as ORDER BY posts.modified_at sorts them
+  return (post.modified_at is not None, post.modified_at, post.id)
+
+def linked_posts(collabs_cnx, post_ids):
+  """
+  Returns the ids among `post_ids` of the posts an obligation already links to.
+  """
+  query = select_sql(('post_id',), 'obligations', 'post_id IN ({})')
+  return set(o.post_id for o in select_in(collabs_cnx.execute, query, post_ids, workers=LOOKUP_WORKERS))
+
+def match_urls_in_posts_db(posts_cnx, obligations):
+  """
+  Finds the posts of the obligations' urls inside the posts database, through an indexed temporary table
+  holding the obligations' (id, url) pairs.
+  Returns:
+    list of (obligation_id, id, submitted_url, modified_at) records, one per post with a matching url, with the
+    first obligation submitted with that url
+  """
+  rows = ((o.id, o.obligation_submission_url) for o in obligations)
+  with posts_cnx.connection() as cnx:
+    return temp_join(cnx, 'obligation_urls', (('obligation_id', 'posts', 'id'), ('url', 'posts', 'submitted_url')),
+      rows, MATCH_URLS, index=('url',), row_mode='record')
 
-def fix_reporting_dates_0001(collabs_cnx, posts_cnx):
+@JOBS.register(writes=('posts',), partition=('posts', 'posts'))
+def fix_reporting_dates_0001(collabs_cnx, posts_cnx, resume=False, plan=None, key_range=None, incremental=False):
   """
   Fix posts where reporting_end_time like %0001%.
   This is related to a problem introduced to the collaboration-service on 9/23/2020.
+  Posts are checked in chunks by id and a checkpoint is saved after each chunk;
+  with resume=True the job continues after the last checkpointed post.
+  The fixes are only recorded when a change plan is given; otherwise the job is a dry run.
+  key_range limits the job to posts with ids in [start, end), see run_partitioned.
+  With incremental=True only posts modified since the last successful incremental run are scanned,
+  plus those in the WATERMARK_LOOKBACK window before it that still need fixing. A dry run does not count
+  as a successful incremental run and leaves the watermark where it was.
   """
+  checkpoint = Checkpoint(range_name('fix_reporting_dates_0001', key_range))
+  watermark = Watermark('fix_reporting_dates_0001', 'modified_at') if incremental else None
+  state = checkpoint.load(key=scan_key(watermark)) if resume else None
+  resume_plan(plan, state)
+  last = state['last_key'] if state else None
+  counts = state['counts'] if state else {'posts': 0, 'obligations': 0, 'updated': 0}
+  reconciliation = Reconciliation(checkpoint.job, left='posts', right='obligations')
+  if state:
+    reconciliation.restore(state['details'].get('reconciliation'))
+
+  # columns the job reads
+  post_columns = ('id',)
+  obligation_columns = ('campaigns.end_date', 'obligations.post_id')
 
   # get all post IDs where campaign reporting_end_date is invalid:
-  posts = posts_cnx.execute("SELECT * FROM posts WHERE reporting_end_time LIKE '%0001%';")
-  if len(posts) == 0:
-    print('no posts found where reporting_end_time like 0001')
-    return
-
-  print('posts count: ' + str(len(posts)))
+  where, data = in_key_range('reporting_end_time LIKE %s', ('%0001%',), key_range=key_range)
+  posts = scan(posts_cnx, post_columns, 'posts', where, data, state, watermark)
 
   # get the campaigns for these posts by joining w/ obligations
-  result = map(lambda p: p['id'], posts) 
-  post_ids = ','.join('"{0}"'.format(w) for w in list(result))
-  query = """
-    SELECT campaigns.*, obligations.post_id as post_id 
-    FROM obligations JOIN campaigns ON campaigns.id = obligations.campaign_id 
-    WHERE obligations.post_id IN ({})
-  """.format(post_ids).replace('\n','').replace('\t','')
-  obligations = collabs_cnx.execute(query)
-
-  print('obligations count: ' + str(len(obligations)))
-  
-  # check to see which posts are not tied to obligations
-  obl_post_ids = map(lambda o: o['post_id'], obligations)
-  obl_post_ids = ','.join('"{0}"'.format(w) for w in list(obl_post_ids))
-  print(diff(obl_post_ids.split(','), post_ids.split(',')))
+  query = select_sql(obligation_columns, 'obligations JOIN campaigns ON campaigns.id = obligations.campaign_id',
+    'obligations.post_id IN ({})')
 
-  # update the posts' reporting_end_time
-  values = {}
   d = timedelta(weeks=6)
-  for c in obligations:
-    values[c['post_id']] = (c['end_date'] + d).strftime("%Y-%m-%d %H:%M:%S")
+  for chunk in batches(posts, JOB_CHUNK_SIZE):
+    post_ids = [p.id for p in chunk]
+    obligations = list(select_in(collabs_cnx.execute, query, post_ids, workers=LOOKUP_WORKERS))
+
+    # check to see which posts are not tied to obligations
+    reconciliation.compare(post_ids, [o.post_id for o in obligations])
+
+    # update the posts' reporting_end_time
+    values = {}
+    for c in obligations:
+      values[c.post_id] = (c.end_date + d).strftime("%Y-%m-%d %H:%M:%S")
+
+    vals = [(k, v) for k, v in values.items()] 
+    if plan is not None:
+      counts['updated'] += write_updates(posts_cnx, 'posts', 'posts', 'id', ('reporting_end_time',), vals, plan)
+    counts['posts'] += len(post_ids)
+    counts['obligations'] += len(obligations)
+    last = last_key(chunk[-1], watermark)
+    checkpoint.save(last, key=scan_key(watermark),
+      details=checkpoint_details(plan, reconciliation=reconciliation.report()), **counts)
+
+  if counts['posts'] == 0:
+    print('no posts found where reporting_end_time like 0001')
+  print('posts count: ' + str(counts['posts']))
+  print('obligations count: ' + str(counts['obligations']))
 
-  vals = [(v, k) for k, v in values.items()] 
-  # posts_cnx.executemany("UPDATE posts SET reporting_end_time = %s WHERE id = %s", vals)
+  print('reconciliation report: ' + reconciliation.write())
 
+  # a dry run fixes nothing, so the rows it scanned must be scanned again by the next incremental run
+  if watermark is not None and last is not None and plan is not None:
+    watermark.save(last)
+  checkpoint.clear()
   print('successfully updated posts where reporting_end_time like 0001')
-
-def diff(li1, li2):
-  return (list(list(set(li1)-set(li2)) + list(set(li2)-set(li1))))
+  return counts['updated']
 
 if __name__ == "__main__":
   main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the code under test is imported the way the jobs run it, from src/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
@@ -0,0 +1,105 @@
+"""
+In-memory stand-ins for DB-API connections and cursors, so the query, pool and bulk helpers can be
+exercised without a MySQL server.
+"""
+
+class FakeCursor():
+  """
+  Fake Cursor - Records every statement and serves rows from its connection.
+  A connection with a `table` answers keyset page queries (see FakeConnection); otherwise each execute
+  pops the next scripted result.
+  """
+  def __init__(self, cnx):
+    self.cnx = cnx
+    self.description = None
+    self._rows = []
+
+  def execute(self, query, args=None):
+    self.cnx.executed.append((query, args))
+    if self.cnx.table is not None and 'AS page' in query:
+      self._rows = self.cnx.page(query, tuple(args or ()))
+    elif self.cnx.results:
+      self._rows = list(self.cnx.results.pop(0))
+    else:
+      self._rows = []
+    if self._rows and isinstance(self._rows[0], dict):
+      self.description = tuple((name,) for name in self._rows[0])
+    return len(self._rows)
+
+  def executemany(self, query, args):
+    args = list(args)
+    self.cnx.executed.append((query, args))
+    return len(args)
+
+  def fetchall(self):
+    rows, self._rows = self._rows, []
+    return rows
+
+  def fetchone(self):
+    return self._rows.pop(0) if self._rows else None
+
+  def fetchmany(self, size=1):
+    rows, self._rows = self._rows[:size], self._rows[size:]
+    return rows
+
+  def close(self):
+    pass
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+class FakeConnection():
+  """
+  Fake Connection - Counts commits, rollbacks and closes, and fails pings once `alive` is cleared.
+  Arguments:
+    table (list) -- dict rows sorted by `key`, served to keyset page queries
+    key (tuple) -- columns the table is sorted and paged on
+    results (list) -- row lists returned by successive plain statements
+  """
+  def __init__(self, table=None, key=('id',), results=None):
+    self.table = table
+    self.key = key
+    self.results = list(results or [])
+    self.executed = []
+    self.commits = 0
+    self.rollbacks = 0
+    self.closed = False
+    self.alive = True
+    self.autocommit_mode = False
+    self.autocommit_changes = []
+
+  def cursor(self, cursor_class=None):
+    return FakeCursor(self)
+
+  def page(self, query, args):
+    # a first page binds (..., size); a seek binds (..., key values..., size)
+    size = args[-1]
+    position = lambda row: tuple(row[name] for name in self.key)
+    rows = self.table
+    if ' > ' in query:
+      after = tuple(args[-1 - len(self.key):-1])
+      rows = [row for row in rows if position(row) > after]
+    return rows[:size]
+
+  def commit(self):
+    self.commits += 1
+
+  def rollback(self):
+    self.rollbacks += 1
+
+  def get_autocommit(self):
+    return self.autocommit_mode
+
+  def autocommit(self, value):
+    self.autocommit_mode = value
+    self.autocommit_changes.append(value)
+
+  def ping(self, reconnect=False):
+    if not self.alive:
+      raise Exception('connection lost')
+
+  def close(self):
+    self.closed = True
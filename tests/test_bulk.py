@@ -0,0 +1,22 @@
+from common.db.bulk import bulk_update
+from tests.fakes import FakeConnection
+
+def test_temp_update_declares_columns_and_creates_in_autocommit():
+  cnx = FakeConnection(results=[
+    [('bigint(20)', None)],
+    [('datetime', None)],
+    [], [],
+    [], [(), ()],
+    []
+  ])
+  rows = [(1, '2021-01-01 00:00:00'), (2, '2021-01-02 00:00:00')]
+  assert bulk_update(cnx, 'posts', 'id', ('reporting_end_time',), rows, method='temp') == 2
+  statements = [query for query, _ in cnx.executed]
+  assert statements[3] == 'CREATE TEMPORARY TABLE `bulk_posts` (`id` bigint(20), `reporting_end_time` datetime, ' \
+    'PRIMARY KEY (`id`))'
+  assert not any('LIMIT 0' in query or 'ALTER TABLE' in query for query in statements)
+  assert cnx.executed[5] == ('INSERT INTO `bulk_posts` (`id`, `reporting_end_time`) VALUES (%s, %s)', rows)
+  assert statements[-1] == 'DROP TEMPORARY TABLE IF EXISTS `bulk_posts`'
+  # the temporary table is created and dropped outside a transaction, the chunk is committed inside one
+  assert cnx.autocommit_changes == [True, False, True, False]
+  assert cnx.commits == 1
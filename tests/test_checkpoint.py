@@ -0,0 +1,77 @@
+from collections import namedtuple
+from datetime import datetime
+
+import pytest
+
+from common.utils.checkpoint import Checkpoint
+from common.utils.reconcile import Reconciliation
+from common.utils.watermark import Watermark
+
+Record = namedtuple('Record', ('id', 'modified_at'))
+
+def test_checkpoint_save_load_clear(tmp_path):
+  checkpoint = Checkpoint('job', directory=str(tmp_path))
+  assert checkpoint.load() is None
+  checkpoint.save(42, posts=10, updated=3)
+  state = checkpoint.load()
+  assert state['last_key'] == 42
+  assert state['counts'] == {'posts': 10, 'updated': 3}
+  checkpoint.save(84, posts=20, updated=6)
+  assert checkpoint.load()['last_key'] == 84
+  checkpoint.clear()
+  assert checkpoint.load() is None
+  checkpoint.clear()
+
+def test_checkpoint_save_leaves_no_temporary_files(tmp_path):
+  checkpoint = Checkpoint('job', directory=str(tmp_path / 'nested'))
+  checkpoint.save(1)
+  assert [p.name for p in (tmp_path / 'nested').iterdir()] == ['job.json']
+
+def test_watermark_round_trips_a_row_position(tmp_path):
+  watermark = Watermark('job', 'modified_at', directory=str(tmp_path))
+  assert watermark.key == ('modified_at', 'id')
+  assert watermark.load() is None
+  position = watermark.position(Record(7, datetime(2021, 1, 2, 3, 4, 5)))
+  assert position == ('2021-01-02 03:04:05', 7)
+  watermark.save(position)
+  assert watermark.load() == ('2021-01-02 03:04:05', 7)
+
+def test_watermark_position_of_dict_rows(tmp_path):
+  watermark = Watermark('job', 'date_submitted', directory=str(tmp_path))
+  assert watermark.position({'id': 3, 'date_submitted': datetime(2021, 5, 6, 7, 8, 9, 10)}) == \
+    ('2021-05-06 07:08:09.000010', 3)
+
+def test_checkpoint_keeps_its_key_and_details(tmp_path):
+  checkpoint = Checkpoint('job', directory=str(tmp_path))
+  checkpoint.save(['2021-01-02 03:04:05', 7], key=('modified_at', 'id'), details={'reconciliation': None}, posts=1)
+  state = checkpoint.load(key=('modified_at', 'id'))
+  assert state['last_key'] == ['2021-01-02 03:04:05', 7]
+  assert state['details'] == {'reconciliation': None}
+
+def test_checkpoint_refuses_a_resume_paging_by_other_columns(tmp_path):
+  checkpoint = Checkpoint('job', directory=str(tmp_path))
+  checkpoint.save(['2021-01-02 03:04:05', 7], key=('modified_at', 'id'))
+  with pytest.raises(ValueError):
+    checkpoint.load(key='id')
+  checkpoint.save(42)
+  with pytest.raises(ValueError):
+    checkpoint.load(key=('modified_at', 'id'))
+  assert checkpoint.load(key='id')['last_key'] == 42
+
+def test_reconciliation_continues_from_a_saved_report(tmp_path):
+  checkpoint = Checkpoint('job', directory=str(tmp_path))
+  first = Reconciliation('job').compare([1, 2, 3], [2, 4])
+  checkpoint.save(3, details={'reconciliation': first.report()})
+  resumed = Reconciliation('job').restore(checkpoint.load()['details'].get('reconciliation'))
+  resumed.compare([5, 6], [6])
+  assert (resumed.matched, resumed.left_only, resumed.right_only) == (2, 3, 1)
+  assert sorted(resumed.left_samples) == [1, 3, 5]
+  assert Reconciliation('job').restore(None).matched == 0
+
+def test_watermark_never_moves_back(tmp_path):
+  watermark = Watermark('job', 'modified_at', directory=str(tmp_path))
+  watermark.save(('2021-01-02 03:04:05', 7))
+  watermark.save(('2021-01-01 00:00:00', 9))
+  assert watermark.load() == ('2021-01-02 03:04:05', 7)
+  watermark.save(('2021-01-02 03:04:05.5', 1))
+  assert watermark.load() == ('2021-01-02 03:04:05.5', 1)
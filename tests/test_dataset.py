@@ -0,0 +1,15 @@
+import pytest
+
+from benchmark import dataset
+
+def test_generate_refuses_a_remote_server_before_connecting(monkeypatch):
+  monkeypatch.setattr(dataset, 'server', lambda cfg: pytest.fail('connected'))
+  with pytest.raises(ValueError):
+    dataset.generate(dataset.config(host='db.internal'), 10)
+  with pytest.raises(ValueError):
+    dataset.restore(dataset.config(host='db.internal'))
+
+def test_check_local_allows_local_or_forced_hosts():
+  dataset.check_local(dataset.config())
+  dataset.check_local(dataset.config(host='localhost'))
+  dataset.check_local(dataset.config(host='db.internal'), force=True)
@@ -0,0 +1,21 @@
+from types import SimpleNamespace
+
+import pytest
+
+from common.utils import import_budget as b
+
+def run_with(stderr):
+  return lambda *args, **kwargs: SimpleNamespace(returncode=0, stderr=stderr)
+
+def test_import_time_parses_the_module_total(monkeypatch):
+  monkeypatch.setattr(b.subprocess, 'run', run_with(
+    'import time: self [us] | cumulative | imported package\n'
+    'import time:       120 |        120 |   json\n'
+    'import time:       300 |       2500 | main\n'))
+  assert b.import_time('main') == (2.5, ['json', 'main'])
+
+def test_import_time_refuses_output_without_import_times(monkeypatch):
+  # Python 3.6 ignores -X importtime and reports nothing
+  monkeypatch.setattr(b.subprocess, 'run', run_with(''))
+  with pytest.raises(Exception, match='importtime'):
+    b.import_time('main')
@@ -0,0 +1,48 @@
+import logging
+
+from common.utils import instrumentation as i
+from tests.fakes import FakeConnection
+
+def test_records_are_only_built_for_listeners():
+  instrumentation = i.Instrumentation()
+  assert instrumentation.listeners == []
+  records = []
+  instrumentation.add_listener(records.append)
+  instrumentation.record('posts', 'SELECT 1', 0.002, rows=1)
+  assert [r['statement'] for r in records] == ['SELECT 1']
+  assert instrumentation.stats[('posts', 'SELECT 1')].count == 1
+
+def test_log_statement_skips_loggers_without_handlers(monkeypatch):
+  logged = []
+  monkeypatch.setattr(i.STATEMENT_LOGGER, 'debug', lambda *args, **kwargs: logged.append(args))
+  monkeypatch.setattr(i.STATEMENT_LOGGER, 'hasHandlers', lambda: False)
+  i.log_statement({'statement': 'SELECT 1'})
+  assert logged == []
+  monkeypatch.setattr(i.STATEMENT_LOGGER, 'hasHandlers', lambda: True)
+  i.log_statement({'statement': 'SELECT 1'})
+  assert len(logged) == 1
+
+def test_fetched_bytes_are_only_measured_when_asked():
+  for measure_bytes, size in ((False, 0), (True, 8 + 3)):
+    instrumentation = i.Instrumentation(measure_bytes=measure_bytes)
+    cnx = i.InstrumentedConnection(FakeConnection(results=[[(1, 'abc')]]), instrumentation, 'posts')
+    cursor = cnx.cursor()
+    cursor.execute('SELECT id, url FROM posts')
+    assert cursor.fetchall() == [(1, 'abc')]
+    cursor.close()
+    stats = instrumentation.stats[('posts', 'SELECT id, url FROM posts')]
+    assert (stats.rows, stats.bytes) == (1, size)
+
+def test_summary_is_logged_on_the_statement_logger():
+  records = []
+  handler = logging.Handler()
+  handler.emit = records.append
+  i.STATEMENT_LOGGER.addHandler(handler)
+  try:
+    instrumentation = i.Instrumentation()
+    instrumentation.record('posts', 'SELECT 1', 0.002, rows=1)
+    instrumentation.log_summary()
+  finally:
+    i.STATEMENT_LOGGER.removeHandler(handler)
+  assert [r.getMessage() for r in records] == ['statement summary']
+  assert (records[0].backend, records[0].statement, records[0].count) == ('posts', 'SELECT 1', 1)
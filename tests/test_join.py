@@ -0,0 +1,69 @@
+import pytest
+
+from common.db.join import HashJoin, temp_join
+from tests.fakes import FakeConnection
+
+OBLIGATIONS = [
+  {'id': 1, 'url': 'a'},
+  {'id': 2, 'url': 'b'},
+  {'id': 3, 'url': 'a'},
+  {'id': 4, 'url': 'c'}
+]
+POSTS = [
+  {'id': 10, 'url': 'a'},
+  {'id': 11, 'url': 'b'},
+  {'id': 12, 'url': 'b'},
+  {'id': 13, 'url': 'd'}
+]
+
+def pairs(join):
+  # unmatched sides are None; sort them first
+  return sorted(((o and o['id'], p and p['id']) for o, p in join), key=lambda pair: tuple(k or 0 for k in pair))
+
+def test_all_joins_every_combination():
+  join = HashJoin(OBLIGATIONS, POSTS, 'url', 'url', duplicates='all')
+  assert pairs(join) == [(None, 13), (1, 10), (2, 11), (2, 12), (3, 10), (4, None)]
+  assert join.summary() == {'matched': 4, 'left_only': 1, 'right_only': 1, 'dropped_duplicates': 0}
+
+@pytest.mark.parametrize('build', ['left', 'right'])
+def test_first_keeps_first_row_per_key_on_each_side(build):
+  join = HashJoin(OBLIGATIONS, POSTS, 'url', 'url', duplicates='first', build=build)
+  assert pairs(join) == [(None, 13), (1, 10), (2, 11), (4, None)]
+  assert join.matched == 2
+  assert join.dropped == 2
+
+def test_error_raises_on_duplicate_key():
+  with pytest.raises(ValueError):
+    list(HashJoin(OBLIGATIONS, POSTS, 'url', 'url', duplicates='error'))
+
+def test_callable_keys_and_unsized_inputs():
+  join = HashJoin(iter(OBLIGATIONS[:2]), iter(POSTS[:2]), lambda o: o['url'], lambda p: p['url'])
+  assert pairs(join) == [(1, 10), (2, 11)]
+
+def test_invalid_policy():
+  with pytest.raises(ValueError):
+    HashJoin([], [], 'url', 'url', duplicates='any')
+
+def test_temp_join_declares_columns_and_runs_in_autocommit():
+  cnx = FakeConnection(results=[
+    [('bigint(20)', None)],
+    [('varchar(255)', 'utf8mb4_bin')],
+    [], [],
+    [(1, 10)],
+    []
+  ])
+  rows = temp_join(cnx, 'urls', (('obligation_id', 'posts', 'id'), ('url', 'posts', 'submitted_url')),
+    [(1, 'a'), (2, 'b')], 'SELECT * FROM `urls`', index=('url',), row_mode='tuple')
+  assert rows == [(1, 10)]
+  statements = [query for query, _ in cnx.executed]
+  assert statements[3] == 'CREATE TEMPORARY TABLE `urls` (`obligation_id` bigint(20), ' \
+    '`url` varchar(255) COLLATE utf8mb4_bin, INDEX (`url`))'
+  assert not any('SELECT *' in query and 'CREATE' in query for query in statements)
+  assert cnx.executed[4] == ('INSERT INTO `urls` VALUES (%s, %s)', [(1, 'a'), (2, 'b')])
+  assert statements[-1] == 'DROP TEMPORARY TABLE IF EXISTS `urls`'
+  assert cnx.autocommit_changes == [True, False]
+
+def test_temp_join_refuses_an_unknown_column():
+  cnx = FakeConnection(results=[[]])
+  with pytest.raises(ValueError):
+    temp_join(cnx, 'urls', (('url', 'posts', 'missing'),), [], 'SELECT 1')
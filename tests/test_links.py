@@ -0,0 +1,83 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from common.db.links_connector import LinksConnector
+from common.utils.instrumentation import Instrumentation
+from jobs.cp_hyperlink_links import copy_bulk, copy_links, read_items
+
+class FakeFuture():
+  def __init__(self, session, values):
+    self.session = session
+    self.values = values
+
+  def add_callbacks(self, callback, errback, callback_args=(), errback_args=()):
+    def complete():
+      time.sleep(0.001)
+      with self.session.lock:
+        self.session.in_flight -= 1
+      if self.values[1].startswith('bad-write'):
+        errback(Exception('write timeout'), *errback_args)
+      else:
+        self.session.saved.append(self.values[1])
+        callback(None, *callback_args)
+    threading.Thread(target=complete).start()
+
+class FakeSession():
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.in_flight = 0
+    self.max_in_flight = 0
+    self.saved = []
+
+  def execute_async(self, statement, values):
+    with self.lock:
+      self.in_flight += 1
+      self.max_in_flight = max(self.max_in_flight, self.in_flight)
+    return FakeFuture(self, values)
+
+def make_link(url):
+  product = SimpleNamespace(id=1, product_id_v2=2, name='n', price=1.0, sku='s', product_type='t')
+  return SimpleNamespace(id=url, url=url, product=product, publisher=SimpleNamespace(id=3), redirect_url='r', version=1)
+
+def make_connector():
+  links_cnx = LinksConnector(instrumentation=Instrumentation(log=False))
+  links_cnx._session = FakeSession()
+  links_cnx._insert_link = 'INSERT'
+  return links_cnx
+
+class FakeHyperlink():
+  def get_link(self, url):
+    if url.startswith('bad-fetch'):
+      raise Exception('not found')
+    return make_link(url)
+
+def test_add_links_bounds_inserts_in_flight_and_records_each():
+  links_cnx = make_connector()
+  saved, failures = links_cnx.add_links((make_link('u{}'.format(i)) for i in range(50)), concurrency=4)
+  assert saved == 50
+  assert failures == []
+  assert links_cnx._session.max_in_flight <= 4
+  stats = list(links_cnx.instrumentation.stats.values())
+  assert [s.count for s in stats] == [50]
+
+def test_add_links_reports_failed_inserts():
+  links_cnx = make_connector()
+  saved, failures = links_cnx.add_links([make_link('ok'), make_link('bad-write')], concurrency=2)
+  assert saved == 1
+  assert [url for url, _ in failures] == ['bad-write']
+  assert sum(s.errors for s in links_cnx.instrumentation.stats.values()) == 1
+
+def test_copy_links_reports_fetch_and_write_failures():
+  links_cnx = make_connector()
+  copied, failures = copy_links(['a', 'bad-fetch', 'b', 'bad-write'], FakeHyperlink(), links_cnx, workers=2,
+    concurrency=2)
+  assert copied == 2
+  assert sorted(url for url, _ in failures) == ['bad-fetch', 'bad-write']
+  assert sorted(links_cnx._session.saved) == ['a', 'b']
+
+def test_copy_bulk_skips_repeated_links():
+  links_cnx = make_connector()
+  items = read_items(['a\n', '\n', '# comment\n', 'b\n', 'a\n'])
+  counts, failures = copy_bulk(items, 'links', FakeHyperlink(), links_cnx, workers=2)
+  assert (counts['copied'], counts['skipped'], counts['failed']) == (2, 1, 0)
@@ -0,0 +1,107 @@
+from collections import namedtuple
+from datetime import datetime
+from operator import attrgetter
+
+import main
+from common.utils.plan import PlanWriter
+from common.utils.watermark import Watermark
+
+Post = namedtuple('Post', ('id', 'submitted_url', 'modified_at'))
+
+def test_latest_rows_keeps_the_most_recently_modified_post_per_url():
+  posts = [
+    Post(3, 'a', datetime(2021, 1, 2)),
+    Post(1, 'a', datetime(2021, 1, 3)),
+    Post(2, 'a', None),
+    Post(5, 'b', datetime(2021, 1, 1)),
+    Post(4, 'b', datetime(2021, 1, 1))
+  ]
+  for order in (posts, posts[::-1]):
+    latest = main.latest_rows(order, attrgetter('submitted_url'), main.post_order)
+    assert {url: post.id for url, post in latest.items()} == {'a': 1, 'b': 5}
+
+def test_resume_plan_drops_rows_planned_after_the_checkpoint(tmp_path):
+  plan = PlanWriter(str(tmp_path / 'job.plan.gz'))
+  plan.update('posts', 'posts', 'id', ('status',), [(1, 'LIVE')])
+  state = {'details': main.checkpoint_details(plan)}
+  plan.update('posts', 'posts', 'id', ('status',), [(2, 'LIVE')])
+  main.resume_plan(plan, state)
+  assert plan.offset == state['details']['plan']
+  main.resume_plan(plan, None)
+  assert plan.offset == 0
+  plan.close()
+
+def test_url_job_is_partitioned_by_url_bucket():
+  assert main.JOBS.bounds['fix_posts_without_obligations_by_url'] == (0, main.URL_BUCKETS - 1)
+  assert 'fix_reporting_dates_null' not in main.JOBS.bounds
+  where, data = main.in_key_range('`post_id` IS NULL', key_range=(0, 256), expression=main.URL_BUCKET)
+  assert where == '(`post_id` IS NULL) AND {0} >= %s AND {0} < %s'.format(main.URL_BUCKET)
+  assert data == (0, 256)
+  assert main.in_key_range('1', key_range=(5, 9)) == ('(1) AND `id` >= %s AND `id` < %s', (5, 9))
+
+class Connector():
+  def __init__(self, rows=(), results=()):
+    self.rows = list(rows)
+    self.results = list(results)
+    self.streamed = []
+
+  def execute(self, query, data=None, row_mode='dict'):
+    if query.startswith('SELECT NOW()'):
+      return [('2021-02-01 00:00:00',)]
+    return self.results
+
+  def stream(self, query, data=None, key=None, after=None):
+    self.streamed.append((query, data, key, after))
+    return iter(self.rows)
+
+def test_incremental_scan_looks_back_before_the_watermark(tmp_path):
+  watermark = Watermark('job', 'date_submitted', directory=str(tmp_path))
+  cnx = Connector()
+  main.scan(cnx, ('id',), 'obligations', '`post_id` IS NULL', (), None, watermark)
+  query, data, key, after = cnx.streamed[-1]
+  assert 'INTERVAL' not in query
+  assert (data, key, after) == (('2021-02-01 00:00:00',), ('date_submitted', 'id'), None)
+
+  watermark.save(('2021-01-20 00:00:00', 42))
+  main.scan(cnx, ('id',), 'obligations', '`post_id` IS NULL', (), None, watermark)
+  query, data, key, after = cnx.streamed[-1]
+  assert '`date_submitted` >= %s - INTERVAL %s SECOND' in query
+  assert data == ('2021-02-01 00:00:00', '2021-01-20 00:00:00', main.WATERMARK_LOOKBACK)
+  assert after is None
+
+  main.scan(cnx, ('id',), 'obligations', '`post_id` IS NULL', (), {'last_key': ['2021-01-25 00:00:00', 50]}, watermark)
+  assert cnx.streamed[-1][3] == ('2021-01-25 00:00:00', 50)
+
+PostRow = namedtuple('PostRow', ('id', 'modified_at'))
+Obligation = namedtuple('Obligation', ('end_date', 'post_id'))
+
+def test_dry_incremental_run_leaves_the_watermark(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+  watermark = Watermark('fix_reporting_dates_0001', 'modified_at')
+  watermark.save(('2021-01-20 00:00:00', 1))
+  posts = [PostRow(5, datetime(2021, 1, 25)), PostRow(6, datetime(2021, 1, 26))]
+  obligations = [Obligation(datetime(2021, 1, 1), 5)]
+
+  main.fix_reporting_dates_0001(Connector(results=obligations), Connector(rows=posts), incremental=True)
+  assert watermark.load() == ('2021-01-20 00:00:00', 1)
+
+  with PlanWriter(str(tmp_path / 'job.plan.gz')) as plan:
+    assert main.fix_reporting_dates_0001(Connector(results=obligations), Connector(rows=posts), plan=plan,
+      incremental=True) == 1
+  assert watermark.load() == ('2021-01-26 00:00:00', 6)
+
+ObligationUrl = namedtuple('ObligationUrl', ('id', 'obligation_submission_url'))
+MatchedPost = namedtuple('MatchedPost', ('obligation_id', 'id', 'submitted_url', 'modified_at'))
+
+def test_url_match_modes_link_the_same_posts_whatever_the_case(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+  obligations = [ObligationUrl(1, 'http://Example.com/a'), ObligationUrl(2, 'http://example.com/a')]
+  posts = [Post(10, 'http://example.com/A', datetime(2021, 1, 1)), Post(11, 'HTTP://example.com/a', datetime(2021, 1, 2))]
+  # the posts database matches urls under a case-insensitive collation, with the first obligation of each url
+  monkeypatch.setattr(main, 'match_urls_in_posts_db', lambda cnx, chunk: [MatchedPost(1, *post) for post in posts])
+  updates = []
+  monkeypatch.setattr(main, 'write_updates', lambda cnx, database, table, key, columns, rows, plan=None:
+    updates.append(rows) or len(rows))
+  for match in main.URL_MATCH_MODES:
+    main.fix_posts_without_obligations_by_url(Connector(rows=obligations), Connector(results=posts), match=match)
+  assert updates == [[(1, 11)], [(1, 11)]]
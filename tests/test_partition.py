@@ -0,0 +1,24 @@
+import pytest
+
+from common.utils.partition import key_ranges, range_name
+
+def test_key_ranges_cover_every_key_once():
+  ranges = key_ranges(1, 10, 3)
+  assert ranges == [(1, 4), (4, 7), (7, 11)]
+  covered = [key for start, end in ranges for key in range(start, end)]
+  assert covered == list(range(1, 11))
+
+def test_key_ranges_never_exceed_the_number_of_keys():
+  assert key_ranges(5, 6, 4) == [(5, 6), (6, 7)]
+  assert key_ranges(5, 5, 3) == [(5, 6)]
+
+def test_key_ranges_of_an_empty_table():
+  assert key_ranges(None, None, 3) == []
+
+def test_key_ranges_rejects_no_parts():
+  with pytest.raises(ValueError):
+    key_ranges(1, 10, 0)
+
+def test_range_name():
+  assert range_name('job', None) == 'job'
+  assert range_name('job', (1, 5)) == 'job.1-5'
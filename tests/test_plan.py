@@ -0,0 +1,73 @@
+import gzip
+
+from common.utils.plan import PlanWriter, apply_plan, complete_length, read_plan
+
+def test_round_trip_groups_rows_by_target(tmp_path):
+  path = str(tmp_path / 'job.plan.gz')
+  with PlanWriter(path) as plan:
+    assert plan.update('posts', 'posts', 'id', ('reporting_end_time',), [(1, '2021-01-01'), (2, '2021-01-02')]) == 2
+    plan.update('collaborations', 'obligations', 'id', ('post_id',), [(7, 1)])
+    plan.update('posts', 'posts', 'id', ('reporting_end_time',), [(3, '2021-01-03')])
+  batches = list(read_plan(path, size=10))
+  assert [(t['table'], rows) for t, rows in batches] == [
+    ('posts', [(1, '2021-01-01'), (2, '2021-01-02')]),
+    ('obligations', [(7, 1)]),
+    ('posts', [(3, '2021-01-03')])
+  ]
+  assert batches[0][0] == {'database': 'posts', 'table': 'posts', 'key': 'id', 'columns': ['reporting_end_time']}
+
+def test_read_plan_bounds_batches(tmp_path):
+  path = str(tmp_path / 'job.plan.gz')
+  with PlanWriter(path) as plan:
+    plan.update('posts', 'posts', 'id', ('status',), [(i, 'LIVE') for i in range(5)])
+  assert [len(rows) for _, rows in read_plan(path, size=2)] == [2, 2, 1]
+
+def test_apply_plan_bulk_updates_each_batch(tmp_path):
+  path = str(tmp_path / 'job.plan.gz')
+  with PlanWriter(path) as plan:
+    plan.update('posts', 'posts', 'id', ('status',), [(i, 'LIVE') for i in range(3)])
+
+  class Connector():
+    def __init__(self):
+      self.calls = []
+    def bulk_update(self, table, key, columns, rows, size):
+      self.calls.append((table, key, list(columns), rows))
+      return len(rows)
+
+  posts = Connector()
+  assert apply_plan(path, {'posts': posts}, size=2) == 3
+  assert posts.calls[0] == ('posts', 'id', ['status'], [(0, 'LIVE'), (1, 'LIVE')])
+
+def test_resume_after_a_crash_plans_every_row_once(tmp_path):
+  path = str(tmp_path / 'job.plan.gz')
+  plan = PlanWriter(path)
+  plan.update('posts', 'posts', 'id', ('status',), [(1, 'LIVE'), (2, 'LIVE')])
+  checkpointed = plan.offset
+  # the next chunk is planned but the job dies before its checkpoint is saved...
+  plan.update('posts', 'posts', 'id', ('status',), [(3, 'LIVE')])
+  # ...in the middle of writing the chunk after that
+  member = gzip.compress(b'[4,"LIVE"]\n')
+  plan._file.write(member[:len(member) // 2])
+  plan._file.close()
+
+  plan = PlanWriter(path, append=True)
+  assert plan.offset > checkpointed
+  plan.truncate(checkpointed)
+  plan.update('posts', 'posts', 'id', ('status',), [(3, 'LIVE'), (4, 'LIVE')])
+  plan.close()
+  assert list(read_plan(path, size=10)) == [
+    ({'database': 'posts', 'table': 'posts', 'key': 'id', 'columns': ['status']},
+      [(1, 'LIVE'), (2, 'LIVE'), (3, 'LIVE'), (4, 'LIVE')])
+  ]
+
+def test_reopening_drops_a_partial_member(tmp_path):
+  path = str(tmp_path / 'job.plan.gz')
+  with PlanWriter(path) as plan:
+    plan.update('posts', 'posts', 'id', ('status',), [(1, 'LIVE')])
+    complete = plan.offset
+  with open(path, 'ab') as f:
+    f.write(gzip.compress(b'[2,"LIVE"]\n')[:-3])
+  assert complete_length(path, read_size=7) == complete
+  with PlanWriter(path, append=True) as plan:
+    assert plan.offset == complete
+  assert [rows for _, rows in read_plan(path)] == [[(1, 'LIVE')]]
@@ -0,0 +1,119 @@
+import threading
+
+import pytest
+
+from common.db.pool import ConnectionPool, ConnectionPoolError
+from tests.fakes import FakeConnection
+
+def make_pool(**kwargs):
+  opened = []
+  def connect():
+    cnx = FakeConnection()
+    opened.append(cnx)
+    return cnx
+  return ConnectionPool(connect, **kwargs), opened
+
+def test_connections_open_on_first_checkout():
+  pool, opened = make_pool(min_size=1, max_size=2)
+  assert opened == []
+  with pool.connection() as cnx:
+    assert opened == [cnx]
+
+def test_checkin_reuses_idle_connection():
+  pool, opened = make_pool(max_size=2)
+  with pool.connection() as first:
+    pass
+  with pool.connection() as second:
+    pass
+  assert first is second
+  assert len(opened) == 1
+
+def test_concurrent_checkouts_open_up_to_max_size():
+  pool, opened = make_pool(max_size=2, timeout=0.05)
+  first = pool.checkout()
+  second = pool.checkout()
+  assert first is not second
+  with pytest.raises(ConnectionPoolError):
+    pool.checkout()
+  pool.checkin(first)
+  assert pool.checkout() is first
+  assert len(opened) == 2
+
+def test_waiting_checkout_gets_returned_connection():
+  pool, _ = make_pool(max_size=1, timeout=5)
+  held = pool.checkout()
+  got = []
+  waiter = threading.Thread(target=lambda: got.append(pool.checkout()))
+  waiter.start()
+  pool.checkin(held)
+  waiter.join(5)
+  assert got == [held]
+
+def test_dead_connection_is_replaced():
+  pool, opened = make_pool(max_size=1)
+  with pool.connection() as cnx:
+    pass
+  cnx.alive = False
+  with pool.connection() as replacement:
+    assert replacement is not cnx
+  assert cnx.closed
+  assert len(opened) == 2
+
+def test_error_in_block_rolls_back():
+  pool, _ = make_pool()
+  with pytest.raises(RuntimeError):
+    with pool.connection() as cnx:
+      raise RuntimeError('boom')
+  assert cnx.rollbacks >= 1
+
+def test_idle_connections_above_min_size_are_evicted():
+  pool, _ = make_pool(min_size=1, max_size=3, idle_timeout=0)
+  first = pool.checkout()
+  second = pool.checkout()
+  pool.checkin(first)
+  pool.checkin(second)
+  with pool.connection():
+    pass
+  assert first.closed
+  assert not second.closed
+
+def test_close_closes_idle_and_returned_connections():
+  pool, _ = make_pool(max_size=2)
+  idle = pool.checkout()
+  busy = pool.checkout()
+  pool.checkin(idle)
+  pool.close()
+  assert idle.closed
+  assert not busy.closed
+  pool.checkin(busy)
+  assert busy.closed
+  with pytest.raises(ConnectionPoolError):
+    pool.checkout()
+
+def test_failed_connect_frees_the_slot():
+  attempts = []
+  def connect():
+    attempts.append(1)
+    if len(attempts) == 1:
+      raise IOError('refused')
+    return FakeConnection()
+  pool = ConnectionPool(connect, max_size=1, timeout=0.05)
+  with pytest.raises(IOError):
+    pool.checkout()
+  assert isinstance(pool.checkout(), FakeConnection)
+
+def test_checkin_ends_an_open_read_transaction():
+  pool, _ = make_pool()
+  with pool.connection() as cnx:
+    cnx.server_status = 0x3
+  assert cnx.rollbacks == 1
+  with pool.connection() as cnx:
+    # autocommit, no transaction open
+    cnx.server_status = 0x2
+  assert cnx.rollbacks == 1
+
+def test_checkin_rolls_back_connections_without_a_status():
+  pool, _ = make_pool()
+  with pool.connection() as cnx:
+    pass
+  assert cnx.rollbacks == 1
@@ -0,0 +1,77 @@
+import pytest
+
+from common.db import query as q
+from common.db.pool import ConnectionPool
+from tests.fakes import FakeConnection
+
+TABLE = [{'id': i, 'modified_at': '2021-01-0{}'.format(1 + i // 4)} for i in range(1, 11)]
+
+def test_chunk_keys_bounds_count_and_bytes():
+  assert list(q.chunk_keys(range(7), size=3)) == [[0, 1, 2], [3, 4, 5], [6]]
+  urls = ['x' * 96] * 5
+  # each url counts 100 bytes with its quotes and separator
+  assert [len(c) for c in q.chunk_keys(urls, size=100, max_bytes=250)] == [2, 2, 1]
+
+def test_select_in_runs_one_statement_per_chunk():
+  calls = []
+  def execute(query, data):
+    calls.append((query, data))
+    return [{'id': key} for key in data[1:]]
+  rows = list(q.select_in(execute, 'SELECT id FROM posts WHERE status = %s AND id IN ({})', range(5),
+    data=('LIVE',), size=2))
+  assert [row['id'] for row in rows] == [0, 1, 2, 3, 4]
+  assert calls[0] == ('SELECT id FROM posts WHERE status = %s AND id IN (%s, %s)', ('LIVE', 0, 1))
+  assert calls[2] == ('SELECT id FROM posts WHERE status = %s AND id IN (%s)', ('LIVE', 4))
+
+def test_select_in_with_workers_returns_every_row():
+  execute = lambda query, data: [{'id': key} for key in data]
+  rows = q.select_in(execute, 'SELECT id FROM posts WHERE id IN ({})', range(50), size=3, workers=4)
+  assert sorted(row['id'] for row in rows) == list(range(50))
+
+def test_paginate_seeks_past_the_last_key():
+  cnx = FakeConnection(TABLE)
+  pages = list(q.paginate(cnx, 'SELECT id FROM posts', key='id', size=4))
+  assert [[row['id'] for row in page] for page in pages] == [[1, 2, 3, 4], [5, 6, 7, 8], [9, 10]]
+  assert cnx.executed[0] == ('SELECT * FROM (SELECT id FROM posts) AS page ORDER BY page.`id` LIMIT %s', (4,))
+  assert cnx.executed[1] == (
+    'SELECT * FROM (SELECT id FROM posts) AS page WHERE page.`id` > %s ORDER BY page.`id` LIMIT %s', (4, 4))
+
+def test_paginate_resumes_after_a_key():
+  cnx = FakeConnection(TABLE)
+  rows = [row['id'] for page in q.paginate(cnx, 'SELECT id FROM posts WHERE id > %s', (0,), size=4, after=7)
+    for row in page]
+  assert rows == [8, 9, 10]
+  assert cnx.executed[0][1] == (0, 7, 4)
+
+def test_paginate_composite_key_uses_a_row_comparison():
+  cnx = FakeConnection(TABLE, key=('modified_at', 'id'))
+  rows = [row['id'] for page in q.paginate(cnx, 'SELECT id, modified_at FROM posts', key=('modified_at', 'id'),
+    size=3, after=('2021-01-02', 5)) for row in page]
+  assert rows == [6, 7, 8, 9, 10]
+  sql, args = cnx.executed[0]
+  assert 'WHERE (page.`modified_at`, page.`id`) > (%s, %s) ORDER BY page.`modified_at`, page.`id`' in sql
+  assert args == ('2021-01-02', 5, 3)
+
+def test_stream_requires_a_key_to_resume():
+  with pytest.raises(ValueError):
+    list(q.stream(FakeConnection(TABLE), 'SELECT id FROM posts', after=3))
+
+def test_select_sql_quotes_projected_columns():
+  assert q.select_sql(('id', 'campaigns.end_date'), 'obligations', 'id > 1') == \
+    'SELECT `id`, `campaigns`.`end_date` FROM obligations WHERE id > 1'
+
+def test_paginate_checks_a_connection_out_per_page():
+  opened = []
+  def connect():
+    opened.append(FakeConnection(TABLE))
+    return opened[-1]
+  pool = ConnectionPool(connect, max_size=1)
+  rows = q.stream(pool.connection, 'SELECT id FROM posts', size=4, key='id')
+  assert next(rows)['id'] == 1
+  # the first page is fetched and its connection returned, with its read transaction ended
+  assert len(opened) == 1 and opened[0].rollbacks == 1
+  with pool.connection():
+    pass
+  assert [row['id'] for row in rows] == list(range(2, 11))
+  # three pages and the checkout above
+  assert opened[0].rollbacks == 4
@@ -0,0 +1,48 @@
+from common.api import response_cache as rc
+
+def accessed_at(cache, key):
+  return cache._db.execute("SELECT accessed_at FROM responses WHERE key = ?", (key,)).fetchone()[0]
+
+def test_hits_buffer_access_times_until_flushed(tmp_path, monkeypatch):
+  cache = rc.ResponseCache(str(tmp_path / 'cache.db'))
+  cache.put('a', 'body')
+  before = accessed_at(cache, 'a')
+  changes = cache._db.total_changes
+  monkeypatch.setattr(rc.time, 'time', lambda: before + 10)
+  assert cache.get('a') == (True, 'body')
+  assert cache._db.total_changes == changes
+  assert accessed_at(cache, 'a') == before
+  cache.flush()
+  assert accessed_at(cache, 'a') == before + 10
+  cache.close()
+
+def test_access_times_are_written_back_after_enough_hits(tmp_path, monkeypatch):
+  monkeypatch.setattr(rc, 'FLUSH_ACCESSES', 2)
+  cache = rc.ResponseCache(str(tmp_path / 'cache.db'))
+  cache.put('a', 'body')
+  cache.put('b', None)
+  cache.get('a')
+  assert cache._accessed
+  assert cache.get('b') == (True, None)
+  assert not cache._accessed
+  cache.close()
+
+def test_eviction_keeps_the_count_and_the_recently_hit(tmp_path, monkeypatch):
+  clock = iter(range(1000, 2000))
+  monkeypatch.setattr(rc.time, 'time', lambda: float(next(clock)))
+  path = str(tmp_path / 'cache.db')
+  cache = rc.ResponseCache(path, max_entries=10)
+  for i in range(10):
+    cache.put(str(i), 'body')
+  cache.get('0')
+  cache.put('10', 'body')
+  cache.put('10', 'again')
+  # one put over the limit frees EVICT_SLACK of it
+  assert cache._count == 9
+  keys = {row[0] for row in cache._db.execute("SELECT key FROM responses")}
+  assert keys == {'0', '3', '4', '5', '6', '7', '8', '9', '10'}
+  cache.close()
+  reopened = rc.ResponseCache(path, max_entries=10)
+  assert reopened._count == 9
+  assert reopened._db.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+  reopened.close()
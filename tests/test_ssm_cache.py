@@ -0,0 +1,23 @@
+from common.utils.ssm_cache import CachedParameterStore
+
+class FakeSSM():
+  def __init__(self, params):
+    self.params = params
+    self.paths = []
+
+  def fetch_path(self, path, recursive=True):
+    self.paths.append(path)
+    return {name: value for name, value in self.params.items() if name.startswith(path + '/')}
+
+def test_fetch_path_is_memoized():
+  ssm = FakeSSM({'/rds/collabs/host': 'db', '/rds/collabs/port': '3306', '/rds/posts/host': 'posts'})
+  store = CachedParameterStore('dev')
+  store._store = ssm
+  params = {'/rds/collabs/host': 'db', '/rds/collabs/port': '3306'}
+  assert store.fetch_path('/rds/collabs') == params
+  assert store.fetch_path('/rds/collabs') == params
+  assert ssm.paths == ['/rds/collabs']
+  assert store.requests == 1
+  # the parameters found are served to single fetches too
+  assert store.fetch('/rds/collabs/port') == '3306'
+  assert store.requests == 1
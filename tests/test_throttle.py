@@ -0,0 +1,117 @@
+from contextlib import contextmanager
+
+import pytest
+
+import main
+from common.db import throttle as t
+from tests.fakes import FakeConnection
+
+def test_chunks_follow_the_current_size():
+  batcher = t.AdaptiveBatcher(size=2, min_size=1, max_size=10)
+  chunks = batcher.chunks((i,) for i in range(7))
+  assert next(chunks) == [(0,), (1,)]
+  batcher.size = 4
+  assert [len(c) for c in chunks] == [4, 1]
+
+def test_slow_chunks_shrink_the_size():
+  batcher = t.AdaptiveBatcher(size=100, min_size=30, max_size=1000, target_latency=0.5)
+  batcher.observe(1.0, 100)
+  assert batcher.size == 50
+  batcher.observe(1.0, 50)
+  assert batcher.size == 30
+
+def test_fast_full_chunks_grow_the_size():
+  batcher = t.AdaptiveBatcher(size=100, min_size=10, max_size=130, target_latency=0.5)
+  batcher.observe(0.1, 100)
+  assert batcher.size == 125
+  batcher.observe(0.1, 125)
+  assert batcher.size == 130
+  # a short last chunk says nothing about larger ones
+  batcher.observe(0.1, 3)
+  assert batcher.size == 130
+
+def test_latency_in_the_target_band_keeps_the_size():
+  batcher = t.AdaptiveBatcher(size=100, target_latency=0.5)
+  batcher.observe(0.4, 100)
+  assert batcher.size == 100
+  assert batcher.summary() == {'chunks': 1, 'rows': 100, 'size': 100, 'paused': 0.0}
+
+def test_replica_lag_pauses_and_shrinks(monkeypatch):
+  sleeps = []
+  monkeypatch.setattr(t.time, 'sleep', sleeps.append)
+  lags = iter([5.0, 2.0, 0.5])
+  batcher = t.AdaptiveBatcher(size=400, min_size=50, lag_probe=lambda: next(lags), max_lag=1.0,
+    probe_interval=0, max_pause=3.0)
+  batcher.observe(0.3, 400)
+  assert sleeps == [3.0, 1.0]
+  assert batcher.size == 100
+  assert batcher.paused == 4.0
+
+def test_unknown_lag_does_not_pause(monkeypatch):
+  monkeypatch.setattr(t.time, 'sleep', lambda seconds: pytest.fail('paused'))
+  batcher = t.AdaptiveBatcher(lag_probe=lambda: None, probe_interval=0)
+  batcher.observe(0.1, 10)
+
+def test_lag_is_probed_at_most_every_interval():
+  probes = []
+  batcher = t.AdaptiveBatcher(lag_probe=lambda: probes.append(1), probe_interval=60)
+  batcher.observe(0.1, 10)
+  batcher.observe(0.1, 10)
+  assert len(probes) == 1
+
+def test_invalid_sizes():
+  with pytest.raises(ValueError):
+    t.AdaptiveBatcher(size=10, min_size=20)
+
+class Connector():
+  def __init__(self, cnx):
+    self.cnx = cnx
+
+  @contextmanager
+  def connection(self):
+    yield self.cnx
+
+def test_heartbeat_probe_ends_each_read_transaction():
+  cnx = FakeConnection(results=[[(2.5,)], [(None,)]])
+  probe = t.HeartbeatProbe(Connector(cnx), table='percona.heartbeat')
+  assert probe() == 2.5
+  assert cnx.rollbacks == 1
+  assert probe() is None
+  assert cnx.rollbacks == 2
+  assert cnx.executed[0][0].endswith('FROM `percona`.`heartbeat`')
+
+def test_write_throttle_uses_the_configured_heartbeat_table(monkeypatch):
+  monkeypatch.setitem(main.DATABASES, 'posts', ('POST_SERVICE_MYSQL', lambda cfg, max_size: cfg))
+  replicas = []
+  throttle = main.write_throttle({'POST_SERVICE_MYSQL_REPLICA_HOST': 'replica',
+    'POST_SERVICE_MYSQL_REPLICA_HEARTBEAT_TABLE': 'heartbeat'}, 'posts', replicas=replicas)
+  assert isinstance(throttle.lag_probe, t.HeartbeatProbe)
+  assert replicas[0]['POST_SERVICE_MYSQL_HOST'] == 'replica'
+  throttle = main.write_throttle({'POST_SERVICE_MYSQL_REPLICA_HOST': 'replica'}, 'posts')
+  assert isinstance(throttle.lag_probe, t.ReplicaStatusProbe)
+  assert main.write_throttle({}, 'posts').lag_probe is None
+
+def test_lag_that_never_recovers_gives_up(monkeypatch):
+  sleeps = []
+  monkeypatch.setattr(t.time, 'sleep', sleeps.append)
+  batcher = t.AdaptiveBatcher(lag_probe=lambda: 100.0, max_lag=1.0, probe_interval=0, max_pause=30.0,
+    max_wait=70.0)
+  with pytest.raises(t.ReplicaLagError):
+    batcher.observe(0.1, 10)
+  assert sleeps == [30.0, 30.0, 10.0]
+
+def test_heartbeat_probe_compares_in_the_configured_zone():
+  cnx = FakeConnection(results=[[(1.0,)]])
+  probe = t.HeartbeatProbe(Connector(cnx), timezone='local')
+  assert probe() == 1.0
+  assert 'NOW(6)' in cnx.executed[0][0]
+  with pytest.raises(ValueError):
+    t.HeartbeatProbe(Connector(cnx), timezone='Europe/Paris')
+
+def test_heartbeat_in_the_future_means_the_wrong_zone():
+  cnx = FakeConnection(results=[[(-3600.0,)], [(-2.0,)]])
+  probe = t.HeartbeatProbe(Connector(cnx))
+  with pytest.raises(ValueError, match='local'):
+    probe()
+  # small clock skew reads as no lag
+  assert probe() == 0.0